@@ -169,6 +169,10 @@ def create_app():
     
     # Initialize Flask-Mail
     mail.init_app(app)
+
+    # Background mail outbox uses the same SMTP settings
+    from app.utils.mail_queue import mail_sender
+    mail_sender.init_app(app)
     
     # Initialize Flask-Babel
     init_babel(app)
@@ -1,7 +1,7 @@
 # app/agents/controller.py
 from __future__ import annotations
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 
 from flask import current_app, Blueprint, request
 import json
@@ -9,7 +9,13 @@ from app.models.language import detect_language, get_text_by_key
 from app.models.tech_spec import TechSpecTemplate
 from app.services.logger import logger
 from app.services.responses_service import respond as responses_respond
-from app.agents.project_manager_handler import handle_pm_request
+from app.services.responses_service import stream as responses_stream
+from app.services.responses_service import cache_key as responses_cache_key
+from app.services import response_cache
+from app.services import conversation_store
+from app.agents.project_manager_handler import authenticated_user, prepare_pm_request
+from app.agents import greetings
+from app.agents.intent_router import Intent, agent_from_page, classify
 
 # Agents configuration
 agent_bp = Blueprint('agent', __name__, url_prefix='/api/agent')
@@ -203,24 +209,9 @@ META_SUPPRESS = "suppress_greeting"   # bool
 
 VALID_AGENTS = ("greeter", "spec", "pm")
 
-# Page-path → agent mapping (used when frontend doesn't set selected_agent)
-_PAGE_AGENT_MAP = (
-    ('/dashboard', 'pm'),
-    ('/client',    'pm'),
-    # Add more path prefixes here when new sections appear
-)
-
 def _infer_agent_from_page(page: str) -> str | None:
-    """Return agent key if the page path matches a known prefix."""
-    if not page:
-        return None
-    p = page.lower()
-    for prefix, agent in _PAGE_AGENT_MAP:
-        if p.startswith(prefix):
-            return agent
-    if '/spec' in p:
-        return 'spec'
-    return None
+    """Return agent key if the page path matches a known prefix (see intent_router.PAGE_PREFIXES)."""
+    return agent_from_page(page)
 
 def _ensure_defaults(metadata: Dict[str, Any]) -> None:
     if META_LANG not in metadata or not metadata[META_LANG]:
@@ -234,7 +225,7 @@ def _ensure_defaults(metadata: Dict[str, Any]) -> None:
     if META_ACTIVE not in metadata or metadata[META_ACTIVE] not in VALID_AGENTS:
         metadata[META_ACTIVE] = metadata[META_SELECTED]
 
-def is_spec_confirmation(message: str, history: list) -> bool:
+def is_spec_confirmation(message: str, history: list, intent: Intent | None = None) -> bool:
     """
     Return True when the user is confirming the spec summary.
     Requires at least 8 history entries (= 4 exchanges) to avoid false positives
@@ -242,15 +233,42 @@ def is_spec_confirmation(message: str, history: list) -> bool:
     """
     if len(history) < 8:
         return False
+    return (intent or classify(message)).confirmation
+
+
+def _load_history(metadata: Dict[str, Any]) -> list:
+    """
+    Conversation history for this turn, read once from the server-side store.
+    Falls back to the history sent by an older widget while the store is empty.
+    """
+    history = conversation_store.load_history(
+        metadata.get('conversation_id'),
+        last_seen_id=metadata.get('last_message_id'),
+    )
+    return history or metadata.get('history') or []
+
+
+def _remember_turn(message, answer, conversation_id, agent) -> Any:
+    """Persist the finished turn; returns the new last message id (or None)."""
+    return conversation_store.append_turn(conversation_id, message, answer, agent=agent)
+
+
+def _update_spec_draft(message_id, llm_kwargs: Dict[str, Any], metadata: Dict[str, Any]) -> None:
+    """After a stored spec turn, fold what it added into the draft submission (background)."""
+    if llm_kwargs.get('agent') != 'spec':
+        return
     try:
-        from app.services.spec_service import is_confirmation
-        return is_confirmation(message)
-    except Exception:
-        return False
+        from app.services.spec_service import schedule_draft_update
+        schedule_draft_update(
+            llm_kwargs['conversation_id'], message_id,
+            language=llm_kwargs.get('language') or 'en', user_id=metadata.get('user_id'),
+        )
+    except Exception as exc:
+        logger.warning(f"Spec draft update not scheduled: {exc}")
 
 
 def _history_to_llm_messages(history: list) -> list:
-    """Convert JS history [{text, type}, …] to [{role, content}, …] for the LLM."""
+    """Convert stored history to [{role, content}, …] for the LLM."""
     try:
         from app.services.spec_service import history_to_messages
         return history_to_messages(history)
@@ -280,37 +298,27 @@ def _spec_thanks(language: str, submission_id: int) -> str:
     return msgs.get(language, msgs["en"])
 
 
-def route_and_respond(message, metadata=None):
+def _plan_turn(message, metadata: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Повертає словник з результатами виклику асиста:
-    {
-        'agent': agent_key,
-        'answer': assistant_response,
-        'interactive': optional_ui_elements,
-        'conversation_id': conversation_id # Unique ID for the conversation
-    }
+    Resolve language, agent and LLM inputs for one chat turn.
+
+    Returns either {'result': <final response dict>} when the turn is answered
+    without the LLM (PM auth guard, spec saved), or {'llm': <respond kwargs>}.
+    Shared by route_and_respond() and route_and_stream().
     """
-    if metadata is None:
-        metadata = {}
+    # One pass over the message: language, tech-spec trigger, confirmation
+    intent = classify(message, page=metadata.get('page'))
 
     # Determine language early
-    language = metadata.get('language') or detect_language(message or '') or 'uk'
+    language = metadata.get('language') or intent.language or 'uk'
     metadata['language'] = language
 
     # Fast-path to tech-spec intent: switch to requirements/spec agent
-    try:
-        text = (message or '').lower()
-        tech_spec_triggers = (
-            'тз', 'тех завдан', 'техзавдан', 'техніч', 'технічне завдан', 'техзадани', 'техзад',
-            'техническ', 'техзадан', 'тех задани', 'тех задание', 'техзадание',
-            'спец', 'спеціаліст', 'специалист', 'експерт',
-            'tech spec', 'technical spec', 'specification', 'requirements'
-        )
-        if any(k in text for k in tech_spec_triggers):
-            metadata['selected_agent'] = 'requirements'
-            metadata['active_specialist'] = 'requirements'
-    except Exception:
-        pass
+    if intent.spec_trigger:
+        metadata['selected_agent'] = 'requirements'
+        metadata['active_specialist'] = 'requirements'
+    elif not (metadata.get('selected_agent') or metadata.get('active_specialist')) and intent.page_agent:
+        metadata['selected_agent'] = 'requirements' if intent.page_agent == 'spec' else intent.page_agent
 
     # Normalize selected agent to our trio for Responses service
     selected = (metadata.get('selected_agent') or metadata.get('active_specialist') or 'greeter').lower()
@@ -318,18 +326,34 @@ def route_and_respond(message, metadata=None):
 
     conversation_id = metadata.get('conversation_id') or 'anon'
     context = metadata.get('context')
+
+    # Opening turn (widget opened / specialist switched): precomputed, no LLM
+    if not (message or '').strip():
+        kind = 'switch' if metadata.get(META_SUPPRESS) else 'greeting'
+        # The PM greeting offers project status: only for a logged-in client
+        # (same gate as prepare_pm_request), anyone else is greeted generally
+        opener = 'greeter' if agent == 'pm' and authenticated_user(metadata) is None else agent
+        opening = greetings.get_message(opener, language, kind)
+        if opening:
+            return {'result': {
+                'agent': _ui_agent(opener),
+                'answer': opening,
+                'interactive': None,
+                'conversation_id': conversation_id,
+            }}
     
     # Если выбран PM агент, используем наш специальный обработчик
     if agent == 'pm':
         try:
-            result = handle_pm_request(message or '', metadata)
-            result['conversation_id'] = conversation_id
-            return {
-                'agent': 'pm',
-                'answer': result.get('answer'),
-                'interactive': None,
-                'conversation_id': conversation_id,
-            }
+            prepared = prepare_pm_request(message or '', metadata)
+            if 'answer' in prepared:
+                return {'result': {
+                    'agent': 'pm',
+                    'answer': prepared['answer'],
+                    'interactive': None,
+                    'conversation_id': conversation_id,
+                }}
+            return {'llm': prepared['llm']}
         except Exception as e:
             logger.error(f"Error in PM agent handler: {e}")
             # В случае ошибки возвращаемся к стандартному обработчику
@@ -337,26 +361,26 @@ def route_and_respond(message, metadata=None):
     
     # ── SPEC agent handling ───────────────────────────────────────────────────
     if agent == 'spec':
-        history: list = metadata.get('history') or []
+        history: list = _load_history(metadata)
 
         # ① Confirmation path: user confirmed the summary → save to DB + Telegram
-        if is_spec_confirmation(message or '', history):
+        if is_spec_confirmation(message or '', history, intent):
             try:
-                from app.services.spec_service import save_and_notify
+                from app.services.spec_service import finalize_submission
                 user_id = metadata.get('user_id')
-                submission = save_and_notify(history, user_id=user_id, language=language)
+                submission = finalize_submission(conversation_id, history, user_id=user_id, language=language)
                 if submission:
                     thanks = _spec_thanks(language, submission.id)
-                    return {
+                    return {'result': {
                         'agent': 'requirements',
                         'answer': thanks,
                         'interactive': None,
                         'conversation_id': conversation_id,
                         'spec_saved': True,
                         'submission_id': submission.id,
-                    }
+                    }}
             except Exception as exc:
-                logger.error(f"Spec save_and_notify failed: {exc}")
+                logger.error(f"Spec finalize_submission failed: {exc}")
             # Fall through to normal LLM response if save failed
 
         # ② Normal spec path: pass conversation history as LLM context
@@ -372,34 +396,125 @@ def route_and_respond(message, metadata=None):
         except Exception:
             pass
 
-        result = responses_respond(
+        return {'llm': dict(
             user_text=message or '',
             agent=agent,
             conversation_id=conversation_id,
             language=language,
             context=context,
-            structured=False,
             prior_messages=conv_messages,
-        )
-    else:
-        result = responses_respond(
-            user_text=message or '',
-            agent=agent,
-            conversation_id=conversation_id,
-            language=language,
-            context=context,
-            structured=False,
-        )
+        )}
+
+    return {'llm': dict(
+        user_text=message or '',
+        agent=agent,
+        conversation_id=conversation_id,
+        language=language,
+        context=context,
+    )}
+
 
-    ui_agent = 'requirements' if result.get('agent') == 'spec' else result.get('agent')
+def _ui_agent(agent: str) -> str:
+    return 'requirements' if agent == 'spec' else agent
+
+
+def route_and_respond(message, metadata=None):
+    """
+    Повертає словник з результатами виклику асиста:
+    {
+        'agent': agent_key,
+        'answer': assistant_response,
+        'interactive': optional_ui_elements,
+        'conversation_id': conversation_id # Unique ID for the conversation
+    }
+    """
+    if metadata is None:
+        metadata = {}
+
+    plan = _plan_turn(message, metadata)
+    if 'result' in plan:
+        result = plan['result']
+        result['message_id'] = _remember_turn(
+            message, result.get('answer'), result.get('conversation_id'), result.get('agent'))
+        return result
+
+    llm_kwargs = plan['llm']
+    result = responses_respond(structured=False, **llm_kwargs)
+
+    ui_agent = _ui_agent(result.get('agent'))
     # Keep UI state coherent
     metadata['active_specialist'] = ui_agent
+    conversation_id = result.get('conversation_id', llm_kwargs['conversation_id'])
+    message_id = _remember_turn(message, result.get('answer'), conversation_id, ui_agent)
+    _update_spec_draft(message_id, llm_kwargs, metadata)
 
     return {
         'agent': ui_agent,
         'answer': result.get('answer'),
         'interactive': None,
-        'conversation_id': result.get('conversation_id', conversation_id),
+        'conversation_id': conversation_id,
+        'cache': result.get('cache', 'bypass'),
+        'message_id': message_id,
+    }
+
+
+def route_and_stream(message, metadata=None) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of route_and_respond() for the SSE endpoint.
+
+    Yields {'event': 'delta', 'text': <chunk>} while the answer is generated and
+    finishes with one {'event': 'done', 'agent', 'conversation_id', 'spec_saved', ...}.
+    Turns answered without the LLM are emitted as a single delta.
+    """
+    if metadata is None:
+        metadata = {}
+
+    plan = _plan_turn(message, metadata)
+    if 'result' in plan:
+        result = plan['result']
+        if result.get('answer'):
+            yield {'event': 'delta', 'text': result['answer']}
+        done = {
+            'event': 'done',
+            'agent': result.get('agent'),
+            'conversation_id': result.get('conversation_id'),
+            'spec_saved': bool(result.get('spec_saved')),
+            'cache': 'bypass',
+            'message_id': _remember_turn(
+                message, result.get('answer'), result.get('conversation_id'), result.get('agent')),
+        }
+        if result.get('spec_saved'):
+            done['submission_id'] = result.get('submission_id')
+        yield done
+        return
+
+    llm_kwargs = plan['llm']
+    key = responses_cache_key(**llm_kwargs)
+    answer = response_cache.get(key)
+    if answer is not None:
+        cache_status = 'hit'
+        yield {'event': 'delta', 'text': answer}
+    else:
+        cache_status = 'miss' if key else 'bypass'
+        parts = []
+        for delta in responses_stream(**llm_kwargs):
+            parts.append(delta)
+            yield {'event': 'delta', 'text': delta}
+        answer = ''.join(parts)
+        response_cache.put(key, answer)
+
+    ui_agent = _ui_agent(llm_kwargs['agent'])
+    metadata['active_specialist'] = ui_agent
+    message_id = _remember_turn(message, answer, llm_kwargs['conversation_id'], ui_agent)
+    _update_spec_draft(message_id, llm_kwargs, metadata)
+
+    yield {
+        'event': 'done',
+        'agent': ui_agent,
+        'conversation_id': llm_kwargs['conversation_id'],
+        'spec_saved': False,
+        'cache': cache_status,
+        'message_id': message_id,
     }
 
 def handle_specialist_selection(specialist_key, metadata):
@@ -410,27 +525,20 @@ def handle_specialist_selection(specialist_key, metadata):
     # Add a system message to the history indicating a specialist change
     language = metadata.get('language', 'en')
     
-    # Get specialist name in the user's language
-    specialist_title = SPECIALISTS.get(specialist_key, {}).get('title', {}).get(language, specialist_key)
-    
-    # Create a transition message to preserve conversation context
-    transition_text = {
-        'en': f"Switching to {specialist_title} specialist to better assist you.",
-        'ru': f"Переключаюсь на специалиста по {specialist_title} для лучшей помощи.",
-        'de': f"Wechsle zum {specialist_title}-Spezialisten, um Ihnen besser zu helfen.",
-        'uk': f"Перемикаюсь на спеціаліста з {specialist_title} для кращої допомоги."
-    }.get(language, f"Switching to {specialist_title} specialist.")
-    
-    # Add transition message to history if history exists
-    if 'history' in metadata and isinstance(metadata['history'], list):
-        # Add a system message about the transition
-        metadata['history'].append({
-            "role": "system",
-            "content": transition_text
-        })
-    
-    # Route back to the main handler with the updated metadata
-    return route_and_respond(None, metadata)
+    # Precomputed switch message (app/agents/greetings.py) — no LLM round-trip
+    transition_text = greetings.get_message(specialist_key, language, 'switch')
+    if not transition_text:
+        specialist_title = SPECIALISTS.get(specialist_key, {}).get('title', {}).get(language, specialist_key)
+        transition_text = f"Switching to {specialist_title} specialist."
+
+    conversation_id = metadata.get('conversation_id') or 'anon'
+    return {
+        'agent': specialist_key,
+        'answer': transition_text,
+        'interactive': None,
+        'conversation_id': conversation_id,
+        'message_id': _remember_turn(None, transition_text, conversation_id, specialist_key),
+    }
 
 def handle_generic_agent(message, agent_name, metadata):
     """Handle messages for generic agents (design, development, marketing)"""
@@ -459,8 +567,11 @@ def handle_generic_agent(message, agent_name, metadata):
         if history_messages:
             messages = [messages[0]] + history_messages + [messages[-1]]
     
-    # Get response from the OpenAI API
-    response_text = get_chat_response(messages, language)
+    # Opening turn comes from the precomputed catalog; only real questions hit the API
+    if not message:
+        response_text = greetings.get_message(agent_name, language)
+    else:
+        response_text = get_chat_response(messages, language)
     
     # Fallback if API fails
     if not response_text:
@@ -510,8 +621,10 @@ def handle_portfolio(message, metadata):
     # Add history if available - this is crucial for context preservation
     if 'history' in metadata and isinstance(metadata['history'], list):
         history_messages = metadata['history']
-        # Take the last 15 messages to maintain context but avoid token limits
-        trimmed_history = history_messages[-15:] if len(history_messages) > 15 else history_messages
+        # Keep the newest messages that fit the portfolio agent's token budget
+        from app.services.prompt_assembler import AGENT_INPUT_BUDGETS, fit_to_budget, message_tokens
+        available = AGENT_INPUT_BUDGETS['portfolio'] - sum(message_tokens(m) for m in messages) - message_tokens({'content': user_prompt})
+        _, trimmed_history = fit_to_budget(history_messages, max(available, 0))
         if trimmed_history:
             messages.extend(trimmed_history)
     
@@ -520,12 +633,9 @@ def handle_portfolio(message, metadata):
         # Add a prompt message to generate initial greeting
         messages.append({"role": "user", "content": user_prompt})
         
-        try:
-            # Get response from AI model using our chat service
-            greeting = get_chat_response(messages, language)
-        except Exception as e:
-            current_app.logger.error(f"Error getting AI response for portfolio: {str(e)}")
-            # Fallback to hardcoded responses if API call fails
+        # Precomputed greeting (app/agents/greetings.py) — no LLM call for the opening turn
+        greeting = greetings.get_message('portfolio', language)
+        if not greeting:
             greeting = "Here's our portfolio of recent projects. What kind of projects are you interested in seeing?"
             if language == 'ru':
                 greeting = "Вот наше портфолио недавних проектов. Какие типы проектов вас интересуют?"
@@ -833,20 +943,13 @@ def handle_tech_spec_creation(message, metadata):
             'phone': user_phone
         }
         
-        # Гибридный подход: пытаемся отправить напрямую, в случае неудачи используем очередь
-        from app.utils.telegram_queue import send_telegram_message_with_retry
+        # Delivery runs on the dispatcher thread; the chat turn only queues it
+        from app.utils.telegram_queue import queue_telegram_message
         
         try:
-            # Сначала попробуем отправить напрямую
-            success = send_tech_spec_notification(tech_spec_data, contact_info)
-            if success:
-                current_app.logger.info(f"Technical specification notification SENT directly for {user_email}")
-            else:
-                # Если не удалось отправить напрямую, помещаем в очередь
-                message_content = send_tech_spec_notification(tech_spec_data, contact_info, return_message_only=True)
-                from app.utils.telegram_queue import queue_telegram_message
-                queue_telegram_message(message_content)
-                current_app.logger.info(f"Technical specification notification QUEUED for {user_email} (direct send failed)")
+            message_content = send_tech_spec_notification(tech_spec_data, contact_info, return_message_only=True)
+            queue_telegram_message(message_content)
+            current_app.logger.info(f"Technical specification notification QUEUED for {user_email}")
         except Exception as e:
             current_app.logger.error(f"Failed to send Telegram notification: {str(e)}")
         
@@ -1151,25 +1254,11 @@ def handle_quiz(message, metadata):
 
 def send_tech_spec_notification(tech_spec_data, contact_info, return_message_only=False):
     """Send a notification about a new technical specification submission"""
-    # Format the message
-    message = "🔔 New Technical Specification Submission\n\n"
-    
-    # Add contact information
-    message += "👤 Contact Information:\n"
-    message += f"Name: {contact_info.get('name', 'N/A')}\n"
-    message += f"Email: {contact_info.get('email', 'N/A')}\n"
-    message += f"Phone: {contact_info.get('phone', 'N/A')}\n\n"
-    
-    # Add technical specification answers
-    message += "📋 Technical Specification:\n"
-    for item in tech_spec_data['answers']:
-        message += f"\n❓ {item['question']}\n"
-        message += f"➡️ {item['answer']}\n"
-    
-    # Add timestamp
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    message += f"\n📅 Submitted on: {timestamp}"
+    from app.services.notification_renderer import render_tech_spec
+
+    # Chat answers follow the section list of app.models.tech_spec, which has
+    # no per-question table: show each answer as free text
+    message = render_tech_spec(tech_spec_data, contact_info, with_questions=False)
     
     # If we only need the message content, return it
     if return_message_only:
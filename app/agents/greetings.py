@@ -0,0 +1,143 @@
+"""
+greetings.py
+
+Precomputed opening turns for the chat widget.
+
+Opening the widget or switching specialists used to cost an LLM call just to
+say hello. The catalog below holds, per agent and language:
+
+    greeting  — first message of a conversation
+    switch    — message shown when the user switches to this specialist
+
+It is built from SPECIALISTS (controller) and COMPANY_INFO (site_knowledge),
+written to greetings.json by `flask regen-greetings` and served from memory.
+When the JSON file is missing the catalog is built in-process on first use.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), "greetings.json")
+LANGUAGES = ("en", "de", "uk", "ru")
+DEFAULT_LANGUAGE = "en"
+
+# Responses-service agent keys → SPECIALISTS keys
+_AGENT_ALIASES = {"spec": "requirements"}
+
+_HELLO = {
+    "en": "Hello! 👋",
+    "de": "Hallo! 👋",
+    "uk": "Вітаю! 👋",
+    "ru": "Здравствуйте! 👋",
+}
+_INTRO = {
+    "en": "I'm the {title} at {company}.",
+    "de": "Ich bin der {title} von {company}.",
+    "uk": "Я — {title} компанії {company}.",
+    "ru": "Я — {title} компании {company}.",
+}
+_QUESTION = {
+    "en": "How can I help you today?",
+    "de": "Wie kann ich Ihnen heute helfen?",
+    "uk": "Чим можу допомогти?",
+    "ru": "Чем могу помочь?",
+}
+_SWITCH = {
+    "en": "Switching to the {title} to better assist you.",
+    "de": "Ich wechsle zum {title}, um Ihnen besser zu helfen.",
+    "uk": "Перемикаю на: {title}.",
+    "ru": "Переключаю на: {title}.",
+}
+
+
+def _readable(text: Optional[str]) -> Optional[str]:
+    """
+    site_knowledge stores part of its non-ASCII text double-encoded
+    (UTF-8 read as cp1251). Undo that when possible; drop text that cannot be
+    repaired rather than show mojibake to visitors.
+    """
+    if not text:
+        return None
+    try:
+        return text.encode("cp1251").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return None
+
+
+def build_catalog() -> Dict[str, Dict[str, Dict[str, str]]]:
+    """Render {agent: {language: {greeting, switch}}} from the site data."""
+    from app.agents.controller import SPECIALISTS
+    from app.agents.site_knowledge import COMPANY_INFO
+
+    catalog: Dict[str, Dict[str, Dict[str, str]]] = {}
+    for agent, spec in SPECIALISTS.items():
+        per_language: Dict[str, Dict[str, str]] = {}
+        for lang in LANGUAGES:
+            title = spec["title"].get(lang) or spec["title"]["en"]
+            description = spec["description"].get(lang) or spec["description"]["en"]
+            company_info = COMPANY_INFO.get(lang) or {}
+            company = _readable(company_info.get("name")) or "Andrii-IT"
+
+            parts = [_HELLO[lang], _INTRO[lang].format(title=title, company=company)]
+            if agent == "greeter":
+                specialization = _readable(company_info.get("specialization"))
+                if specialization:
+                    parts.append(f"{company} — {specialization}.")
+            parts += [description, _QUESTION[lang]]
+
+            per_language[lang] = {
+                "greeting": " ".join(parts),
+                "switch": f"{_SWITCH[lang].format(title=title)} {description}",
+            }
+        catalog[agent] = per_language
+    return catalog
+
+
+def write_catalog(path: str = CATALOG_PATH) -> Dict[str, Dict[str, Dict[str, str]]]:
+    catalog = build_catalog()
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(catalog, fh, ensure_ascii=False, indent=2, sort_keys=True)
+        fh.write("\n")
+    reload()
+    return catalog
+
+
+# ── lookup ────────────────────────────────────────────────────────────────────
+
+_catalog: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None
+_lock = threading.Lock()
+
+
+def _load() -> Dict[str, Dict[str, Dict[str, str]]]:
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                try:
+                    with open(CATALOG_PATH, encoding="utf-8") as fh:
+                        _catalog = json.load(fh)
+                except (OSError, ValueError) as exc:
+                    logger.warning(f"Greeting catalog not loaded ({exc}); building in memory")
+                    _catalog = build_catalog()
+    return _catalog
+
+
+def reload() -> None:
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def get_message(agent: str, language: str, kind: str = "greeting") -> Optional[str]:
+    """Return the precomputed `greeting` or `switch` text, or None for unknown agents."""
+    entries = _load().get(_AGENT_ALIASES.get(agent, agent))
+    if not entries:
+        return None
+    entry = entries.get(language) or entries.get(DEFAULT_LANGUAGE) or {}
+    return entry.get(kind)
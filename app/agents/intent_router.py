@@ -0,0 +1,270 @@
+"""
+intent_router.py
+
+Single-pass intent classification for chat turns.
+
+One precompiled pattern holds every keyword of every table (tech-spec
+triggers, confirmation words, common words that only vote for a language).
+`classify()` walks the lower-cased head of the message once with finditer,
+checks the letters that tell languages apart (і/ї/є/ґ, umlauts) and returns
+language, agent and confirmation together, replacing detect_language, the
+substring scan over the trigger tuple and spec_service's confirmation
+tokenizer.
+
+The head is the first SCAN_CHARS characters, cut at a space: a chat turn is
+all head, and a long paste is answered from its opening like a reader
+would. Only a tech-spec trigger is looked for in the rest: `str.find` over
+a few trigger prefixes (C-level, like the old `in` scan), with the matcher
+run only where one is found. A word-boundary regex costs a fixed amount per
+character, so without the cut a 1.5k-character paste took several times
+the old checks; scripts/bench_intent_router.py keeps both cases measured.
+
+Keyword tables are per language. Entries are matched on word boundaries:
+
+    WORDS  — the whole word must match ("ja" does not fire inside "jahr")
+    STEMS  — the word must start with the entry ("техніч" → "технічне")
+
+Multi-word entries match across any whitespace. Keep routing behaviour pinned
+with tests/intent_corpus.jsonl.
+
+Behaviour changes against the routing this replaced (all in the corpus):
+
+  * Keywords match on word boundaries: "ja" no longer confirms inside
+    "jahr", and stems only fire at a word start ("неспецифичный" is not
+    a "спец" trigger).
+  * Ukrainian letters (і/ї/є/ґ) give uk; other Cyrillic still gives ru.
+  * German without umlauts is told from English by common words
+    ("Guten Tag, was kostet eine Website?" is de).
+  * Language and confirmation come from the head of the message only; a
+    spec trigger still counts anywhere in it.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Characters classified in full; beyond them only spec triggers are looked for
+SCAN_CHARS = 128
+
+# ── keyword tables ────────────────────────────────────────────────────────────
+
+# Switch the turn to the tech-spec ("requirements") agent
+SPEC_STEMS: Dict[str, Tuple[str, ...]] = {
+    "uk": ("тех завдан", "техзавдан", "техніч", "технічне завдан", "спеціаліст", "експерт"),
+    "ru": ("техзадани", "техзад", "техническ", "техзадан", "тех задани", "специалист", "спец"),
+    "en": ("tech spec", "technical spec", "specification", "requirements"),
+}
+SPEC_WORDS: Dict[str, Tuple[str, ...]] = {
+    "uk": ("тз",),
+    "ru": ("тз",),
+}
+
+# User confirms the spec summary
+CONFIRM_WORDS: Dict[str, Tuple[str, ...]] = {
+    "en": ("confirm", "confirmed", "yes", "submit", "send", "ok", "okay", "proceed",
+           "approve", "approved", "done", "finish", "go ahead"),
+    "de": ("bestätigen", "bestätigt", "ja", "senden", "einreichen", "weiter",
+           "genehmigen", "fertig", "los", "genau", "richtig"),
+    "uk": ("підтвердити", "підтверджую", "так", "надіслати", "відправити",
+           "готово", "гаразд", "добре"),
+    "ru": ("подтвердить", "подтверждаю", "да", "отправить", "готово", "хорошо", "ладно"),
+}
+
+# Common words that only vote for the language (no intent)
+LANGUAGE_WORDS: Dict[str, Tuple[str, ...]] = {
+    "en": ("the", "and", "is", "are", "what", "how", "you", "we", "need", "please", "hello"),
+    "de": ("und", "ich", "wir", "ist", "sind", "eine", "ein", "der", "das", "nicht", "bitte",
+           "guten", "hallo", "kostet", "brauchen"),
+}
+
+# Page-path → agent (used when the frontend did not select an agent)
+PAGE_PREFIXES: Tuple[Tuple[str, str], ...] = (
+    ("/dashboard", "pm"),
+    ("/client", "pm"),
+)
+
+# ── compiled matcher ──────────────────────────────────────────────────────────
+# Keywords are folded into two prefix tries (whole words / stems) so the regex
+# engine does not try every entry at every position; meaning is looked up only
+# for the few matched spans.
+
+# Script hints: only their presence matters, so they stay out of the keyword
+# pass (a Ukrainian message would otherwise yield one Python-level match per
+# і/ї/є) and are tested against the set of the head's characters.
+_UK_LETTERS = frozenset("іїєґ")    # letters only Ukrainian uses
+_DE_LETTERS = frozenset("äöüß")
+_CYRILLIC = frozenset("абвгдеёжзийклмнопрстуфхцчшщъыьэюя")
+_LATIN = frozenset("abcdefghijklmnopqrstuvwxyz")
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _trie_pattern(entries: Iterable[str]) -> str:
+    """Regex alternation for `entries` factored by common prefixes."""
+    trie: dict = {}
+    for entry in entries:
+        node = trie
+        for ch in entry:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        optional = "" in node
+        branches = [
+            (r"\s+" if ch == " " else re.escape(ch)) + render(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = f"(?:{body})?"
+        return body
+
+    return render(trie)
+
+
+def _build(
+    tables: Iterable[Tuple[str, Dict[str, Tuple[str, ...]], bool]],
+) -> Tuple["re.Pattern[str]", Dict[str, Tuple[str, Optional[str]]], Dict[str, Tuple[str, Optional[str]]]]:
+    langs_of: Dict[Tuple[str, str, bool], List[str]] = {}
+    for intent, table, stem in tables:
+        for lang, words in table.items():
+            for entry in words:
+                langs_of.setdefault((intent, " ".join(entry.split()), stem), []).append(lang)
+
+    # An entry listed for several languages (e.g. "готово") votes for none
+    words: Dict[str, Tuple[str, Optional[str]]] = {}
+    stems: Dict[str, Tuple[str, Optional[str]]] = {}
+    for (intent, entry, stem), langs in langs_of.items():
+        (stems if stem else words)[entry] = (intent, langs[0] if len(langs) == 1 else None)
+
+    # One word-start check and a lookahead on the possible first letters
+    # reject most positions before either trie is tried
+    first = "".join(sorted({entry[0] for entry in (*words, *stems)}))
+    pattern = (
+        rf"\b(?=[{re.escape(first)}])"
+        rf"(?:(?P<word>{_trie_pattern(words)})\b|(?P<stem>{_trie_pattern(stems)})\w*)"
+    )
+    return re.compile(pattern), words, stems
+
+
+_MATCHER, _WORDS, _STEMS = _build((
+    ("spec", SPEC_STEMS, True),
+    ("spec", SPEC_WORDS, False),
+    ("confirm", CONFIRM_WORDS, False),
+    ("lang", LANGUAGE_WORDS, False),
+))
+
+
+# Spec triggers beyond the head. Every trigger starts with one of these short
+# prefixes (cut before any space, which may be other whitespace in the text);
+# `str.find` (C-level, like the old `in` scan) looks for them and the matcher
+# is tried only where one is found.
+_spec_heads = {
+    entry.split(" ")[0][:4]
+    for entry, (intent, _) in (*_WORDS.items(), *_STEMS.items()) if intent == "spec"
+}
+_SPEC_PREFIXES: Tuple[str, ...] = tuple(sorted(
+    head for head in _spec_heads if not any(other != head and head.startswith(other) for other in _spec_heads)
+))
+
+
+def _has_spec_trigger(text: str) -> bool:
+    for prefix in _SPEC_PREFIXES:
+        at = text.find(prefix)
+        while at != -1:
+            m = _MATCHER.match(text, at)
+            if m and _meaning(m.lastgroup, m.group(m.lastgroup))[0] == "spec":
+                return True
+            at = text.find(prefix, at + 1)
+    return False
+
+
+def _meaning(group: str, span: str) -> Tuple[str, Optional[str]]:
+    # `span` is the entry itself: the stem group stops before the rest of the
+    # word, and the greedy trie has already picked the longest stem
+    table = _STEMS if group == "stem" else _WORDS
+    hit = table.get(span)
+    if hit is None:
+        hit = table[_SPACE_RE.sub(" ", span)]
+    return hit
+
+
+_PAGE_RE = re.compile(
+    "^(?:" + "|".join(f"(?P<p{i}>{re.escape(prefix)})" for i, (prefix, _) in enumerate(PAGE_PREFIXES)) + ")"
+    r"|(?P<spec>/spec)"
+)
+
+
+# ── classification ────────────────────────────────────────────────────────────
+
+@dataclass  # not frozen: a frozen __init__ costs more than the rest of a short turn
+class Intent:
+    language: Optional[str]      # 'uk' | 'ru' | 'de' | 'en' | None (no letters)
+    agent: Optional[str]         # 'spec' | 'pm' | None (keep the selected agent)
+    confirmation: bool
+    spec_trigger: bool
+    page_agent: Optional[str]
+
+
+def agent_from_page(page: Optional[str]) -> Optional[str]:
+    if not page:
+        return None
+    m = _PAGE_RE.search(page.lower())
+    if not m:
+        return None
+    if m.lastgroup == "spec":
+        return "spec"
+    return PAGE_PREFIXES[int(m.lastgroup[1:])][1]
+
+
+def _language(text: str, votes: Dict[str, int]) -> Optional[str]:
+    letters = set(text)
+    uk_letters = not letters.isdisjoint(_UK_LETTERS)
+    if uk_letters or votes.get("uk") or votes.get("ru") or not letters.isdisjoint(_CYRILLIC):
+        if uk_letters or votes.get("uk", 0) > votes.get("ru", 0):
+            return "uk"
+        return "ru"
+    if votes.get("de", 0) > votes.get("en", 0) or not letters.isdisjoint(_DE_LETTERS):
+        return "de"
+    if votes.get("en") or not letters.isdisjoint(_LATIN):
+        return "en"
+    return None
+
+
+def classify(message: Optional[str], page: Optional[str] = None) -> Intent:
+    """Classify one chat message in a single pass over its head (see SCAN_CHARS)."""
+    text = message or ""
+    cut = len(text)
+    if cut > SCAN_CHARS:
+        # At a space, so a word cut in half cannot match as a whole word
+        cut = text.rfind(" ", 0, SCAN_CHARS + 1)
+        if cut <= 0:
+            cut = SCAN_CHARS
+    head = text[:cut].lower()
+    votes: Dict[str, int] = {}
+    spec = confirm = False
+
+    for m in _MATCHER.finditer(head):
+        group = m.lastgroup
+        intent, lang = _meaning(group, m.group(group))
+        if lang is not None:
+            votes[lang] = votes.get(lang, 0) + m.end() - m.start()
+        if intent == "spec":
+            spec = True
+        elif intent == "confirm":
+            confirm = True
+
+    if not spec and cut < len(text):
+        spec = _has_spec_trigger(text[cut:].lower())
+
+    page_agent = agent_from_page(page)
+    return Intent(
+        language=_language(head, votes),
+        agent="spec" if spec else page_agent,
+        confirmation=confirm,
+        spec_trigger=spec,
+        page_agent=page_agent,
+    )
@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify, current_app, session
+from flask import Blueprint, Response, request, jsonify, current_app, session, stream_with_context
 from flask_login import current_user
+import json
 import os
 import requests
 from .. import db, csrf
-from ..agents.controller import route_and_respond
+from ..agents.controller import route_and_respond, route_and_stream
 from ..babel import get_locale
+from ..services.chat_service import get_fallback_response
+from ..services.llm_executor import LLMBusyError
+from ..services.openai_client import CircuitOpenError
 # Keep emergency fallback available but do not use it by default
 try:
     from ..agents.chat_fix import simple_chat_response  # noqa: F401
@@ -16,47 +20,60 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 @api_bp.route('/health')
 def health():
+    # Public: no internals and no DB work. Runtime stats are at /admin/runtime-stats
     return jsonify({'status': 'ok'})
 
 
-@api_bp.route('/chat', methods=['POST'])
-@csrf.exempt  # РћСЃРІРѕР±РѕР¶РґР°РµРј СЌС‚РѕС‚ РјР°СЂС€СЂСѓС‚ РѕС‚ CSRF РїСЂРѕРІРµСЂРєРё
-def chat():
-    # Parse request
-    try:
-        data = request.get_json() or {}
-        message = data.get('message', '')
-        metadata = data.get('metadata', {})
-        # Conversation history sent by the chat widget (spec agent context + save trigger)
-        metadata['history'] = data.get('history', [])
-
-        current_app.logger.info(f"Chat API received: message={message[:50]}..., metadata={metadata}")
-
-        # Ensure conversation_id
-        if not metadata.get('conversation_id'):
-            import uuid
-            metadata['conversation_id'] = str(uuid.uuid4())
-
-        # Resolve language
-        languages = [lang.lower() for lang in current_app.config.get('LANGUAGES', ['en', 'de', 'uk'])]
-        aliases = current_app.config.get('LANGUAGE_ALIASES', {})
-
-        requested_lang = metadata.get('language')
-        if requested_lang:
-            requested_lang = requested_lang.lower()
-            user_lang = aliases.get(requested_lang, requested_lang)
-        else:
-            user_lang = None
-
-        if user_lang not in languages:
-            user_lang = get_locale()
-
-        metadata['language'] = user_lang
-        current_app.logger.info(f"Chat request: lang={user_lang}, message={message[:50]}...")
-    except Exception as e:
-        current_app.logger.error(f"Error processing request: {str(e)}")
-        return jsonify({'error': str(e), 'answer': 'РџРѕРјРёР»РєР° РїСЂРё РѕР±СЂРѕР±С†С– Р·Р°РїРёС‚Сѓ.'}), 400
+def _prepare_chat_request():
+    """
+    Parse the chat POST body and normalise metadata (conversation id, language,
+    authenticated user). Shared by /chat and /chat/stream.
 
+    Returns (message, metadata); raises on malformed input.
+    """
+    data = request.get_json() or {}
+    message = data.get('message', '')
+    metadata = data.get('metadata', {})
+    # History lives server-side (conversation_store); the widget only reports the
+    # last message id it has seen. `history` is accepted from older widgets.
+    last_message_id = data.get('last_message_id') or metadata.get('last_message_id')
+    try:
+        metadata['last_message_id'] = int(last_message_id) if last_message_id else None
+    except (TypeError, ValueError):
+        metadata['last_message_id'] = None
+    metadata['history'] = data.get('history') or []
+
+    current_app.logger.debug(
+        f"Chat API received: message_len={len(message)}, "
+        f"conversation_id={metadata.get('conversation_id')}, last_message_id={metadata['last_message_id']}"
+    )
+
+    # Ensure conversation_id
+    if not metadata.get('conversation_id'):
+        import uuid
+        metadata['conversation_id'] = str(uuid.uuid4())
+
+    # Resolve language
+    languages = [lang.lower() for lang in current_app.config.get('LANGUAGES', ['en', 'de', 'uk'])]
+    aliases = current_app.config.get('LANGUAGE_ALIASES', {})
+
+    requested_lang = metadata.get('language')
+    if requested_lang:
+        requested_lang = requested_lang.lower()
+        user_lang = aliases.get(requested_lang, requested_lang)
+    else:
+        user_lang = None
+
+    if user_lang not in languages:
+        user_lang = get_locale()
+
+    metadata['language'] = user_lang
+    current_app.logger.debug(f"Chat request: lang={user_lang}")
+    return message, metadata
+
+
+def _bind_request_context(metadata):
+    """Clear failed transactions and bind the logged-in user to chat metadata."""
     # Clear any failed transactions
     try:
         db.session.rollback()
@@ -73,11 +90,43 @@ def chat():
     except Exception as e:
         current_app.logger.warning(f"Unable to bind session user to chat metadata: {e}")
 
+
+def _busy_response(metadata):
+    """503 with Retry-After when the LLM pool is saturated — page traffic keeps its threads."""
+    response = jsonify({
+        'error': 'busy',
+        'agent': 'fallback',
+        'answer': get_fallback_response(metadata.get('language', 'en')),
+        'conversation_id': metadata.get('conversation_id'),
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+@api_bp.route('/chat', methods=['POST'])
+@csrf.exempt  # РћСЃРІРѕР±РѕР¶РґР°РµРј СЌС‚РѕС‚ РјР°СЂС€СЂСѓС‚ РѕС‚ CSRF РїСЂРѕРІРµСЂРєРё
+def chat():
+    # Parse request
+    try:
+        message, metadata = _prepare_chat_request()
+    except Exception as e:
+        current_app.logger.error(f"Error processing request: {str(e)}")
+        return jsonify({'error': str(e), 'answer': 'РџРѕРјРёР»РєР° РїСЂРё РѕР±СЂРѕР±С†С– Р·Р°РїРёС‚Сѓ.'}), 400
+
+    _bind_request_context(metadata)
+
     # Main flow: use controller route_and_respond (Assistants/legacy pipeline)
     try:
         result = route_and_respond(message, metadata)
+    except LLMBusyError:
+        current_app.logger.warning("LLM executor at capacity, rejecting chat turn")
+        return _busy_response(metadata)
     except Exception as e:
-        current_app.logger.exception(f"route_and_respond failed: {e}")
+        if isinstance(e, CircuitOpenError):
+            current_app.logger.warning("OpenAI circuit open, answering with fallback")
+        else:
+            current_app.logger.exception(f"route_and_respond failed: {e}")
         # Fallback to emergency simple handler if available
         if simple_chat_response:
             try:
@@ -99,15 +148,77 @@ def chat():
         'answer': answer,
         'conversation_id': result.get('conversation_id', metadata.get('conversation_id'))
     }
+    response['cache'] = result.get('cache', 'bypass')
+    if result.get('message_id'):
+        response['message_id'] = result['message_id']
     if result.get('interactive'):
         response['interactive'] = result['interactive']
     if result.get('spec_saved'):
         response['spec_saved'] = True
         response['submission_id'] = result.get('submission_id')
 
-    current_app.logger.info(f"Sending chat response: agent={agent}, answer={str(answer)[:50]}...")
+    current_app.logger.debug(f"Sending chat response: agent={agent}, answer_len={len(str(answer or ''))}")
     return jsonify(response)
 
 
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@api_bp.route('/chat/stream', methods=['POST'])
+@csrf.exempt
+def chat_stream():
+    """
+    Server-Sent Events variant of /chat: forwards answer deltas as they arrive.
 
+    Events: `delta` {text}, then `done` {agent, conversation_id, spec_saved, message_id[, submission_id]}.
+    On failure an `error` event carries the fallback answer instead of `done`.
+    """
+    try:
+        message, metadata = _prepare_chat_request()
+    except Exception as e:
+        current_app.logger.error(f"Error processing stream request: {str(e)}")
+        return jsonify({'error': str(e), 'answer': 'РџРѕРјРёР»РєР° РїСЂРё РѕР±СЂРѕР±С†С– Р·Р°РїРёС‚Сѓ.'}), 400
 
+    _bind_request_context(metadata)
+
+    def generate():
+        sent_any = False
+        try:
+            for event in route_and_stream(message, metadata):
+                kind = event.pop('event')
+                if kind == 'delta':
+                    sent_any = True
+                yield _sse(kind, event)
+        except LLMBusyError:
+            current_app.logger.warning("LLM executor at capacity, rejecting chat stream")
+            yield _sse('error', {
+                'agent': 'fallback',
+                'conversation_id': metadata.get('conversation_id'),
+                'answer': get_fallback_response(metadata.get('language', 'en')),
+                'busy': True,
+            })
+        except Exception as e:
+            if isinstance(e, CircuitOpenError):
+                current_app.logger.warning("OpenAI circuit open, streaming fallback")
+            else:
+                current_app.logger.exception(f"route_and_stream failed: {e}")
+            payload = {
+                'agent': 'fallback',
+                'conversation_id': metadata.get('conversation_id'),
+                'answer': 'Р’РёР±Р°С‡С‚Рµ, СЃС‚Р°Р»Р°СЃСЏ РїРѕРјРёР»РєР° РїСЂРё РѕР±СЂРѕР±С†С– РїРѕРІС–РґРѕРјР»РµРЅРЅСЏ.',
+            }
+            # Only substitute a fallback answer if nothing was streamed yet
+            if simple_chat_response and not sent_any:
+                try:
+                    fallback = simple_chat_response(message, metadata)
+                    payload['agent'] = fallback.get('agent', 'fallback')
+                    payload['answer'] = fallback.get('answer', payload['answer'])
+                except Exception as fe:
+                    current_app.logger.error(f"Fallback simple_chat_response failed: {fe}")
+            yield _sse('error', payload)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable proxy buffering (Render/nginx)
+    return response
@@ -25,3 +25,19 @@ def register_commands(app):
     # Register CV projects seed command
     from app.commands.seed_cv_projects import seed_cv_projects_command
     app.cli.add_command(seed_cv_projects_command)
+
+    # Register greeting catalog regeneration command
+    from app.commands.regen_greetings import regen_greetings_command
+    app.cli.add_command(regen_greetings_command)
+
+    # Register Telegram outbox inspection / dead-letter replay commands
+    from app.commands.telegram_queue import telegram_queue_command
+    app.cli.add_command(telegram_queue_command)
+
+    # Register blog image variant backfill / stats commands
+    from app.commands.blog_images import blog_images_command
+    app.cli.add_command(blog_images_command)
+
+    # Register media blob store stats / recount / garbage collection commands
+    from app.commands.media import media_command
+    app.cli.add_command(media_command)
@@ -0,0 +1,54 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from app import db
+from app.models.blog import BlogImageVariant, BlogPost
+from app.models.media import MediaBlob
+from app.services import image_variants
+
+
+@click.group('blog-images')
+def blog_images_command():
+    """Resized variants (card/hero/og) of blog post images."""
+
+
+@blog_images_command.command('backfill')
+@click.option('--force', is_flag=True, help='Re-render variants that already exist')
+@click.option('--post-id', 'post_ids', multiple=True, type=int, help='Only these posts (repeatable)')
+@with_appcontext
+def backfill_command(force, post_ids):
+    """Render missing variants and placeholders for posts with a stored image."""
+    if not image_variants.available():
+        raise click.ClickException("Pillow is not installed; pip install -r requirements.txt")
+    query = select(BlogPost.id).where(BlogPost.image_hash.isnot(None)).order_by(BlogPost.id)
+    if post_ids:
+        query = query.where(BlogPost.id.in_(post_ids))
+    ids = db.session.execute(query).scalars().all()
+
+    written = failed = 0
+    for post_id in ids:
+        try:
+            written += image_variants.generate_for_post(post_id, force=force)
+        except Exception as e:
+            db.session.rollback()
+            failed += 1
+            click.echo(f"Post {post_id}: {e}", err=True)
+    click.echo(f"{len(ids)} post(s) checked, {written} variant(s) written, {failed} failed.")
+
+
+@blog_images_command.command('stats')
+@with_appcontext
+def stats_command():
+    """Average bytes per variant next to the average original."""
+    original = db.session.execute(
+        select(func.count(), func.avg(MediaBlob.byte_size)).join(MediaBlob, MediaBlob.sha256 == BlogPost.image_hash)
+    ).one()
+    click.echo(f"{'original':12} {'':5} {original[0]:>5} image(s)  avg {int(original[1] or 0):>9,} bytes")
+    rows = db.session.execute(
+        select(BlogImageVariant.name, BlogImageVariant.format, func.count(), func.avg(BlogImageVariant.byte_size))
+        .group_by(BlogImageVariant.name, BlogImageVariant.format)
+        .order_by(BlogImageVariant.name, BlogImageVariant.format)
+    ).all()
+    for name, fmt, count, avg in rows:
+        click.echo(f"{name:12} {fmt:5} {count:>5} image(s)  avg {int(avg or 0):>9,} bytes")
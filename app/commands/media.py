@@ -0,0 +1,50 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from app import db
+from app.models.media import MediaBlob
+from app.services import media_store
+
+
+@click.group('media')
+def media_command():
+    """Content-addressed image store (media_blobs)."""
+
+
+@media_command.command('stats')
+@with_appcontext
+def stats_command():
+    """Blob count, stored bytes and unreferenced blobs."""
+    count, total, refs = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(MediaBlob.byte_size), 0),
+               func.coalesce(func.sum(MediaBlob.refcount), 0))
+    ).one()
+    orphans = db.session.execute(select(func.count()).where(MediaBlob.refcount <= 0)).scalar()
+    click.echo(f"blobs       {count}")
+    click.echo(f"bytes       {total:,}")
+    click.echo(f"references  {refs}")
+    click.echo(f"orphans     {orphans}")
+
+
+@media_command.command('recount')
+@with_appcontext
+def recount_command():
+    """Rebuild reference counts from blog_posts and generated_content."""
+    click.echo(f"{media_store.recount()} blob(s) had a wrong count.")
+
+
+@media_command.command('gc')
+@click.option('--dry-run', is_flag=True, help='Only list what would be removed')
+@click.option('--grace-hours', default=media_store.GC_GRACE_HOURS, show_default=True, type=float,
+              help='Keep unreferenced blobs and files younger than this')
+@click.option('--no-files', is_flag=True, help='Leave the image storage directory alone')
+@with_appcontext
+def gc_command(dry_run, grace_hours, no_files):
+    """Delete unreferenced blobs and stale generated image files."""
+    report = media_store.collect_garbage(grace_hours=grace_hours, dry_run=dry_run, files=not no_files)
+    verb = 'Would remove' if dry_run else 'Removed'
+    for path in report.files:
+        click.echo(f"  {path}")
+    click.echo(f"{verb} {len(report.blobs)} blob(s) ({report.blob_bytes:,} bytes) and "
+               f"{len(report.files)} file(s) ({report.file_bytes:,} bytes).")
@@ -0,0 +1,13 @@
+import click
+from flask.cli import with_appcontext
+
+from app.agents.greetings import CATALOG_PATH, write_catalog
+
+
+@click.command('regen-greetings')
+@with_appcontext
+def regen_greetings_command():
+    """Rebuild the precomputed chat greetings (app/agents/greetings.json)."""
+    catalog = write_catalog()
+    entries = sum(len(languages) for languages in catalog.values())
+    click.echo(f"Wrote {entries} greeting entries for {len(catalog)} agents to {CATALOG_PATH}")
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import click
+
+from app.utils.telegram_outbox import TelegramOutbox
+
+
+@click.group('telegram-queue')
+def telegram_queue_command():
+    """Inspect the Telegram outbox and replay dead letters."""
+
+
+@telegram_queue_command.command('stats')
+def stats_command():
+    """Show message counts per state."""
+    counts = TelegramOutbox().counts()
+    for state in ('pending', 'sent', 'dead'):
+        click.echo(f"{state:8} {counts.get(state, 0)}")
+
+
+@telegram_queue_command.command('dead')
+@click.option('--limit', default=50, show_default=True, help='Rows to show')
+def dead_command(limit):
+    """List dead letters (messages that used up their attempts)."""
+    rows = TelegramOutbox().dead(limit)
+    if not rows:
+        click.echo("No dead letters.")
+        return
+    for row in rows:
+        failed_at = datetime.fromtimestamp(row['updated_at']).strftime('%Y-%m-%d %H:%M')
+        preview = row['text'].splitlines()[0][:60] if row['text'] else ''
+        click.echo(f"#{row['id']:<6} {failed_at}  attempts={row['attempts']}  {row['last_error'] or '-'}  | {preview}")
+
+
+@telegram_queue_command.command('replay')
+@click.argument('message_ids', nargs=-1, type=int)
+@click.option('--all', 'replay_all', is_flag=True, help='Replay every dead letter')
+def replay_command(message_ids, replay_all):
+    """Put dead letters back in the queue with a fresh attempt count."""
+    if not message_ids and not replay_all:
+        raise click.UsageError("Give message ids or --all")
+    count = TelegramOutbox().replay(None if replay_all else list(message_ids))
+    click.echo(f"Replayed {count} dead letter(s); the dispatcher sends them on its next wake-up.")
@@ -23,6 +23,14 @@ def init_database_schema(app):
         except Exception as e:
             app.logger.error(f"Failed to create database tables: {str(e)}")
 
+        # Blog search backend (PostgreSQL: column from the migration, checked only; SQLite: FTS5)
+        try:
+            from app.services.blog_search import ensure_search_index
+            backend = ensure_search_index(engine)
+            app.logger.info(f"Blog search backend: {backend}")
+        except Exception as e:
+            app.logger.warning(f"Could not prepare blog search index: {e}")
+
         # Auto-seed pricing packages if table is empty
         try:
             from app.models.pricing import PricePackage
@@ -34,6 +42,41 @@ def init_database_schema(app):
         except Exception as e:
             app.logger.warning(f"Could not auto-seed pricing packages: {e}")
         
+        # Check and add columns added after create_all (images, chat spec drafts, summaries)
+        from app.models.blog import BlogPost
+        from app.models.content_generation import GeneratedContent
+        from app.models.conversation_summary import ConversationSummary
+        from app.models.tech_spec_submission import TechSpecSubmission
+        late_columns = (
+            (BlogPost.__table__, (('image_hash', 'VARCHAR(64)'), ('image_placeholder', 'TEXT'))),
+            (GeneratedContent.__table__, (('image_hash', 'VARCHAR(64)'),)),
+            (TechSpecSubmission.__table__, (('extracted_message_id', 'INTEGER'),)),
+            (ConversationSummary.__table__, (('covered_message_id', 'INTEGER'),)),
+        )
+        for table, wanted in late_columns:
+            if not inspector.has_table(table.name, schema=table.schema):
+                continue
+            columns = [col['name'] for col in inspector.get_columns(table.name, schema=table.schema)]
+            for column, ddl in wanted:
+                if column in columns:
+                    continue
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(f"ALTER TABLE {table.fullname} ADD COLUMN {column} {ddl}"))
+                        if column == 'image_hash':
+                            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table.name}_image_hash ON {table.fullname} (image_hash)"))
+                        app.logger.info(f"Added {column} column to {table.name} table")
+                except Exception as e:
+                    app.logger.error(f"Failed to add {column} column to {table.name}: {str(e)}")
+
+        # Move images still stored inline (legacy image_data columns) into media_blobs
+        try:
+            from app.services.media_store import adopt_inline_images
+            adopt_inline_images(engine)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not move inline images to media_blobs: {e}")
+
         # Check and add email column to AdminUser if needed
         if 'admin_users' in inspector.get_table_names():
             columns = [col['name'] for col in inspector.get_columns('admin_users')]
@@ -1,4 +1,5 @@
 from app.models.base import *
+from app.models.media import *
 from app.models.blog import *
 from app.models.project import *
 from app.models.communication import *
@@ -6,6 +7,7 @@ from app.models.pricing import *
 from app.models.content_generation import *
 from app.models.assistant_thread import *
 from app.models.chat_message import *
+from app.models.conversation_summary import *
 from app.models.tech_spec_submission import *
 from app.models.stripe_payment import *
 from app.models.cv import (
@@ -1,7 +1,8 @@
 from .. import db
 from datetime import datetime
-from sqlalchemy import Table, Column, ForeignKey, Integer
-from sqlalchemy.orm import relationship
+from sqlalchemy import Table, Column, ForeignKey, Integer, func, or_
+from sqlalchemy.orm import column_property, query_expression, relationship
+from .media import MediaImageMixin
 
 # Many-to-many таблица для связи постов и тегов
 post_tags = Table(
@@ -11,17 +12,18 @@ post_tags = Table(
     Column('tag_id', Integer, ForeignKey('blog_tags.id'), primary_key=True)
 )
 
-class BlogPost(db.Model):
+class BlogPost(MediaImageMixin, db.Model):
     __tablename__ = 'blog_posts'
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     slug = db.Column(db.String(255), unique=True, nullable=False)
-    content = db.Column(db.Text)
+    content = db.deferred(db.Column(db.Text))  # Тело статьи грузится только по обращению (списки его не читают)
     excerpt = db.Column(db.Text)
     image_url = db.Column(db.String(500))  # Локальный путь к сохраненному изображению
     original_image_url = db.Column(db.String(500))  # Оригинальный URL от OpenAI (временный)
-    image_data = db.Column(db.LargeBinary)  # Бинарные данные изображения для хранения в БД
+    # image_hash / image_data: картинка в media_blobs по SHA-256 (MediaImageMixin); хеш же ETag и версия URL
+    image_placeholder = db.Column(db.Text)  # Крошечное размытое превью (data URI) для карточек
     published = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -34,11 +36,48 @@ class BlogPost(db.Model):
     category = relationship("BlogCategory")
     
     tags = relationship("BlogTag", secondary=post_tags, backref="posts")
+
+    image_variants = relationship("BlogImageVariant", cascade="all, delete-orphan")
+
+    # Начало тела для карточек без excerpt; заполняется with_expression (см. blog_listing)
+    teaser = query_expression()
     
     def __repr__(self):
         return f'<BlogPost {self.title}>'
 
 
+# Есть ли у поста своя картинка (blob или URL); считается в SQL, байты не читаются
+BlogPost.has_image = column_property(
+    or_(
+        BlogPost.image_hash.isnot(None),
+        func.coalesce(BlogPost.image_url, '') != '',
+        func.coalesce(BlogPost.original_image_url, '') != '',
+    )
+)
+
+
+class BlogImageVariant(db.Model):
+    """Уменьшенная копия картинки поста (card/hero/og) в WebP/AVIF/JPEG."""
+    __tablename__ = 'blog_image_variants'
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'name', 'format', name='uq_blog_image_variants_post_name_format'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('blog_posts.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(32), nullable=False)  # card-480, hero-1024, og ...
+    format = db.Column(db.String(8), nullable=False)  # avif, webp, jpeg
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    source_hash = db.Column(db.String(64), nullable=False, index=True)  # image_hash оригинала
+    byte_size = db.Column(db.Integer, nullable=False)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BlogImageVariant {self.post_id} {self.name}.{self.format}>'
+
+
 class BlogCategory(db.Model):
     __tablename__ = 'blog_categories'
     
@@ -7,7 +7,11 @@ class ChatMessage(db.Model):
     Модель для хранения истории сообщений в чатах
     """
     __tablename__ = "chat_messages"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # History reads are "WHERE conversation_id = ? ORDER BY id DESC LIMIT n"
+        db.Index('ix_chat_messages_conversation_id_id', 'conversation_id', 'id'),
+        {'extend_existing': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.String(64), nullable=False)  # index=True removed - causing conflicts
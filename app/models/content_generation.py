@@ -3,6 +3,7 @@ from datetime import datetime
 from sqlalchemy.orm import relationship
 from sqlalchemy import Enum
 import enum
+from .media import MediaImageMixin
 
 
 class ContentStatus(enum.Enum):
@@ -51,7 +52,7 @@ class ContentSchedule(db.Model):
         return f'<ContentSchedule {self.name}>'
 
 
-class GeneratedContent(db.Model):
+class GeneratedContent(MediaImageMixin, db.Model):
     """
     Модель для хранения сгенерированного контента
     """
@@ -65,7 +66,7 @@ class GeneratedContent(db.Model):
     image_prompt = db.Column(db.Text)  # Промпт для генерации изображения
     image_url = db.Column(db.String(500))  # Локальный путь к сохраненному изображению
     original_image_url = db.Column(db.String(500))  # Оригинальный URL от OpenAI (временный)
-    image_data = db.Column(db.LargeBinary)  # Бинарные данные изображения для хранения в БД
+    # image_hash / image_data: картинка в media_blobs по SHA-256 (MediaImageMixin)
     meta_description_en = db.Column(db.Text)  # SEO-описание на английском
     meta_description_de = db.Column(db.Text)  # SEO-описание на немецком
     keywords = db.Column(db.Text)  # SEO-ключевые слова
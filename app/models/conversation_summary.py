@@ -0,0 +1,27 @@
+# app/models/conversation_summary.py
+from app import db
+from datetime import datetime
+
+
+class ConversationSummary(db.Model):
+    """
+    Rolling summary of the older part of a chat conversation.
+    Turns that no longer fit into the agent's input token budget are folded
+    into `summary`; `covered_message_id` is the ChatMessage id of the last
+    message already folded. `covered_hash` (role + content) only serves
+    history without store ids (older widgets before the store had the turns).
+    """
+    __tablename__ = "conversation_summaries"
+
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(64), index=True, unique=True, nullable=False)
+    summary = db.Column(db.Text, nullable=False, default="")
+    covered_hash = db.Column(db.String(64), nullable=True)
+    covered_message_id = db.Column(db.Integer, nullable=True)
+    covered_count = db.Column(db.Integer, nullable=False, default=0)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<ConversationSummary conv={self.conversation_id} covered={self.covered_count}>"
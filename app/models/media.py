@@ -0,0 +1,78 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session, column_property, declared_attr
+
+from .. import db
+
+
+class MediaBlob(db.Model):
+    """Байты картинки, один раз на SHA-256; посты и сгенерированный контент ссылаются по хешу."""
+    __tablename__ = 'media_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    byte_size = db.Column(db.Integer, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)  # Строки, ссылающиеся на blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MediaBlob {self.sha256[:12]} refs={self.refcount}>'
+
+
+class MediaImageMixin:
+    """
+    image_hash ссылается на media_blobs.sha256. image_data оставлен как
+    свойство: чтение достаёт байты из media_blobs, запись кладёт их туда
+    (без дубликатов) и ставит image_hash.
+    """
+
+    @declared_attr
+    def image_hash(cls):
+        # active_history: прежний хеш нужен, чтобы уменьшить его refcount
+        return column_property(
+            db.Column(db.String(64), db.ForeignKey('media_blobs.sha256'), index=True),
+            active_history=True,
+        )
+
+    @property
+    def image_data(self):
+        from app.services import media_store
+        return media_store.get_data(self.image_hash)
+
+    @image_data.setter
+    def image_data(self, value):
+        from app.services import media_store
+        self.image_hash = media_store.put(value) if value else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _count_media_references(session, flush_context, instances):
+    """Keep media_blobs.refcount in step with image_hash on every flush."""
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, MediaImageMixin) and obj.image_hash:
+            deltas[obj.image_hash] += 1
+    for obj in session.dirty:
+        if isinstance(obj, MediaImageMixin) and obj not in session.deleted:
+            history = inspect(obj).attrs.image_hash.history
+            for digest in history.added:
+                if digest:
+                    deltas[digest] += 1
+            for digest in history.deleted:
+                if digest:
+                    deltas[digest] -= 1
+    for obj in session.deleted:
+        if isinstance(obj, MediaImageMixin):
+            history = inspect(obj).attrs.image_hash.load_history()
+            digest = (history.deleted or history.unchanged or (None,))[0]
+            if digest:
+                deltas[digest] -= 1
+
+    blobs = MediaBlob.__table__
+    for digest, delta in deltas.items():
+        if delta:
+            session.execute(
+                update(blobs).where(blobs.c.sha256 == digest).values(refcount=blobs.c.refcount + delta)
+            )
@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+from sqlalchemy import event, inspect, select
 from sqlalchemy.orm import relationship
 
 class Project(db.Model):
@@ -18,7 +19,7 @@ class Project(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    client_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     client = relationship("User", back_populates="projects")
     
     # Project has many tasks
@@ -52,7 +53,7 @@ class ProjectTask(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), index=True)
     project = relationship("Project", back_populates="tasks")
     
     def __repr__(self):
@@ -70,8 +71,65 @@ class ProjectUpdate(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), index=True)
     project = relationship("Project", back_populates="updates")
     
     def __repr__(self):
         return f'<ProjectUpdate {self.title}>'
+
+
+class ProjectContextSnapshot(db.Model):
+    """
+    Precomputed PM-agent context for one client (see app/services/pm_snapshot.py).
+    `content` is NULL while stale; every invalidation bumps `version` so a
+    rebuild that raced with a change never stores outdated text.
+    """
+    __tablename__ = 'project_context_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, index=True, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    content = db.Column(db.Text, nullable=True)
+    built_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ProjectContextSnapshot client={self.client_id} v{self.version}>'
+
+
+# ── snapshot invalidation ─────────────────────────────────────────────────────
+# Runs inside the flush on the same connection, so the snapshot goes stale in
+# the same transaction that changes the project data.
+
+def _invalidate_snapshots(connection, client_filter):
+    table = ProjectContextSnapshot.__table__
+    connection.execute(
+        table.update()
+        .where(client_filter(table.c.client_id))
+        .values(content=None, version=table.c.version + 1)
+    )
+
+
+def _invalidate_for_project(mapper, connection, target):
+    client_ids = {target.client_id}
+    # A project moved to another client invalidates the previous owner too
+    client_ids.update(inspect(target).attrs.client_id.history.deleted or ())
+    client_ids.discard(None)
+    if client_ids:
+        _invalidate_snapshots(connection, lambda col: col.in_(client_ids))
+
+
+def _invalidate_for_child(mapper, connection, target):
+    project_ids = {target.project_id}
+    project_ids.update(inspect(target).attrs.project_id.history.deleted or ())
+    project_ids.discard(None)
+    if project_ids:
+        projects = Project.__table__
+        owners = select(projects.c.client_id).where(projects.c.id.in_(project_ids))
+        _invalidate_snapshots(connection, lambda col: col.in_(owners))
+
+
+for _model, _listener in ((Project, _invalidate_for_project),
+                          (ProjectTask, _invalidate_for_child),
+                          (ProjectUpdate, _invalidate_for_child)):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _listener)
@@ -29,7 +29,13 @@ class TechSpecSubmission(db.Model):
     company_name = db.Column(db.String(100), nullable=True)
     contact_phone = db.Column(db.String(50), nullable=True)
     
-    status = db.Column(db.String(50), default='new')  # new, reviewed, estimated, approved, rejected
+    status = db.Column(db.String(50), default='new')  # draft, new, reviewed, estimated, approved, rejected
+    # Chat conversation that fills the draft turn by turn (see spec_service.update_draft)
+    conversation_id = db.Column(db.String(64), nullable=True, index=True)
+    # Last ChatMessage.id of that conversation folded into the draft; later messages are still to extract
+    extracted_message_id = db.Column(db.Integer, nullable=True)
+    # Idempotency key of the questionnaire POST; a retried request finds its row here
+    idempotency_key = db.Column(db.String(64), nullable=True, unique=True, index=True)
     estimated_hours = db.Column(db.Float, nullable=True)
     estimated_cost = db.Column(db.Float, nullable=True)
     estimated_timeline = db.Column(db.String(100), nullable=True)
@@ -2,9 +2,12 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from ..models import Lead
 from ..auth import AdminUser
 from .. import db
+import hashlib
 import json
-from flask_mail import Message
-from flask_mail import Mail
+import time
+import uuid
+from sqlalchemy.exc import IntegrityError
+from ..utils.mail_queue import queue_mail
 from datetime import datetime
 import os
 
@@ -21,7 +24,8 @@ def health_check():
 
 @pages_bp.route('/services')
 def services():
-    return render_template('services.html')
+    # One key per rendered form: resubmitting it is recognised as a duplicate
+    return render_template('services.html', idempotency_key=uuid.uuid4().hex)
 
 
 @pages_bp.route('/lebenslauf')
@@ -60,172 +64,128 @@ def lebenslauf():
 
 
 
+# Questionnaire field → label in the Telegram notification (in form order)
+QUESTIONNAIRE_FIELDS = (
+    ('project_type', 'Project Type'),
+    ('project_goal', 'Main Goal'),
+    ('target_users', 'Target Users'),
+    ('essential_features', 'Essential Features'),
+    ('nice_to_have_features', 'Nice-to-have Features'),
+    ('timeline', 'Timeline'),
+    ('budget_range', 'Budget Range'),
+    ('integrations', 'Integrations (existing systems to integrate)'),
+    ('technical_requirements', 'Technical Requirements / Preferences'),
+    ('similar_projects', 'Similar Projects (examples/inspiration)'),
+    ('success_metrics', 'Success Metrics (KPIs)'),
+    ('security_requirements', 'Security / Compliance Requirements'),
+    ('support_level', 'Required Ongoing Support After Launch'),
+    ('existing_assets', 'Existing Design Assets / Docs'),
+    ('additional_info', 'Additional Info'),
+)
+
+
+# Without a client key, identical answers only count as a retry for this long
+QUESTIONNAIRE_FALLBACK_WINDOW = 600  # seconds
+
+
+def _questionnaire_idempotency_keys(form_data: dict) -> list:
+    """
+    Keys of one questionnaire submission; the first is stored with the row,
+    all of them are looked up. The key is the Idempotency-Key header or the
+    hidden form field rendered with the page. Without either (a page cached
+    from before the field existed), identical form content counts as the same
+    submission only within QUESTIONNAIRE_FALLBACK_WINDOW: the content hash
+    includes the time bucket, and the previous bucket is checked too so a
+    retry across a bucket boundary is still recognised. A later submission
+    with the same answers is a new one.
+    """
+    key = request.headers.get('Idempotency-Key') or form_data.get('idempotency_key')
+    if key:
+        return [key.strip()[:64]]
+    content = json.dumps({k: v for k, v in request.form.lists() if k != 'csrf_token'},
+                         sort_keys=True, ensure_ascii=False)
+    bucket = int(time.time() // QUESTIONNAIRE_FALLBACK_WINDOW)
+    return [
+        f"form:{hashlib.sha256(f'{b}:{content}'.encode('utf-8')).hexdigest()[:59]}"
+        for b in (bucket, bucket - 1)
+    ]
+
+
+def _stored_questionnaire(keys: list):
+    """The submission already stored under one of `keys`, if any."""
+    from app.models.tech_spec_submission import TechSpecSubmission
+    return TechSpecSubmission.query.filter(TechSpecSubmission.idempotency_key.in_(keys)).first()
+
+
+def queue_questionnaire_notifications(tech_spec, form_data: dict) -> None:
+    """
+    Follow-up work of a stored questionnaire: Telegram message and admin email,
+    both keyed by the submission id so they are queued at most once.
+    """
+    from app.utils.telegram_queue import queue_telegram_message
+    from app.services.notification_renderer import render_tech_spec
+
+    answers = []
+    for field, question in QUESTIONNAIRE_FIELDS:
+        value = getattr(tech_spec, field) or ''
+        if field == 'existing_assets':
+            value = value.replace(',', ', ') or 'None'
+        answers.append({
+            'question': question,
+            'answer': value or ('Not provided' if field == 'additional_info' else 'Not specified'),
+        })
+    contact_info = {
+        'name': tech_spec.contact_name or 'Not provided',
+        'email': tech_spec.contact_email or 'Not provided',
+        'phone': tech_spec.contact_phone or 'Not provided',
+        'company': tech_spec.company_name or '',
+    }
+    # Long specs are split at paragraph boundaries by the Telegram dispatcher
+    message = render_tech_spec({'answers': answers, 'language': 'en'}, contact_info)
+    if not queue_telegram_message(message, dedupe_key=f"tech_spec:{tech_spec.id}"):
+        current_app.logger.warning(f"Telegram notification for tech spec {tech_spec.id} could not be queued")
+
+    try:
+        send_questionnaire_notification(form_data, dedupe_key=f"tech_spec:{tech_spec.id}")
+    except Exception as e:
+        current_app.logger.error(f"Questionnaire email for tech spec {tech_spec.id} not queued: {e}")
+
+
 @pages_bp.route('/submit-questionnaire', methods=['POST'])
 def submit_questionnaire():
-    """Handle project questionnaire submissions (ALL 15 fields)."""
+    """
+    Handle project questionnaire submissions (ALL 15 fields).
+
+    Write-first and idempotent: the submission and its lead are stored in one
+    transaction under the request's idempotency key (unique column), then the
+    notifications are queued for the background senders. A repeated POST
+    (double click, browser retry) finds the stored row through the unique
+    key and stores nothing; it queues the notifications again, which the
+    outboxes drop unless the first request died before queueing them. The
+    response never waits on Telegram or SMTP.
+    """
     try:
-        from app.services.telegram_service import send_tech_spec_notification
-        from app.utils.telegram_queue import send_telegram_message_with_retry
-        from datetime import datetime
-        import json
-        from app.models.base import Lead
-        from app import db
-
-        # 1) РЎРёСЂС– РґР°РЅС– С„РѕСЂРјРё
+        from app.models.tech_spec_submission import TechSpecSubmission
+
+        # 1) Сирі дані форми
         form_data = request.form.to_dict(flat=True)
 
-        # РњР°СЃРёРІРё (С‡РµРєР±РѕРєСЃРё/РјСѓР»СЊС‚РёРІРёР±С–СЂ)
+        # Масиви (чекбокси/мультивибір)
         security_requirements = request.form.getlist('security_requirements')
         existing_assets = request.form.getlist('existing_assets[]')
 
-        # 2) РџС–РґРіРѕС‚РѕРІРєР° В«РІС–РґРїРѕРІС–РґРµР№В» вЂ” РґРѕРґР°С”РјРѕ РЈРЎР† 15 РїРѕР»С–РІ
-        answers = []
+        keys = _questionnaire_idempotency_keys(form_data)
+        duplicate = _stored_questionnaire(keys)
 
-        # 1
-        answers.append({
-            'question': 'Project Type',
-            'answer': form_data.get('project_type', 'Not specified')
-        })
-        # 2
-        answers.append({
-            'question': 'Main Goal',
-            'answer': form_data.get('project_goal', 'Not specified')
-        })
-        # 3
-        answers.append({
-            'question': 'Target Users',
-            'answer': form_data.get('target_users', 'Not specified')
-        })
-        # 4
-        answers.append({
-            'question': 'Essential Features',
-            'answer': form_data.get('essential_features', 'Not specified')
-        })
-        # 5
-        answers.append({
-            'question': 'Nice-to-have Features',
-            'answer': form_data.get('nice_to_have_features', 'Not specified')
-        })
-        # 6
-        answers.append({
-            'question': 'Timeline',
-            'answer': form_data.get('timeline', 'Not specified')
-        })
-        # 7
-        answers.append({
-            'question': 'Budget Range',
-            'answer': form_data.get('budget_range', 'Not specified')
-        })
-        # 8
-        answers.append({
-            'question': 'Integrations (existing systems to integrate)',
-            'answer': form_data.get('integrations', 'Not specified')
-        })
-        # 9
-        answers.append({
-            'question': 'Technical Requirements / Preferences',
-            'answer': form_data.get('technical_requirements', 'Not specified')
-        })
-        # 10
-        answers.append({
-            'question': 'Similar Projects (examples/inspiration)',
-            'answer': form_data.get('similar_projects', 'Not specified')
-        })
-        # 11
-        answers.append({
-            'question': 'Success Metrics (KPIs)',
-            'answer': form_data.get('success_metrics', 'Not specified')
-        })
-        # 12
-        sr = ', '.join(security_requirements) if security_requirements else 'Not specified'
-        if form_data.get('other_security_requirements'):
-            sr = (sr + '; Other: ' + form_data['other_security_requirements']).strip('; ')
-        answers.append({
-            'question': 'Security / Compliance Requirements',
-            'answer': sr
-        })
-        # 13
-        answers.append({
-            'question': 'Required Ongoing Support After Launch',
-            'answer': form_data.get('support_level', 'Not specified')
-        })
-        # 14
-        assets = ', '.join(existing_assets) if existing_assets else 'None'
-        answers.append({
-            'question': 'Existing Design Assets / Docs',
-            'answer': assets
-        })
-        # 15
-        answers.append({
-            'question': 'Additional Info',
-            'answer': form_data.get('additional_info', 'Not provided')
-        })
-
-        tech_spec_data = {
-            'answers': answers,
-            # РњРѕР¶РµС€ Р·Р±РµСЂС–РіР°С‚Рё РјРѕРІСѓ, СЏРєС‰Рѕ С‚СЂРµР±Р°
-            'language': 'en'
-        }
-
-        # РљРѕРЅС‚Р°РєС‚Рё Р·Р°РјРѕРІРЅРёРєР°
-        contact_info = {
-            'name': form_data.get('contact_name', 'Not provided'),
-            'email': form_data.get('contact_email', 'Not provided'),
-            'phone': form_data.get('contact_phone', 'Not provided'),
-            'company': form_data.get('company_name', '')
-        }
-
-        # 3) РќР°РґСЃРёР»Р°РЅРЅСЏ Сѓ Telegram Р· Р±РµР·РїРµС‡РЅРёРј СЂРѕР·Р±РёС‚С‚СЏРј
-        #    (РІСЂР°С…РѕРІСѓС” Р»С–РјС–С‚ 4096 СЃРёРјРІРѕР»С–РІ)
-        full_message = send_tech_spec_notification(
-            tech_spec_data,
-            contact_info=contact_info,
-            return_message_only=True  # РћС‚СЂРёРјСѓС”РјРѕ С‚РµРєСЃС‚ Р±РµР· РІС–РґРїСЂР°РІРєРё
-        )
-
-        def _send_long_message_in_chunks(msg: str, chunk_size: int = 3500):
-            # Р РѕР·Р±РёРІР°С”РјРѕ Р·Р° РїСѓСЃС‚РёРјРё СЂСЏРґРєР°РјРё, РїРѕС‚С–Рј СЃР»С–РїР°С”РјРѕ РєСѓСЃРєРё, С‰РѕР± РЅРµ СЂРІР°С‚Рё СЃР»РѕРІР°
-            import textwrap
-            parts = []
-            buf = ""
-            for para in msg.split("\n\n"):
-                if len(buf) + len(para) + 2 <= chunk_size:
-                    buf = (buf + "\n\n" + para) if buf else para
-                else:
-                    if buf:
-                        parts.append(buf)
-                    # СЏРєС‰Рѕ Р°Р±Р·Р°С† РґСѓР¶Рµ РґРѕРІРіРёР№ вЂ” РЅР°СЂС–Р·Р°С”РјРѕ
-                    if len(para) > chunk_size:
-                        for sub in textwrap.wrap(para, chunk_size):
-                            parts.append(sub)
-                        buf = ""
-                    else:
-                        buf = para
-            if buf:
-                parts.append(buf)
-
-            sent_ok = True
-            for part in parts:
-                if not send_telegram_message_with_retry(part):
-                    sent_ok = False
-            return sent_ok
-
-        sent = _send_long_message_in_chunks(full_message)
-
-        if not sent:
-            current_app.logger.warning("Failed to send full tech spec to Telegram (queued or partially sent).")
-
-        # 4) РЎРѕС…СЂР°РЅСЏРµРј РґР°РЅРЅС‹Рµ С„РѕСЂРјС‹ РІ Р±Р°Р·Сѓ РґР°РЅРЅС‹С…
-        try:
-            from app.models.tech_spec_submission import TechSpecSubmission
-            
-            # РЎРѕР±РёСЂР°РµРј security_requirements РІ СЃС‚СЂРѕРєСѓ
+        if duplicate is None:
+            # Собираем security_requirements в строку
             security_reqs = ', '.join(security_requirements) if security_requirements else ''
             if form_data.get('other_security_requirements'):
                 security_reqs = (security_reqs + '; Other: ' + form_data['other_security_requirements']).strip('; ')
-            
-            # РЎРѕР·РґР°РµРј Р·Р°РїРёСЃСЊ РўР—
+
+            # 2) Создаем запись ТЗ и лид в одной транзакции
             tech_spec = TechSpecSubmission(
+                idempotency_key=keys[0],
                 project_type=form_data.get('project_type'),
                 project_goal=form_data.get('project_goal'),
                 target_users=form_data.get('target_users'),
@@ -241,150 +201,91 @@ def submit_questionnaire():
                 support_level=form_data.get('support_level'),
                 existing_assets=','.join(existing_assets) if existing_assets else '',
                 additional_info=form_data.get('additional_info'),
-                
-                # РљРѕРЅС‚Р°РєС‚РЅР°СЏ РёРЅС„РѕСЂРјР°С†РёСЏ
+
+                # Контактная информация
                 contact_name=form_data.get('contact_name'),
                 contact_email=form_data.get('contact_email'),
                 company_name=form_data.get('company_name'),
                 contact_phone=form_data.get('contact_phone')
             )
-            
-            # Р•СЃР»Рё РїРѕР»СЊР·РѕРІР°С‚РµР»СЊ Р°РІС‚РѕСЂРёР·РѕРІР°РЅ, СЃРІСЏР·С‹РІР°РµРј РўР— СЃ РЅРёРј
+
+            # Если пользователь авторизован, связываем ТЗ с ним
             from flask_login import current_user
             if current_user and current_user.is_authenticated:
                 tech_spec.client_id = current_user.id
-            
-            db.session.add(tech_spec)
-            db.session.commit()
-            
-            # РўР°РєР¶Рµ СЃРѕС…СЂР°РЅСЏРµРј Р»РёРґ РґР»СЏ СЃРѕРІРјРµСЃС‚РёРјРѕСЃС‚Рё СЃ СЃСѓС‰РµСЃС‚РІСѓСЋС‰РёРј РєРѕРґРѕРј
+
+            # Также сохраняем лид для совместимости с существующим кодом
             lead = Lead(
-                name=contact_info['name'],
-                email=contact_info['email'],
-                phone=contact_info['phone'],
+                name=form_data.get('contact_name', 'Not provided'),
+                email=form_data.get('contact_email', 'Not provided'),
+                phone=form_data.get('contact_phone', 'Not provided'),
                 company=form_data.get('company_name'),
                 message='Tech spec submission',
                 data=json.dumps({'questionnaire': form_data}, ensure_ascii=False),
                 source='services_form',
                 created_at=datetime.utcnow()
             )
+            db.session.add(tech_spec)
             db.session.add(lead)
-            db.session.commit()
-            
-            current_app.logger.info(f"Tech spec saved to database with ID {tech_spec.id}")
-        except Exception as db_err:
-            current_app.logger.error(f"Tech spec save failed: {db_err}")
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent request with the same key committed first
+                db.session.rollback()
+                duplicate = _stored_questionnaire(keys)
+                if duplicate is None:
+                    raise
+            else:
+                current_app.logger.info(f"Tech spec saved to database with ID {tech_spec.id}")
+                # 3) Уведомления — фоновая работа по id заявки
+                queue_questionnaire_notifications(tech_spec, form_data)
+
+        if duplicate is not None:
+            current_app.logger.info(f"Duplicate questionnaire submission (tech spec {duplicate.id}); nothing stored")
+            # The first request may have died between its commit and queueing the
+            # notifications; both outboxes dedupe on tech_spec:<id>, so queue again
+            queue_questionnaire_notifications(duplicate, form_data)
 
         flash('Your request has been submitted successfully. We will contact you soon.', 'success')
         return redirect(url_for('pages.services'))
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.exception(f"Questionnaire submit error: {e}")
         flash('Something went wrong while submitting the form. Please try again later.', 'danger')
         return redirect(url_for('pages.services'))
     
-def send_questionnaire_notification(form_data):
-    """Send email notification to admin about new questionnaire submission."""
-    try:
-        mail = Mail(current_app)
-        
-        # Get admin email
-        admin = AdminUser.query.first()
-        if not admin or not admin.email:
-            current_app.logger.warning("No admin email found for notification")
-            return
-            
-        # Format the email content
-        project_type = form_data.get('project_type', 'Not specified')
-        contact_name = form_data.get('contact_name', 'Not provided')
-        contact_email = form_data.get('contact_email', 'Not provided')
-        
-        subject = f"New Project Questionnaire: {project_type}"
-        
-        # Create an HTML message with the form data
-        html_content = f"""
-        <h1>New Project Questionnaire Submission</h1>
-        <p><strong>Submitted on:</strong> {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC</p>
-        <p><strong>Contact:</strong> {contact_name} ({contact_email})</p>
-        <p><strong>Project Type:</strong> {project_type}</p>
-        
-        <h2>Project Details</h2>
-        <ul>
-            <li><strong>Project Goal:</strong> {form_data.get('project_goal', 'Not provided')}</li>
-            <li><strong>Target Users:</strong> {form_data.get('target_users', 'Not provided')}</li>
-            <li><strong>Timeline:</strong> {form_data.get('timeline', 'Not specified')}</li>
-            <li><strong>Budget Range:</strong> {form_data.get('budget_range', 'Not specified')}</li>
-        </ul>
-        
-        <p>Login to the admin dashboard to view the full questionnaire details.</p>
-        """
-        
-        msg = Message(
-            subject=subject,
-            recipients=[admin.email],
-            html=html_content,
-            sender=current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@andrii-it.com')
-        )
-        
-        mail.send(msg)
-        current_app.logger.info(f"Questionnaire notification sent to {admin.email}")
-    except Exception as e:
-        current_app.logger.error(f"Failed to send questionnaire notification: {str(e)}")
-        raise
+def send_questionnaire_notification(form_data, dedupe_key=None):
+    """Queue an email notification to the admin about a new questionnaire submission."""
+    # Get admin email
+    admin = AdminUser.query.first()
+    if not admin or not admin.email:
+        current_app.logger.warning("No admin email found for notification")
+        return None
+
+    # Format the email content (user input is HTML-escaped)
+    from app.services.notification_renderer import render_questionnaire_email
+    subject, html_content = render_questionnaire_email(form_data)
+
+    # Delivered by the mail outbox sender; the request does not wait on SMTP
+    mail_id = queue_mail(subject, admin.email, html=html_content, dedupe_key=dedupe_key)
+    current_app.logger.info(f"Questionnaire notification for {admin.email} queued as mail {mail_id}")
+    return mail_id
 
 def send_tech_spec_email_notification(tech_spec_data: dict, contact_info: dict):
-    """Send email notification about technical specification submission."""
-    try:
-        mail = Mail(current_app)
-        
-        # Get admin email
-        admin = AdminUser.query.first()
-        if not admin or not admin.email:
-            current_app.logger.warning("No admin email found for tech spec notification")
-            return
-            
-        # Format the email content
-        subject = f"New Technical Specification: {contact_info.get('name', 'Unknown')}"
-        
-        html_content = f"""
-        <h1>New Technical Specification Submission</h1>
-        <p><strong>Submitted on:</strong> {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC</p>
-        
-        <h2>Contact Information</h2>
-        <ul>
-            <li><strong>Name:</strong> {contact_info.get('name', 'Not provided')}</li>
-            <li><strong>Email:</strong> {contact_info.get('email', 'Not provided')}</li>
-            <li><strong>Phone:</strong> {contact_info.get('phone', 'Not provided')}</li>
-        </ul>
-        
-        <h2>Technical Specification Details</h2>
-        """
-        
-        # Add each answer
-        for i, answer in enumerate(tech_spec_data.get('answers', [])):
-            html_content += f"""
-            <h3>{i+1}. {answer.get('question', 'Question')}</h3>
-            <p>{answer.get('answer', 'No answer')}</p>
-            """
-        
-        html_content += """
-        <p>Please review the technical specification and contact the client as soon as possible.</p>
-        <p>Login to the admin dashboard to view the full details.</p>
-        """
-        
-        msg = Message(
-            subject=subject,
-            recipients=[admin.email],
-            html=html_content,
-            sender=current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@andrii-it.com')
-        )
-        
-        mail.send(msg)
-        current_app.logger.info(f"Tech spec email notification sent to {admin.email}")
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to send tech spec email notification: {str(e)}")
-        raise
+    """Queue an email notification to the admin about a technical specification submission."""
+    # Get admin email
+    admin = AdminUser.query.first()
+    if not admin or not admin.email:
+        current_app.logger.warning("No admin email found for tech spec notification")
+        return None
+
+    from app.services.notification_renderer import render_tech_spec_email
+    subject, html_content = render_tech_spec_email(tech_spec_data, contact_info)
+
+    mail_id = queue_mail(subject, admin.email, html=html_content)
+    current_app.logger.info(f"Tech spec email notification for {admin.email} queued as mail {mail_id}")
+    return mail_id
 
 @pages_bp.route('/pricing')
 def pricing():
@@ -441,18 +342,20 @@ def contact():
                 # Send notification via Telegram
                 try:
                     from app.services import send_contact_form_notification
+                    from app.utils.telegram_queue import queue_telegram_message
                     tg_data = {
                         'name': name,
                         'email': email,
                         'message': message
                     }
-                    ok = send_contact_form_notification(tg_data)
+                    ok = queue_telegram_message(
+                        send_contact_form_notification(tg_data, return_message_only=True)
+                    )
                     if ok:
-                        current_app.logger.info(f"Telegram contact notification sent for {email}")
+                        current_app.logger.info(f"Telegram contact notification queued for {email}")
                     else:
                         current_app.logger.error(
-                            f"Telegram contact notification FAILED (returned False) for {email}. "
-                            "Check TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID env vars on Render."
+                            f"Telegram contact notification could not be queued for {email}."
                         )
                 except Exception as e:
                     current_app.logger.error(f"Telegram contact notification exception: {e}", exc_info=True)
@@ -506,6 +409,11 @@ def blog_post(slug):
 @pages_bp.route('/blog/category/<category>')
 @pages_bp.route('/blog/category/<category>/page/<int:page>')
 def blog_category(category, page=1):
+    # The first rule is the URL of blog.category itself and is registered first:
+    # redirecting to it would loop, so serve the listing here.
+    if '/page/' not in request.path:
+        from app.routes.blog import category as view
+        return view(category)
     params = dict(request.args)
     if page and page != 1:
         params['page'] = page
@@ -514,6 +422,11 @@ def blog_category(category, page=1):
 @pages_bp.route('/blog/tag/<tag>')
 @pages_bp.route('/blog/tag/<tag>/page/<int:page>')
 def blog_tag(tag, page=1):
+    # The first rule is the URL of blog.tag itself and is registered first:
+    # redirecting to it would loop, so serve the listing here.
+    if '/page/' not in request.path:
+        from app.routes.blog import tag as view
+        return view(tag)
     params = dict(request.args)
     if page and page != 1:
         params['page'] = page
@@ -521,7 +434,9 @@ def blog_tag(tag, page=1):
 
 @pages_bp.route('/blog/search')
 def blog_search():
-    params = dict(request.args)
-    return redirect(url_for('blog.search', **params), code=302)
+    # Same URL as blog.search, and this rule is registered first: redirecting
+    # to it would loop, so serve the search here.
+    from app.routes.blog import search
+    return search()
 
 
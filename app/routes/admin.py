@@ -6,6 +6,8 @@ from app.models import BlogPost, BlogCategory, BlogTag, User, PricePackage, Stri
 from app.models.project import Project, ProjectTask, ProjectUpdate
 from app.models.tech_spec_submission import TechSpecSubmission
 from app.auth import AdminUser
+from app.services.blog_listing import admin_row_options
+from sqlalchemy.orm import selectinload, undefer
 import json
 import string
 import random
@@ -52,7 +54,7 @@ def dashboard():
     from sqlalchemy import func
     
     # Basic counts
-    recent_posts = BlogPost.query.order_by(BlogPost.created_at.desc()).limit(5).all()
+    recent_posts = BlogPost.query.options(*admin_row_options()).order_by(BlogPost.created_at.desc()).limit(5).all()
     post_count = BlogPost.query.count()
     category_count = BlogCategory.query.count()
     tag_count = BlogTag.query.count()
@@ -80,10 +82,12 @@ def dashboard():
     
     # Tech spec submissions stats
     from app.models.tech_spec_submission import TechSpecSubmission
-    techspec_total = TechSpecSubmission.query.count()
+    # Drafts are chat briefs still being filled in (spec_service.update_draft)
+    submitted_specs = TechSpecSubmission.query.filter(TechSpecSubmission.status != 'draft')
+    techspec_total = submitted_specs.count()
     techspec_new = TechSpecSubmission.query.filter_by(status='new').count()
     techspec_estimated = TechSpecSubmission.query.filter_by(status='estimated').count()
-    recent_specs = TechSpecSubmission.query.order_by(TechSpecSubmission.created_at.desc()).limit(5).all()
+    recent_specs = submitted_specs.order_by(TechSpecSubmission.created_at.desc()).limit(5).all()
     
     return render_template(
         'admin/dashboard.html', 
@@ -112,7 +116,7 @@ def blog_posts():
         return redirect(url_for('admin.dashboard'))
         
     page = request.args.get('page', 1, type=int)
-    posts = BlogPost.query.order_by(BlogPost.created_at.desc()).paginate(
+    posts = BlogPost.query.options(*admin_row_options()).order_by(BlogPost.created_at.desc()).paginate(
         page=page, per_page=10, error_out=False
     )
     return render_template('admin/blog_posts.html', posts=posts)
@@ -294,6 +298,17 @@ def test_telegram():
     return redirect(url_for('admin.dashboard'))
 
 
+@admin.route('/runtime-stats')
+@login_required
+def runtime_stats():
+    """LLM executor, OpenAI circuit breaker and Telegram dispatcher/outbox stats (JSON)."""
+    if not current_user.is_admin:
+        return jsonify({'error': 'forbidden'}), 403
+    from app.services.llm_executor import stats as llm_stats
+    from app.services.openai_client import stats as openai_stats
+    from app.utils.telegram_dispatcher import stats as telegram_stats
+    return jsonify({'llm': llm_stats(), 'openai': openai_stats(), 'telegram': telegram_stats()})
+
 @admin.route('/blog/categories')
 @login_required
 def blog_categories():
@@ -402,7 +417,7 @@ def export_blog_json():
         raise TypeError(f"Type {type(obj)} not serializable")
     
     # Get all data
-    posts = BlogPost.query.all()
+    posts = BlogPost.query.options(undefer(BlogPost.content), selectinload(BlogPost.tags)).all()
     categories = BlogCategory.query.all()
     tags = BlogTag.query.all()
     
@@ -793,7 +808,9 @@ def tech_specs():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('admin.dashboard'))
     
-    submissions = TechSpecSubmission.query.order_by(TechSpecSubmission.created_at.desc()).all()
+    submissions = (TechSpecSubmission.query
+                   .filter(TechSpecSubmission.status != 'draft')
+                   .order_by(TechSpecSubmission.created_at.desc()).all())
     return render_template('admin/tech_specs.html', submissions=submissions)
 
 @admin.route('/tech-spec/<int:spec_id>', methods=['GET', 'POST'])
@@ -960,7 +977,7 @@ def project_detail(project_id):
 def send_estimate_notification(submission):
     """Send Telegram alert to admin when an estimate is saved for a spec."""
     try:
-        from app.services.telegram_service import send_telegram_message
+        from app.utils.telegram_queue import queue_telegram_message
         msg = (
             f"💰 <b>Estimate set for spec #{submission.id}</b>\n\n"
             f"<b>Contact:</b> {submission.contact_name} &lt;{submission.contact_email}&gt;\n"
@@ -970,7 +987,7 @@ def send_estimate_notification(submission):
             f"<b>Timeline:</b> {submission.estimated_timeline or '—'}\n"
             "<i>Client has NOT been notified automatically — contact them directly.</i>"
         )
-        send_telegram_message(msg)
+        queue_telegram_message(msg)
     except Exception as exc:
         current_app.logger.error(f"send_estimate_notification failed: {exc}")
 
@@ -979,6 +996,9 @@ def send_welcome_email(user, temp_password):
     """
     Send the client's temporary password to the admin via Telegram so it is not lost.
     (Real email delivery requires SMTP config — add Flask-Mail later when SMTP is set up.)
+
+    Sent directly, not through the Telegram outbox: the outbox keeps message
+    text on disk after delivery, and a credential must not be stored.
     """
     try:
         from app.services.telegram_service import send_telegram_message
@@ -989,7 +1009,8 @@ def send_welcome_email(user, temp_password):
             f"<b>Temp password:</b> <code>{temp_password}</code>\n\n"
             "<i>Please send these credentials to the client manually.</i>"
         )
-        send_telegram_message(msg)
+        if not send_telegram_message(msg):
+            raise RuntimeError("Telegram delivery failed")
         current_app.logger.info(f"Welcome credentials for {user.email} sent to admin via Telegram.")
     except Exception as exc:
         current_app.logger.error(f"send_welcome_email (Telegram) failed: {exc}")
@@ -997,10 +1018,15 @@ def send_welcome_email(user, temp_password):
         current_app.logger.warning(f"TEMP PASSWORD for {user.email}: {temp_password}")
 
 def send_project_update_notification(project, update):
-    """Отправка уведомления об обновлении проекта"""
-    # Здесь можно реализовать отправку email
-    current_app.logger.info(f"Project update notification would be sent to client {project.client.email if project.client else 'unknown'}")
-    # Intentionally no return; this is a side-effect function.
+    """Отправка уведомления об обновлении проекта (через очередь писем, без ожидания SMTP)"""
+    if not project.client or not project.client.email:
+        current_app.logger.warning(f"Project {project.id} has no client email; update notification skipped")
+        return
+    from app.services.notification_renderer import render_project_update_email
+    from app.utils.mail_queue import queue_mail
+    subject, html_content = render_project_update_email(project, update)
+    mail_id = queue_mail(subject, project.client.email, html=html_content)
+    current_app.logger.info(f"Project update notification for {project.client.email} queued as mail {mail_id}")
 
 
 # Payment management routes
@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, abort, g
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, abort, g
 from app.models import BlogPost, BlogCategory, BlogTag
 from app import db
-from sqlalchemy import desc, func
-from sqlalchemy.orm import joinedload, selectinload
+from app.services.blog_listing import card_options
+from app.services.blog_search import search_posts
+from app.services import image_variants, media_store
+from app.utils import image_cache
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import joinedload, selectinload, undefer
 import time
 
 blog = Blueprint('blog', __name__, url_prefix='/blog')
@@ -48,10 +52,7 @@ def get_sidebar_data():
 def index():
     """Main blog index page with pagination."""
     page = request.args.get('page', 1, type=int)
-    posts_query = BlogPost.query.options(
-        joinedload(BlogPost.category),
-        selectinload(BlogPost.tags),
-    ).filter_by(published=True)
+    posts_query = BlogPost.query.options(*card_options()).filter_by(published=True)
     posts_query = _apply_locale_filter(posts_query)
 
     posts = posts_query.order_by(
@@ -86,13 +87,11 @@ def post(slug):
     post = BlogPost.query.options(
         joinedload(BlogPost.category),
         selectinload(BlogPost.tags),
+        undefer(BlogPost.content),
     ).filter_by(slug=slug, published=True).first_or_404()
     
     # Get related posts (same category or tag)
-    related_query = BlogPost.query.options(
-        joinedload(BlogPost.category),
-        selectinload(BlogPost.tags),
-    ).filter(
+    related_query = BlogPost.query.options(*card_options(teaser=True)).filter(
         BlogPost.id != post.id,
         BlogPost.published == True,
         (
@@ -112,10 +111,7 @@ def category(slug):
     category = BlogCategory.query.filter_by(slug=slug).first_or_404()
     page = request.args.get('page', 1, type=int)
     
-    posts_query = BlogPost.query.options(
-        joinedload(BlogPost.category),
-        selectinload(BlogPost.tags),
-    ).filter_by(
+    posts_query = BlogPost.query.options(*card_options()).filter_by(
         published=True, 
         category_id=category.id
     )
@@ -144,10 +140,7 @@ def tag(slug):
     tag = BlogTag.query.filter_by(slug=slug).first_or_404()
     page = request.args.get('page', 1, type=int)
     
-    posts_query = BlogPost.query.options(
-        joinedload(BlogPost.category),
-        selectinload(BlogPost.tags),
-    ).filter(
+    posts_query = BlogPost.query.options(*card_options()).filter(
         BlogPost.published == True,
         BlogPost.tags.any(BlogTag.id == tag.id)
     )
@@ -179,23 +172,8 @@ def search():
     if not query:
         return redirect(url_for('blog.index'))
     
-    # Search in title, content and excerpt
-    posts_query = BlogPost.query.options(
-        joinedload(BlogPost.category),
-        selectinload(BlogPost.tags),
-    ).filter(
-        BlogPost.published == True,
-        (
-            BlogPost.title.ilike(f'%{query}%') | 
-            BlogPost.content.ilike(f'%{query}%') | 
-            BlogPost.excerpt.ilike(f'%{query}%')
-        )
-    )
-    posts_query = _apply_locale_filter(posts_query)
-
-    posts = posts_query.order_by(
-        desc(BlogPost.created_at)
-    ).paginate(page=page, per_page=6, error_out=False)
+    # Ranked full-text search with highlighted snippets
+    posts = search_posts(query, german=_use_german_posts(), page=page)
     
     # Get cached categories and tags for sidebar.
     categories, tags = get_sidebar_data()
@@ -210,36 +188,74 @@ def search():
         current_tag=None
     )
 
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'public, max-age=3600'
+
+
+def _send_image(digest, path=None, data=None, immutable=False, last_modified=None):
+    """Image response with a strong ETag (the content hash); answers 304 itself."""
+    from flask import make_response, send_file
+
+    if path is not None:
+        response = send_file(path, mimetype=image_cache.sniff_mime(image_cache.read_head(path)),
+                             etag=digest, conditional=True, last_modified=last_modified)
+    else:
+        response = make_response(data)
+        response.headers.set('Content-Type', image_cache.sniff_mime(data[:16]))
+        response.set_etag(digest)
+        response.last_modified = last_modified
+        response = response.make_conditional(request)
+    response.headers.set('Cache-Control', IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE)
+    return response
+
+
 @blog.route('/image/<int:post_id>')
 def get_image(post_id):
     """Serve blog post image with deploy-safe fallback order."""
     from flask import make_response, redirect
-    
-    post = db.session.get(BlogPost, post_id)
-    if post is None:
+
+    version = request.args.get('v', '')
+
+    # 0) Content-hash URL already on disk: no database round trip at all
+    cached_path = image_cache.get(version)
+    if cached_path:
+        return _send_image(version, path=cached_path, immutable=True)
+
+    row = db.session.execute(
+        select(
+            BlogPost.image_hash,
+            BlogPost.updated_at,
+            BlogPost.image_url,
+            BlogPost.original_image_url,
+        ).where(BlogPost.id == post_id)
+    ).first()
+    if row is None:
         abort(404)
 
     # 1) Serve persisted binary image first (stable across deploys)
-    if post.image_data:
-        data = post.image_data
-        if data[:8] == b'\x89PNG\r\n\x1a\n':
-            mime = 'image/png'
-        elif data[:2] == b'\xff\xd8':
-            mime = 'image/jpeg'
-        elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
-            mime = 'image/webp'
-        elif data[:6] in (b'GIF87a', b'GIF89a'):
-            mime = 'image/gif'
-        else:
-            mime = 'image/png'
+    if row.image_hash:
+        digest = row.image_hash
+        immutable = version == digest
+        if digest in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(digest)
+            response.headers.set('Cache-Control', IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE)
+            return response
 
-        response = make_response(data)
-        response.headers.set('Content-Type', mime)
-        response.headers.set('Cache-Control', 'public, max-age=31536000')
-        return response
+        path = image_cache.get(digest)
+        if path is None:
+            # Only the blob column, once; afterwards the bytes come from disk
+            data = media_store.get_data(digest)
+            if data is None:
+                abort(404)
+            path = image_cache.put(digest, data)
+            if path is None:
+                return _send_image(digest, data=data, immutable=immutable, last_modified=row.updated_at)
+        return _send_image(digest, path=path, immutable=immutable)
 
     # 2) Fallback to image_url (remote URL or static path)
-    image_url = (post.image_url or '').strip()
+    image_url = (row.image_url or '').strip()
     if image_url:
         if image_url.startswith('http://') or image_url.startswith('https://'):
             return redirect(image_url, code=302)
@@ -249,8 +265,57 @@ def get_image(post_id):
             return redirect(f'/{image_url}', code=302)
 
     # 3) Last fallback to original temporary image URL if present
-    original_image_url = (post.original_image_url or '').strip()
+    original_image_url = (row.original_image_url or '').strip()
     if original_image_url.startswith('http://') or original_image_url.startswith('https://'):
         return redirect(original_image_url, code=302)
 
     return redirect(url_for('static', filename='img/blog/default-post.jpg'), code=302)
+
+
+@blog.route('/image/<int:post_id>/<name>.<fmt>')
+def get_image_variant(post_id, name, fmt):
+    """Serve a resized variant (card/hero/og) of the post image, rendering it on first use."""
+    from flask import redirect
+
+    spec = image_variants.SPECS.get(name)
+    if spec is None or fmt not in spec.formats:
+        abort(404)
+    version = request.args.get('v', '')
+
+    # Content-hash URL already on disk: no database round trip at all
+    if image_cache.is_hash(version):
+        key = image_cache.derived_key(version, f'{name}.{fmt}')
+        cached_path = image_cache.get(key)
+        if cached_path:
+            return _send_image(key, path=cached_path, immutable=True)
+
+    digest = db.session.execute(
+        select(BlogPost.image_hash).where(BlogPost.id == post_id)
+    ).scalar()
+    if not digest or fmt not in image_variants.wanted(spec):
+        # No stored image (or no encoder for the format): the original route has the fallbacks
+        return redirect(url_for('blog.get_image', post_id=post_id, v=digest or None), code=302)
+
+    key = image_cache.derived_key(digest, f'{name}.{fmt}')
+    immutable = version == digest
+    path = image_cache.get(key)
+    if path is None:
+        data = image_variants.variant_data(post_id, name, fmt, digest)
+        if data is None:
+            # Only the requested variant: the rest are rendered when asked for
+            # (or by `flask blog-images backfill`), so a list page's first view
+            # does not encode every size and format in the request threads
+            try:
+                image_variants.generate_for_post(post_id, only=[(name, fmt)])
+            except Exception as exc:
+                # Undecodable or hostile original: serve it the usual way
+                db.session.rollback()
+                current_app.logger.warning(f"Image variant {name}.{fmt} of post {post_id} failed: {exc}")
+                return redirect(url_for('blog.get_image', post_id=post_id, v=digest), code=302)
+            data = image_variants.variant_data(post_id, name, fmt, digest)
+        if data is None:
+            abort(404)
+        path = image_cache.put(key, data)
+        if path is None:
+            return _send_image(key, data=data, immutable=immutable)
+    return _send_image(key, path=path, immutable=immutable)
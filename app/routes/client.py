@@ -51,7 +51,9 @@ def dashboard():
         p.status_display = status_display.get(p.status, p.status.title() if p.status else '—')
     
     # Получаем все заявки клиента
-    submissions = TechSpecSubmission.query.filter_by(client_id=current_user.id).all()
+    submissions = (TechSpecSubmission.query
+                   .filter_by(client_id=current_user.id)
+                   .filter(TechSpecSubmission.status != 'draft').all())
     
     # Получаем последние обновления всех проектов
     project_ids = [project.id for project in projects]
@@ -11,6 +11,7 @@ from openai import OpenAI
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import db
+from app.services.openai_client import get_client
 from app.models.assistant_thread import AssistantThread
 from app.models.chat_message import ChatMessage
 
@@ -24,7 +25,7 @@ def _client() -> OpenAI:
     api_key = current_app.config.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY не налаштований")
-    return OpenAI(api_key=api_key)
+    return get_client(api_key)
 
 def _get_cfg(name: str, default: Optional[str] = None) -> Optional[str]:
     return current_app.config.get(name) or os.getenv(name, default)
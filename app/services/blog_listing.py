@@ -0,0 +1,80 @@
+"""
+blog_listing.py
+
+Loader options for pages that list blog posts.
+
+A blog card shows title, excerpt, date, category, tags and the picture; an
+admin table row shows even less. Loading whole BlogPost entities for them
+pulled every post's full article body along with the row. BlogPost.content is
+now deferred by default and image bytes live in media_blobs, so a plain
+entity load no longer carries them, but a listing still loads the few columns
+it renders and nothing else:
+
+  card_options()       blog index/category/tag/search cards and related posts
+  admin_row_options()  admin post table and the dashboard's recent posts
+
+Both use load_only(..., raiseload=True): a template that starts reading a
+column outside the projection fails loudly instead of issuing one lazy load
+per card. Whether a card has a picture comes from BlogPost.has_image, a SQL
+expression over image_hash/image_url. Cards of posts without an excerpt can
+ask for `teaser`, the first TEASER_CHARS characters of the body cut off in
+SQL, instead of the whole body.
+
+Settings (env):
+  BLOG_TEASER_CHARS   characters of the body fetched for a teaser (default 600)
+"""
+from __future__ import annotations
+
+import os
+from typing import List
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only, selectinload, with_expression
+
+from app.models import BlogCategory, BlogPost, BlogTag
+
+TEASER_CHARS = int(os.getenv('BLOG_TEASER_CHARS', '600'))
+
+# Columns a blog card renders (templates blog/*.html, macros/images.html)
+CARD_COLUMNS = (
+    BlogPost.id,
+    BlogPost.slug,
+    BlogPost.title,
+    BlogPost.excerpt,
+    BlogPost.image_hash,
+    BlogPost.image_placeholder,
+    BlogPost.has_image,
+    BlogPost.published,
+    BlogPost.created_at,
+    BlogPost.category_id,
+)
+
+# Columns of a row in admin/blog_posts.html and admin/dashboard.html
+ADMIN_ROW_COLUMNS = (
+    BlogPost.id,
+    BlogPost.slug,
+    BlogPost.title,
+    BlogPost.published,
+    BlogPost.created_at,
+    BlogPost.category_id,
+)
+
+
+def card_options(teaser: bool = False) -> List:
+    """Options for a query of BlogPost cards (with category and tags)."""
+    options = [
+        load_only(*CARD_COLUMNS, raiseload=True),
+        joinedload(BlogPost.category).load_only(BlogCategory.name, BlogCategory.slug),
+        selectinload(BlogPost.tags).load_only(BlogTag.name, BlogTag.slug),
+    ]
+    if teaser:
+        options.append(with_expression(BlogPost.teaser, func.substr(BlogPost.content, 1, TEASER_CHARS)))
+    return options
+
+
+def admin_row_options() -> List:
+    """Options for a query of BlogPost rows in the admin tables."""
+    return [
+        load_only(*ADMIN_ROW_COLUMNS, raiseload=True),
+        joinedload(BlogPost.category).load_only(BlogCategory.name),
+    ]
@@ -0,0 +1,270 @@
+"""
+blog_search.py
+
+Full-text search over published blog posts.
+
+PostgreSQL: blog_posts.search_vector is a stored generated tsvector (title
+weight A, excerpt B, content C) with a GIN index. The text search config is
+chosen per row by the slug convention the blog already uses: posts whose slug
+ends in '-de' are parsed with 'german', all others with 'english', so German
+words are stemmed as German. A search parses the visitor's input with
+websearch_to_tsquery in the config of the current locale, ranks with
+ts_rank_cd and highlights the page's rows with ts_headline.
+
+SQLite (dev.db): blog_posts_fts is an external-content FTS5 table over the
+same three columns, kept in step with blog_posts by triggers; results are
+ranked by bm25() with the same column weights and highlighted with snippet().
+Each word of the query is matched as a prefix.
+
+Both paths answer from the index, so the result count and a results page no
+longer scan every post's content the way ILIKE '%q%' did. Backends without
+either (or SQLite built without FTS5) keep the ILIKE scan.
+
+The PostgreSQL column and index are created only by the add_blog_post_search
+migration: adding a stored generated column rewrites blog_posts under an
+ACCESS EXCLUSIVE lock, which has no place in app startup. ensure_search_index()
+(run by init_database_schema() at startup) just checks that search_vector is
+there and otherwise leaves PostgreSQL on the ILIKE scan; on SQLite it creates
+the FTS table and triggers when missing, as the migration does.
+"""
+from __future__ import annotations
+
+import html
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from markupsafe import Markup
+from sqlalchemy import desc, inspect, text
+
+from app import db
+from app.models import BlogPost
+from app.services.blog_listing import card_options
+
+logger = logging.getLogger(__name__)
+
+PER_PAGE = 6
+FTS_TABLE = 'blog_posts_fts'
+
+# bm25() column weights for FTS5, mirroring the tsvector weights A/B/C
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+# Highlight markers: control characters cannot come from the posts' HTML, so
+# the snippet can be escaped as a whole and the markers turned into <mark>.
+_START, _END = '\x02', '\x03'
+_HEADLINE_OPTIONS = (f'StartSel={_START}, StopSel={_END}, MaxWords=30, MinWords=12, '
+                     f'MaxFragments=2, FragmentDelimiter=" … "')
+_TAG_RE = re.compile(r'<[^>]*>')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# ── schema ────────────────────────────────────────────────────────────────────
+
+SQLITE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, excerpt, content, content='blog_posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON blog_posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, excerpt, content) "
+    "VALUES (new.id, new.title, new.excerpt, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON blog_posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, excerpt, content) "
+    "VALUES ('delete', old.id, old.title, old.excerpt, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, excerpt, content ON blog_posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, excerpt, content) "
+    "VALUES ('delete', old.id, old.title, old.excerpt, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, excerpt, content) "
+    "VALUES (new.id, new.title, new.excerpt, new.content); END",
+)
+
+# engine url → 'postgresql' | 'fts5' | 'like'
+_backends: Dict[str, str] = {}
+
+
+def _table_name() -> str:
+    return BlogPost.__table__.fullname
+
+
+def ensure_search_index(engine=None) -> str:
+    """
+    Pick the search backend: PostgreSQL uses search_vector when the migration
+    has added it (no DDL here), SQLite gets its FTS5 table created if missing.
+    """
+    engine = engine or db.engine
+    dialect = engine.dialect.name
+    backend = 'like'
+    try:
+        if dialect == 'postgresql':
+            table = BlogPost.__table__
+            columns = {c['name'] for c in inspect(engine).get_columns(table.name, schema=table.schema)}
+            if 'search_vector' in columns:
+                backend = 'postgresql'
+            else:
+                logger.warning("blog_posts.search_vector is missing (run `flask db upgrade`), using ILIKE search")
+        elif dialect == 'sqlite':
+            with engine.begin() as conn:
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE},
+                ).first() is not None
+                for statement in SQLITE_FTS_DDL:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Index the posts written before the triggers existed
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            backend = 'fts5'
+    except Exception as exc:
+        logger.warning(f"Full-text search index unavailable on {dialect}, using ILIKE search: {exc}")
+        backend = 'like'
+    _backends[str(engine.url)] = backend
+    return backend
+
+
+def search_backend(engine=None) -> str:
+    engine = engine or db.engine
+    backend = _backends.get(str(engine.url))
+    if backend is None:
+        backend = ensure_search_index(engine)
+    return backend
+
+
+# ── results ───────────────────────────────────────────────────────────────────
+
+@dataclass
+class SearchResults:
+    """One page of hits; quacks like the Pagination the blog templates use."""
+    items: List[BlogPost]
+    total: int
+    page: int
+    per_page: int = PER_PAGE
+    snippets: Dict[int, Markup] = field(default_factory=dict)
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page)) if self.total else 0
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def prev_num(self) -> Optional[int]:
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.pages
+
+    @property
+    def next_num(self) -> Optional[int]:
+        return self.page + 1 if self.has_next else None
+
+
+def highlight(snippet: Optional[str]) -> Optional[Markup]:
+    """Snippet with markers → escaped text with <mark> around the matches."""
+    if not snippet:
+        return None
+    plain = _TAG_RE.sub(' ', snippet)
+    # A fragment may start or end inside a tag
+    plain = re.sub(r'<[^>]*$', '', re.sub(r'^[^<]*?>', '', plain))
+    plain = ' '.join(html.unescape(plain).split())
+    escaped = html.escape(plain, quote=False)
+    return Markup(escaped.replace(_START, '<mark>').replace(_END, '</mark>'))
+
+
+def fts_match_expression(query: str) -> Optional[str]:
+    """Visitor input → FTS5 MATCH expression: every word, as a prefix, must occur."""
+    words = _WORD_RE.findall(query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _load_posts(ids: List[int]) -> List[BlogPost]:
+    if not ids:
+        return []
+    posts = BlogPost.query.options(*card_options()).filter(BlogPost.id.in_(ids)).all()
+    by_id = {post.id: post for post in posts}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _locale_clause(german: bool) -> str:
+    return "p.slug LIKE '%-de'" if german else "p.slug NOT LIKE '%-de'"
+
+
+# ── backends ──────────────────────────────────────────────────────────────────
+
+def _search_postgres(query: str, german: bool, page: int, per_page: int) -> SearchResults:
+    where = (f"FROM {_table_name()} p, websearch_to_tsquery(CAST(:config AS regconfig), :q) query "
+             f"WHERE p.published = :published AND {_locale_clause(german)} AND p.search_vector @@ query")
+    params = {'config': 'german' if german else 'english', 'q': query, 'published': True}
+    total = db.session.execute(text(f"SELECT count(*) {where}"), params).scalar() or 0
+    rows = db.session.execute(text(
+        "SELECT p.id, ts_headline(CAST(:config AS regconfig), "
+        "regexp_replace(coalesce(p.excerpt, '') || ' ' || coalesce(p.content, ''), '<[^>]*>', ' ', 'g'), "
+        f"query, :options) {where} "
+        "ORDER BY ts_rank_cd(p.search_vector, query) DESC, p.created_at DESC "
+        "LIMIT :limit OFFSET :offset"
+    ), {**params, 'options': _HEADLINE_OPTIONS, 'limit': per_page,
+        'offset': (page - 1) * per_page}).all() if total else []
+    return SearchResults(items=_load_posts([r[0] for r in rows]), total=total, page=page,
+                         per_page=per_page, snippets={r[0]: highlight(r[1]) for r in rows})
+
+
+def _search_fts5(query: str, german: bool, page: int, per_page: int) -> SearchResults:
+    match = fts_match_expression(query)
+    if match is None:
+        return SearchResults(items=[], total=0, page=page, per_page=per_page)
+    where = (f"FROM {FTS_TABLE} JOIN blog_posts p ON p.id = {FTS_TABLE}.rowid "
+             f"WHERE {FTS_TABLE} MATCH :match AND p.published = :published AND {_locale_clause(german)}")
+    params = {'match': match, 'published': True}
+    total = db.session.execute(text(f"SELECT count(*) {where}"), params).scalar() or 0
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    rows = db.session.execute(text(
+        f"SELECT p.id, snippet({FTS_TABLE}, -1, :start, :end, ' … ', 24) {where} "
+        f"ORDER BY bm25({FTS_TABLE}, {weights}), p.created_at DESC "
+        "LIMIT :limit OFFSET :offset"
+    ), {**params, 'start': _START, 'end': _END, 'limit': per_page,
+        'offset': (page - 1) * per_page}).all() if total else []
+    return SearchResults(items=_load_posts([r[0] for r in rows]), total=total, page=page,
+                         per_page=per_page, snippets={r[0]: highlight(r[1]) for r in rows})
+
+
+def _search_like(query: str, german: bool, page: int, per_page: int) -> SearchResults:
+    posts_query = BlogPost.query.options(*card_options()).filter(
+        BlogPost.published == True,
+        (
+            BlogPost.title.ilike(f'%{query}%') |
+            BlogPost.content.ilike(f'%{query}%') |
+            BlogPost.excerpt.ilike(f'%{query}%')
+        )
+    )
+    if german:
+        posts_query = posts_query.filter(BlogPost.slug.ilike('%-de'))
+    else:
+        posts_query = posts_query.filter(~BlogPost.slug.ilike('%-de'))
+    posts = posts_query.order_by(desc(BlogPost.created_at)).paginate(
+        page=page, per_page=per_page, error_out=False)
+    return SearchResults(items=list(posts.items), total=posts.total or 0, page=page, per_page=per_page)
+
+
+_SEARCHERS = {
+    'postgresql': _search_postgres,
+    'fts5': _search_fts5,
+    'like': _search_like,
+}
+
+
+def search_posts(query: str, german: bool = False, page: int = 1, per_page: int = PER_PAGE) -> SearchResults:
+    """Published posts of the locale matching `query`, best match first."""
+    page = max(1, page)
+    backend = search_backend()
+    try:
+        return _SEARCHERS[backend](query, german, page, per_page)
+    except Exception as exc:
+        if backend == 'like':
+            raise
+        logger.error(f"Full-text blog search failed ({backend}), falling back to ILIKE: {exc}")
+        db.session.rollback()
+        return _search_like(query, german, page, per_page)
@@ -1,7 +1,9 @@
 from flask import current_app
-import openai
 import logging
 
+from app.services import llm_executor
+from app.services.openai_client import get_client
+
 logger = logging.getLogger(__name__)
 
 def get_chat_response(messages, language='en'):
@@ -27,8 +29,8 @@ def get_chat_response(messages, language='en'):
         logger.info(f"OpenAI API key length: {len(api_key) if api_key else 0}")
         logger.info(f"OpenAI API key starts with: {api_key[:4] + '...' if api_key else 'None'}")
         
-        # Set up OpenAI client
-        openai.api_key = api_key
+        # Shared pooled client (app.services.openai_client)
+        client = get_client(api_key)
         
         # Get preferred model from config
         model = current_app.config.get('OPENAI_MODEL', 'gpt-4o-mini')
@@ -38,15 +40,19 @@ def get_chat_response(messages, language='en'):
         
         # Make the API call
         try:
-            response = openai.chat.completions.create(
+            response = llm_executor.run(
+                client.chat.completions.create,
                 model=model,
                 messages=messages,
                 temperature=0.7,
                 max_tokens=800
             )
+        except llm_executor.LLMBusyError:
+            raise
         except Exception as model_error:
             logger.warning(f"Error with primary model {model}: {str(model_error)}. Trying fallback model {fallback_model}")
-            response = openai.chat.completions.create(
+            response = llm_executor.run(
+                client.chat.completions.create,
                 model=fallback_model,
                 messages=messages,
                 temperature=0.7,
@@ -201,7 +201,7 @@ class ContentSchedulerService:
                 content=clean_icons_from_content(generated_content.content_en),
                 excerpt=strip_html(generated_content.meta_description_en),
                 image_url=generated_content.image_url,
-                image_data=generated_content.image_data,  # Сохраняем бинарные данные
+                image_hash=generated_content.image_hash,  # Та же картинка в media_blobs, без копии байтов
                 published=True,
                 author_id=generated_content.schedule.author_id,
                 category_id=generated_content.schedule.category_id,
@@ -216,7 +216,7 @@ class ContentSchedulerService:
                 content=clean_icons_from_content(generated_content.content_de),
                 excerpt=strip_html(generated_content.meta_description_de),
                 image_url=generated_content.image_url,
-                image_data=generated_content.image_data,  # Сохраняем бинарные данные
+                image_hash=generated_content.image_hash,  # Та же картинка в media_blobs, без копии байтов
                 published=True,
                 author_id=generated_content.schedule.author_id,
                 category_id=generated_content.schedule.category_id,
@@ -257,6 +257,15 @@ class ContentSchedulerService:
             generated_content.de_post_id = de_post.id
             generated_content.published_at = datetime.utcnow()
             db.session.commit()
+
+            # Уменьшенные варианты картинки для карточек/статьи/OG (DE-пост копирует их у EN)
+            try:
+                from app.services.image_variants import generate_for_post
+                for post in (en_post, de_post):
+                    generate_for_post(post.id)
+            except Exception as e:
+                logger.warning(f"Image variants deferred to first request: {str(e)}")
+                db.session.rollback()
             
             return en_post, de_post
             
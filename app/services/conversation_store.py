@@ -0,0 +1,81 @@
+"""
+conversation_store.py
+
+Server-side chat history in ChatMessage, keyed by conversation_id.
+
+The widget sends only the new message (and optionally the id of the last
+message it has seen); the server owns the transcript. Each turn costs one
+indexed read (load_history) and one batched write (append_turn).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from app import db
+from app.models.chat_message import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = 40  # messages read per turn; older context lives in the rolling summary
+
+
+def load_history(
+    conversation_id: Optional[str],
+    last_seen_id: Optional[int] = None,
+    limit: int = HISTORY_LIMIT,
+) -> List[Dict[str, Any]]:
+    """
+    Return the newest `limit` messages of a conversation, oldest first, as
+    [{id, role, content}]. With `last_seen_id` the read stops at what the
+    client has seen, so a second tab cannot shift the context mid-turn.
+    """
+    if not conversation_id or conversation_id == "anon":
+        return []
+    try:
+        query = (
+            db.session.query(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.conversation_id == conversation_id)
+        )
+        if last_seen_id:
+            query = query.filter(ChatMessage.id <= last_seen_id)
+        rows = query.order_by(ChatMessage.id.desc()).limit(limit).all()
+    except Exception as exc:
+        logger.warning(f"Could not load history for {conversation_id}: {exc}")
+        db.session.rollback()
+        return []
+    return [{"id": r.id, "role": r.role, "content": r.content} for r in reversed(rows)]
+
+
+def append_turn(
+    conversation_id: Optional[str],
+    user_text: Optional[str],
+    answer: Optional[str],
+    agent: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Persist the user message and the assistant answer in one commit.
+    Returns the id of the stored assistant message (the client's new last-seen id).
+    """
+    if not conversation_id or conversation_id == "anon":
+        return None
+
+    meta = {"agent": agent} if agent else None
+    rows = []
+    if user_text and user_text.strip():
+        rows.append(ChatMessage(conversation_id=conversation_id, role="user", content=user_text, meta=meta))
+    if answer and answer.strip():
+        rows.append(ChatMessage(conversation_id=conversation_id, role="assistant", content=answer, meta=meta))
+    if not rows:
+        return None
+
+    try:
+        db.session.add_all(rows)
+        db.session.flush()
+        last_id = rows[-1].id  # read before commit expires the instances
+        db.session.commit()
+        return last_id
+    except Exception as exc:
+        logger.warning(f"Could not append turn to {conversation_id}: {exc}")
+        db.session.rollback()
+        return None
@@ -0,0 +1,252 @@
+"""
+image_variants.py
+
+Responsive derivatives of blog post images.
+
+Generated post images are 1024×1024 PNGs of 1 MB and more; list pages showed
+them in 200px-high cards. Each post image gets a set of resized variants,
+stored next to the post in blog_image_variants and keyed by the image_hash of
+the original they were made from:
+
+  card-480, card-800    2:1 centre crop for list cards        AVIF + WebP
+  hero-768, hero-1024   original aspect for the article       AVIF + WebP
+  og                    1200×630 crop for link previews       JPEG
+
+plus a ~20px blurred WebP kept inline on the post as a data URI
+(BlogPost.image_placeholder) that cards show while the real image loads.
+
+Variants are made when content is published, by `flask blog-images
+backfill` for existing posts, or lazily on the first request for one
+(blog.get_image_variant). The EN and DE post of an article share their image,
+so variants already rendered for the same source hash are copied instead of
+encoded again. AVIF is produced only when the installed Pillow supports it.
+
+Settings (env):
+  IMAGE_VARIANT_QUALITY   WebP quality (default 75; AVIF uses 3/4 of it)
+"""
+from __future__ import annotations
+
+import base64
+import io
+import logging
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.blog import BlogImageVariant, BlogPost
+from app.services import media_store
+
+try:
+    from PIL import Image, ImageFilter, ImageOps, features
+except ImportError:  # pragma: no cover - Pillow is in requirements.txt
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', '75'))
+PLACEHOLDER_WIDTH = 20
+
+
+@dataclass(frozen=True)
+class VariantSpec:
+    name: str
+    width: int
+    height: Optional[int]  # None keeps the aspect ratio; otherwise centre crop
+    formats: Tuple[str, ...]
+
+
+_MODERN = ('avif', 'webp')
+
+SPECS: Dict[str, VariantSpec] = {spec.name: spec for spec in (
+    VariantSpec('card-480', 480, 240, _MODERN),
+    VariantSpec('card-800', 800, 400, _MODERN),
+    VariantSpec('hero-768', 768, None, _MODERN),
+    VariantSpec('hero-1024', 1024, None, _MODERN),
+    VariantSpec('og', 1200, 630, ('jpeg',)),
+)}
+
+# srcset groups used by the templates
+SRCSETS: Dict[str, Tuple[str, ...]] = {
+    'card': ('card-480', 'card-800'),
+    'hero': ('hero-768', 'hero-1024'),
+}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def available() -> bool:
+    return Image is not None
+
+
+@lru_cache(maxsize=None)
+def supported_formats() -> Tuple[str, ...]:
+    """Modern formats this Pillow can encode, best first."""
+    if Image is None:
+        return ()
+    return tuple(fmt for fmt in _MODERN if features.check(fmt))
+
+
+def wanted(spec: VariantSpec) -> Tuple[str, ...]:
+    """Formats of `spec` this host can produce (none without Pillow)."""
+    if Image is None:
+        return ()
+    modern = supported_formats()
+    return tuple(fmt for fmt in spec.formats if fmt == 'jpeg' or fmt in modern)
+
+
+# ── encoding ──────────────────────────────────────────────────────────────────
+
+def _encode(img, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == 'jpeg':
+        img.convert('RGB').save(buf, 'JPEG', quality=82, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        img.save(buf, 'WEBP', quality=QUALITY, method=4)
+    else:
+        img.save(buf, 'AVIF', quality=QUALITY * 3 // 4, speed=6)
+    return buf.getvalue()
+
+
+def _resize(img, spec: VariantSpec):
+    if spec.height is not None:
+        return ImageOps.fit(img, (spec.width, spec.height), Image.LANCZOS)
+    width = min(spec.width, img.width)
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def _open(data: bytes):
+    img = Image.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    return img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+
+def render_variants(data: bytes, only: Optional[List[Tuple[str, str]]] = None
+                    ) -> Dict[Tuple[str, str], Tuple[bytes, int, int]]:
+    """Original bytes → {(name, format): (bytes, width, height)}."""
+    img = _open(data)
+    out = {}
+    for spec in SPECS.values():
+        resized = None
+        for fmt in wanted(spec):
+            if only is not None and (spec.name, fmt) not in only:
+                continue
+            resized = resized or _resize(img, spec)
+            out[(spec.name, fmt)] = (_encode(resized, fmt), resized.width, resized.height)
+    return out
+
+
+def render_placeholder(data: bytes) -> str:
+    """Tiny blurred WebP as a data URI (a few hundred bytes)."""
+    img = _open(data).convert('RGB')
+    height = max(1, round(img.height * PLACEHOLDER_WIDTH / img.width))
+    small = img.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    small.save(buf, 'WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+# ── storage ───────────────────────────────────────────────────────────────────
+
+def expected_keys() -> List[Tuple[str, str]]:
+    return [(spec.name, fmt) for spec in SPECS.values() for fmt in wanted(spec)]
+
+
+def generate_for_post(post_id: int, force: bool = False,
+                      only: Optional[List[Tuple[str, str]]] = None) -> int:
+    """
+    Make the missing variants (all of them with `force`; just the
+    (name, format) pairs in `only` when given) and the placeholder for one
+    post; returns the number of variants written. Commits.
+    """
+    if Image is None:
+        return 0
+    row = db.session.execute(
+        select(BlogPost.image_hash, BlogPost.image_placeholder).where(BlogPost.id == post_id)
+    ).first()
+    if row is None or not row.image_hash:
+        return 0
+    digest = row.image_hash
+
+    current = {
+        (v.name, v.format)
+        for v in db.session.execute(
+            select(BlogImageVariant.name, BlogImageVariant.format)
+            .where(BlogImageVariant.post_id == post_id, BlogImageVariant.source_hash == digest)
+        )
+    }
+    missing = expected_keys() if force else [k for k in expected_keys() if k not in current]
+    if only is not None:
+        missing = [k for k in missing if k in only]
+    if not missing and row.image_placeholder:
+        return 0
+
+    # Variants of a replaced image (every variant with `force`)
+    stale = delete(BlogImageVariant).where(BlogImageVariant.post_id == post_id)
+    if not force:
+        stale = stale.where(BlogImageVariant.source_hash != digest)
+    db.session.execute(stale)
+
+    rendered: Dict[Tuple[str, str], Tuple[bytes, int, int]] = {}
+    if not force:
+        # EN/DE twins share the image: copy what another post already has
+        for v in db.session.execute(
+            select(BlogImageVariant.name, BlogImageVariant.format, BlogImageVariant.data,
+                   BlogImageVariant.width, BlogImageVariant.height)
+            .where(BlogImageVariant.source_hash == digest, BlogImageVariant.post_id != post_id)
+        ):
+            if (v.name, v.format) in missing:
+                rendered[(v.name, v.format)] = (v.data, v.width, v.height)
+
+    todo = [k for k in missing if k not in rendered]
+    placeholder = row.image_placeholder
+    if not placeholder and not force:
+        placeholder = db.session.execute(
+            select(BlogPost.image_placeholder)
+            .where(BlogPost.image_hash == digest, BlogPost.image_placeholder.isnot(None)).limit(1)
+        ).scalar()
+    if todo or not placeholder or force:
+        original = media_store.get_data(digest)
+        if not original:
+            db.session.rollback()
+            return 0
+        if todo:
+            rendered.update(render_variants(original, only=todo))
+        if not placeholder or force:
+            placeholder = render_placeholder(original)
+
+    for (name, fmt), (data, width, height) in rendered.items():
+        db.session.add(BlogImageVariant(
+            post_id=post_id, name=name, format=fmt, width=width, height=height,
+            source_hash=digest, byte_size=len(data), data=data,
+        ))
+    if placeholder != row.image_placeholder:
+        db.session.execute(
+            update(BlogPost).where(BlogPost.id == post_id)
+            .values(image_placeholder=placeholder, updated_at=BlogPost.updated_at)
+        )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker rendered the same post at the same time
+        db.session.rollback()
+        return 0
+    if rendered:
+        logger.info(f"Blog post {post_id}: {len(rendered)} image variant(s) written")
+    return len(rendered)
+
+
+def variant_data(post_id: int, name: str, fmt: str, source_hash: str) -> Optional[bytes]:
+    return db.session.execute(
+        select(BlogImageVariant.data).where(
+            BlogImageVariant.post_id == post_id,
+            BlogImageVariant.name == name,
+            BlogImageVariant.format == fmt,
+            BlogImageVariant.source_hash == source_hash,
+        )
+    ).scalar()
@@ -0,0 +1,185 @@
+"""
+llm_executor.py
+
+Bounded execution layer for slow OpenAI calls.
+
+Gunicorn runs 2 workers × 4 gthreads; if every chat turn calls the provider on
+its request thread, four concurrent chats freeze blog, sitemap and static
+traffic in that worker. All LLM calls go through this module instead:
+
+  * run(fn, **kwargs)  → executes `fn` on a separately sized thread pool and
+                         waits at most `deadline` seconds for the result.
+                         The deadline covers every attempt: SDK retries are
+                         off for these calls and provider errors are retried
+                         here, each attempt getting the time that is left.
+  * reserve()          → context manager for streaming calls that must stay on
+                         the request thread but still count against capacity.
+
+Capacity = pool size + queue depth. When it is exhausted the call fails fast
+with LLMBusyError, so request threads never queue up behind the provider.
+Every call also passes the provider circuit breaker (openai_client.breaker):
+while it is open calls fail fast with CircuitOpenError.
+
+Settings (env):
+  LLM_EXECUTOR_WORKERS      threads calling the provider (default 4)
+  LLM_EXECUTOR_MAX_PENDING  calls allowed to wait for a free thread (default 8)
+  LLM_CALL_TIMEOUT          default per-call deadline in seconds (default 45)
+  LLM_RETRY_BACKOFF         first retry delay in seconds, doubled per retry (default 0.5)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from app.services.openai_client import MAX_RETRIES, PROVIDER_ERRORS, CircuitOpenError, breaker, without_retries
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("LLM_EXECUTOR_WORKERS", "4"))
+MAX_PENDING = int(os.getenv("LLM_EXECUTOR_MAX_PENDING", "8"))
+CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "45"))
+RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+MAX_BACKOFF = 8.0
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when the executor is at capacity; callers should degrade gracefully."""
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a call did not finish within its deadline."""
+
+
+class LLMExecutor:
+    """Thread pool with an admission limit and per-call deadlines."""
+
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    # ── admission ─────────────────────────────────────────────────────────────
+
+    def _acquire(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise LLMBusyError("LLM executor is at capacity")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            self._release()
+            raise
+
+    def _release(self, *_: Any) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @contextmanager
+    def reserve(self) -> Iterator[None]:
+        """Hold one unit of capacity for a call executed by the caller itself."""
+        self._acquire()
+        try:
+            yield
+        except BaseException as exc:
+            breaker.record(exc)
+            raise
+        else:
+            breaker.record(None)
+        finally:
+            self._release()
+
+    # ── execution ─────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _attempts(fn: Callable[..., Any], args: tuple, kwargs: dict, expires: float) -> Any:
+        """Call `fn` on the pool thread, retrying provider errors until `expires`."""
+        call = without_retries(fn)
+        cap = kwargs.pop("timeout", None)
+        retries = 0
+        while True:
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("LLM call deadline passed before the attempt")
+            try:
+                return call(*args, timeout=min(remaining, cap) if cap else remaining, **kwargs)
+            except PROVIDER_ERRORS:
+                delay = min(RETRY_BACKOFF * 2 ** retries, MAX_BACKOFF)
+                retries += 1
+                if retries > MAX_RETRIES or time.monotonic() + delay >= expires:
+                    raise
+                time.sleep(delay)
+
+    def run(self, fn: Callable[..., Any], *args: Any, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on the LLM pool and wait for the result.
+
+        `fn` is expected to be an OpenAI SDK method. Each attempt gets the time
+        left before the deadline as its `timeout`, and no attempt starts after
+        it, so a call abandoned by the caller frees its thread (and its slot)
+        at about the same moment.
+        """
+        deadline = deadline or CALL_TIMEOUT
+        expires = time.monotonic() + deadline
+
+        self._acquire()
+        try:
+            future = self._pool.submit(self._attempts, fn, args, kwargs, expires)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=deadline)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+            breaker.record_failure()
+            logger.warning(f"LLM call {getattr(fn, '__qualname__', fn)} exceeded {deadline:.0f}s deadline")
+            raise LLMTimeoutError(f"LLM call exceeded {deadline:.0f}s deadline")
+        except Exception as exc:
+            breaker.record(exc)
+            raise
+        breaker.record(None)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+
+_executor = LLMExecutor()
+
+
+def run(fn: Callable[..., Any], *args: Any, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+    """Module-level shortcut for the process-wide executor."""
+    return _executor.run(fn, *args, deadline=deadline, **kwargs)
+
+
+def reserve():
+    return _executor.reserve()
+
+
+def stats() -> dict:
+    return _executor.stats()
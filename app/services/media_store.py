@@ -0,0 +1,238 @@
+"""
+media_store.py
+
+Content-addressed store for post and generated-content images.
+
+publish_content() used to copy the same image bytes into the EN BlogPost, the
+DE BlogPost and the GeneratedContent row: three copies of every image in the
+database, each carried along by any row fetch that did not defer it. Images
+now live once in media_blobs, keyed by their SHA-256; rows hold only
+image_hash (MediaImageMixin), and media_blobs.refcount counts those
+references. The count is maintained on every flush (see app/models/media.py)
+and can be rebuilt from the referencing tables with recount().
+
+Writes go through put(), which stores unseen bytes and returns the hash. A
+blob nobody refers to stays until collect_garbage() removes it after a grace
+period (so a blob put() by a transaction that has not committed its row yet
+is never collected). The same sweep removes generated image files in
+StorageConfig.get_image_storage_path() that no row points at any more.
+
+Settings (env):
+  MEDIA_GC_GRACE_HOURS   age before an unreferenced blob or file is removed (default 24)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from sqlalchemy import func, inspect, select, text, update
+
+from app import db
+from app.models.blog import BlogPost
+from app.models.content_generation import GeneratedContent
+from app.models.media import MediaBlob
+from app.utils import image_cache
+
+logger = logging.getLogger(__name__)
+
+GC_GRACE_HOURS = float(os.getenv('MEDIA_GC_GRACE_HOURS', '24'))
+
+# Tables whose image_hash refers to media_blobs
+REFERENCING_MODELS = (BlogPost, GeneratedContent)
+
+# Image files written by download_and_save_image() / OpenAIService.generate_image();
+# anything else in the storage path (site assets, default-post.jpg) is left alone.
+SWEPT_SUBDIRS = ('blog', 'content')
+GENERATED_FILE_RE = re.compile(
+    r'^(?:[0-9a-f]{32}|(?:blog|content)_\d+_[0-9a-f]{8}|\d{14}_[0-9a-f]{8})\.png$'
+)
+
+
+# ── blobs ─────────────────────────────────────────────────────────────────────
+
+def _insert_new(values: dict) -> None:
+    """INSERT that leaves an existing row alone (two writers may store the same bytes)."""
+    table = MediaBlob.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(**values).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(**values).on_conflict_do_nothing()
+    else:
+        statement = table.insert().values(**values)
+    db.session.execute(statement)
+
+
+def put(data: bytes) -> str:
+    """Store `data` unless a blob with the same SHA-256 exists; returns the hash."""
+    digest = image_cache.content_hash(data)
+    exists = db.session.execute(
+        select(MediaBlob.refcount).where(MediaBlob.sha256 == digest)
+    ).first()
+    if exists is None:
+        _insert_new({'sha256': digest, 'data': data, 'byte_size': len(data),
+                     'refcount': 0, 'created_at': datetime.utcnow()})
+    elif exists.refcount <= 0:
+        # An old orphan is about to be referenced again: restart its grace
+        # period so collect_garbage() does not take it before the row flushes
+        db.session.execute(
+            update(MediaBlob).where(MediaBlob.sha256 == digest, MediaBlob.refcount <= 0)
+            .values(created_at=datetime.utcnow())
+        )
+    return digest
+
+
+def get_data(digest: Optional[str]) -> Optional[bytes]:
+    """Bytes of a blob (only the data column is read)."""
+    if not digest:
+        return None
+    return db.session.execute(select(MediaBlob.data).where(MediaBlob.sha256 == digest)).scalar()
+
+
+def recount() -> int:
+    """Rebuild every refcount from the referencing tables; returns blobs corrected."""
+    blobs = MediaBlob.__table__
+    actual = select(func.count()).select_from(REFERENCING_MODELS[0].__table__).where(
+        REFERENCING_MODELS[0].__table__.c.image_hash == blobs.c.sha256).scalar_subquery()
+    for model in REFERENCING_MODELS[1:]:
+        actual = actual + select(func.count()).select_from(model.__table__).where(
+            model.__table__.c.image_hash == blobs.c.sha256).scalar_subquery()
+    result = db.session.execute(update(blobs).where(blobs.c.refcount != actual).values(refcount=actual))
+    db.session.commit()
+    return result.rowcount or 0
+
+
+# ── legacy inline images ──────────────────────────────────────────────────────
+
+def adopt_inline_images(engine=None) -> int:
+    """
+    Move bytes still held in a legacy image_data column (databases created
+    before media_blobs, without the migration) into the store. Idempotent:
+    the column is cleared once its bytes are adopted. Returns rows moved.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    moved = 0
+    for model in REFERENCING_MODELS:
+        table = model.__table__
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+        if 'image_data' not in {c['name'] for c in inspector.get_columns(table.name, schema=table.schema)}:
+            continue
+        ids = db.session.execute(text(
+            f"SELECT id FROM {table.fullname} WHERE image_data IS NOT NULL"
+        )).scalars().all()
+        for row_id in ids:
+            data = db.session.execute(
+                text(f"SELECT image_data FROM {table.fullname} WHERE id = :id"), {'id': row_id}
+            ).scalar()
+            digest = put(bytes(data)) if data else None
+            db.session.execute(
+                text(f"UPDATE {table.fullname} SET image_hash = :hash, image_data = NULL WHERE id = :id"),
+                {'hash': digest, 'id': row_id},
+            )
+            db.session.commit()
+            moved += 1
+    if moved:
+        recount()
+        logger.info(f"Moved {moved} inline image(s) into media_blobs")
+    return moved
+
+
+# ── garbage collection ────────────────────────────────────────────────────────
+
+@dataclass
+class GCReport:
+    blobs: List[str] = field(default_factory=list)
+    blob_bytes: int = 0
+    files: List[str] = field(default_factory=list)
+    file_bytes: int = 0
+    recounted: int = 0
+
+
+def _referenced_file_names() -> Set[str]:
+    names = set()
+    for model in REFERENCING_MODELS:
+        for (url,) in db.session.execute(select(model.image_url).where(model.image_url.isnot(None))):
+            names.add(os.path.basename(url.split('?', 1)[0]))
+    return names
+
+
+def sweep_files(cutoff: float, dry_run: bool = False, report: Optional[GCReport] = None) -> GCReport:
+    """Remove generated image files no row points at, last modified before `cutoff`."""
+    from app.utils.storage_config import StorageConfig
+
+    report = report or GCReport()
+    referenced = _referenced_file_names()
+    base = StorageConfig.get_image_storage_path()
+    for subdir in SWEPT_SUBDIRS:
+        directory = os.path.join(base, subdir)
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not GENERATED_FILE_RE.match(entry.name) or entry.name in referenced:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime >= cutoff:
+                continue
+            report.files.append(entry.path)
+            report.file_bytes += stat.st_size
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except OSError as exc:
+                    logger.warning(f"Could not remove {entry.path}: {exc}")
+    return report
+
+
+def _remove_cached(digest: str) -> None:
+    """Drop the disk cache entries of a blob: the original and its variants."""
+    from app.services.image_variants import SPECS
+
+    keys = [digest] + [image_cache.derived_key(digest, f'{spec.name}.{fmt}')
+                       for spec in SPECS.values() for fmt in spec.formats]
+    for key in keys:
+        path = image_cache.get(key)
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def collect_garbage(grace_hours: float = GC_GRACE_HOURS, dry_run: bool = False,
+                    files: bool = True, rebuild_counts: bool = True) -> GCReport:
+    """Delete unreferenced blobs (and their disk cache entries, variants included) and stale image files."""
+    report = GCReport()
+    if rebuild_counts and not dry_run:
+        report.recounted = recount()
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    orphans = db.session.execute(
+        select(MediaBlob.sha256, MediaBlob.byte_size)
+        .where(MediaBlob.refcount <= 0, MediaBlob.created_at < cutoff)
+    ).all()
+    for digest, size in orphans:
+        report.blobs.append(digest)
+        report.blob_bytes += size or 0
+    if orphans and not dry_run:
+        # Re-checked in the DELETE: a row may have picked the blob up meanwhile
+        db.session.execute(
+            MediaBlob.__table__.delete().where(
+                MediaBlob.sha256.in_(report.blobs), MediaBlob.refcount <= 0
+            )
+        )
+        db.session.commit()
+        for digest in report.blobs:
+            _remove_cached(digest)
+    if files:
+        sweep_files(time.time() - grace_hours * 3600, dry_run=dry_run, report=report)
+    logger.info(f"Media GC{' (dry run)' if dry_run else ''}: {len(report.blobs)} blob(s) "
+                f"{report.blob_bytes} bytes, {len(report.files)} file(s) {report.file_bytes} bytes")
+    return report
@@ -0,0 +1,277 @@
+"""
+notification_renderer.py
+
+Rendering of notifications: Telegram HTML for the admin and the HTML emails
+queued through app/utils/mail_queue.py.
+
+Every layout below is a format string built once at import; rendering a
+notification is escaping the submitted values and one format_map per block,
+instead of re-building templates and concatenating strings per call. The
+tech-spec question tables are read from TechSpecTemplate once per language and
+kept pre-escaped (question_table()).
+
+All user input goes through escape(), so a "<" or "&" in an answer no longer
+makes Telegram reject the message with 400 "can't parse entities" (which the
+queue then retried). Messages are returned whole: the dispatcher measures
+them and, only when they exceed 4096 characters, splits them with
+telegram_service.split_message, which never cuts inside a tag.
+"""
+from __future__ import annotations
+
+import html
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# ── escaping ──────────────────────────────────────────────────────────────────
+
+DASH = "—"
+
+
+def escape(value: Any, default: str = DASH) -> str:
+    """Text → Telegram-safe HTML (&, <, > escaped); empty values → `default`."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    return html.escape(str(value), quote=False)
+
+
+def _timestamp(submitted_at: Optional[datetime]) -> str:
+    return (submitted_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ── layouts ───────────────────────────────────────────────────────────────────
+
+_RULE = "<b>═════════════════════════════════════════</b>\n"
+
+_TECH_SPEC_HEADER = "<b>🔔 New Technical Specification Submitted</b>\n\n"
+_TECH_SPEC_CONTACT = (
+    ("name", "<b>Name:</b> {}\n"),
+    ("email", "<b>Email:</b> {}\n"),
+    ("phone", "<b>Phone:</b> {}\n"),
+)
+_TECH_SPEC_DIVIDER = "<b>═══════════ TECHNICAL SPECIFICATION ═══════════</b>\n\n"
+_SECTION = "<b>{number}. {title}</b>\n\n"
+_QUESTION = "   <b>❓ {question}</b>\n"
+_ANSWER = "   <b>👉</b> {answer}\n\n"
+_NO_ANSWER = "   <i>No answer provided</i>\n\n"
+_FREE_TEXT = "   {answer}\n\n"
+_NO_DETAILS = "   <i>No details provided</i>\n\n"
+_SUBMITTED = _RULE + "<i>Submitted at: {timestamp}</i>"
+
+_CONTACT_FORM = (
+    "<b>📩 New Contact Form Submission</b>\n\n"
+    "<b>Name:</b> {name}\n"
+    "<b>Email:</b> {email}\n"
+    "<b>Message:</b>\n{message}\n"
+    "\n<i>Submitted at: {timestamp}</i>"
+)
+
+# (label, TechSpecSubmission attribute)
+_BRIEF_CONTACT: Tuple[Tuple[str, str], ...] = (
+    ("Contact", "contact_name"),
+    ("Email", "contact_email"),
+    ("Phone", "contact_phone"),
+    ("Company", "company_name"),
+)
+_BRIEF_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("Type", "project_type"),
+    ("Goal", "project_goal"),
+    ("Users", "target_users"),
+    ("MVP features", "essential_features"),
+    ("Nice-to-have", "nice_to_have_features"),
+    ("Timeline", "timeline"),
+    ("Budget", "budget_range"),
+    ("Integrations", "integrations"),
+    ("Tech requirements", "technical_requirements"),
+    ("Similar projects", "similar_projects"),
+    ("Success metrics", "success_metrics"),
+    ("Security/GDPR", "security_requirements"),
+    ("Support", "support_level"),
+    ("Existing assets", "existing_assets"),
+    ("Additional info", "additional_info"),
+)
+
+
+def _field_lines(fields: Iterable[Tuple[str, str]]) -> Tuple[Tuple[str, str], ...]:
+    """Pre-render '<b>Label:</b> {}' per field."""
+    return tuple((attr, f"<b>{escape(label)}:</b> {{}}\n") for label, attr in fields)
+
+
+_BRIEF_CONTACT_LINES = _field_lines(_BRIEF_CONTACT)
+_BRIEF_FIELD_LINES = _field_lines(_BRIEF_FIELDS)
+_BRIEF_HEADER = "<b>🤖 New Tech Spec via Chat Assistant</b>\n\n"
+_BRIEF_DIVIDER = "\n<b>═══════════ PROJECT BRIEF ═══════════</b>\n\n"
+_BRIEF_FOOTER = "\n<i>Saved as TechSpecSubmission #{id}</i>"
+
+_QUESTIONNAIRE_EMAIL = """
+        <h1>New Project Questionnaire Submission</h1>
+        <p><strong>Submitted on:</strong> {timestamp} UTC</p>
+        <p><strong>Contact:</strong> {contact_name} ({contact_email})</p>
+        <p><strong>Project Type:</strong> {project_type}</p>
+
+        <h2>Project Details</h2>
+        <ul>
+            <li><strong>Project Goal:</strong> {project_goal}</li>
+            <li><strong>Target Users:</strong> {target_users}</li>
+            <li><strong>Timeline:</strong> {timeline}</li>
+            <li><strong>Budget Range:</strong> {budget_range}</li>
+        </ul>
+
+        <p>Login to the admin dashboard to view the full questionnaire details.</p>
+        """
+
+_TECH_SPEC_EMAIL = """
+        <h1>New Technical Specification Submission</h1>
+        <p><strong>Submitted on:</strong> {timestamp} UTC</p>
+
+        <h2>Contact Information</h2>
+        <ul>
+            <li><strong>Name:</strong> {name}</li>
+            <li><strong>Email:</strong> {email}</li>
+            <li><strong>Phone:</strong> {phone}</li>
+        </ul>
+
+        <h2>Technical Specification Details</h2>
+        {sections}
+        <p>Please review the technical specification and contact the client as soon as possible.</p>
+        <p>Login to the admin dashboard to view the full details.</p>
+        """
+_TECH_SPEC_EMAIL_SECTION = """
+            <h3>{number}. {question}</h3>
+            <p>{answer}</p>
+            """
+
+_PROJECT_UPDATE_EMAIL = """
+        <h1>{project}: {title}</h1>
+        {milestone}
+        <p>{content}</p>
+        <p>Log in to your client dashboard to see all updates of this project.</p>
+        """
+
+
+# ── question tables ───────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def question_table(language: str) -> Tuple[Tuple[str, ...], ...]:
+    """Pre-rendered question lines of every tech-spec section for `language`."""
+    from app.agents.tech_spec import TechSpecTemplate
+
+    return tuple(
+        tuple(_QUESTION.format(question=escape(q)) for q in section.get("questions", ()))
+        for section in TechSpecTemplate(language=language).sections
+    )
+
+
+# ── renderers ─────────────────────────────────────────────────────────────────
+
+def render_tech_spec(
+    tech_spec_data: Dict[str, Any],
+    contact_info: Optional[Dict[str, str]] = None,
+    submitted_at: Optional[datetime] = None,
+    with_questions: bool = True,
+) -> str:
+    """
+    Telegram HTML for a tech spec given as {'answers': [{'question', 'answer'}],
+    'language'}. With `with_questions`, a section whose answer has one line
+    per template question is shown as question/answer pairs.
+    """
+    out = [_TECH_SPEC_HEADER]
+    if contact_info:
+        lines = [line.format(escape(contact_info[key])) for key, line in _TECH_SPEC_CONTACT
+                 if contact_info.get(key)]
+        if lines:
+            out.append("<b>📋 Contact Information:</b>\n")
+            out.extend(lines)
+            out.append("\n")
+    out.append(_TECH_SPEC_DIVIDER)
+
+    table = question_table(tech_spec_data.get("language", "en")) if with_questions else ()
+    for i, answer in enumerate(tech_spec_data.get("answers", [])):
+        if "question" not in answer or "answer" not in answer:
+            continue
+        out.append(_SECTION.format(number=i + 1, title=escape(answer["question"], "")))
+        answer_text = answer["answer"] or ""
+        answers_list = answer_text.split("\n")
+        questions = table[i] if i < len(table) else ()
+        if questions and len(answers_list) >= len(questions):
+            for question, line in zip(questions, answers_list):
+                out.append(question)
+                line = line.strip()
+                out.append(_ANSWER.format(answer=escape(line)) if line else _NO_ANSWER)
+        elif answer_text.strip():
+            out.append(_FREE_TEXT.format(answer=escape(answer_text).replace("\n", "\n   ")))
+        else:
+            out.append(_NO_DETAILS)
+
+    out.append(_SUBMITTED.format(timestamp=_timestamp(submitted_at)))
+    return "".join(out)
+
+
+def render_contact_form(form_data: Dict[str, str], submitted_at: Optional[datetime] = None) -> str:
+    return _CONTACT_FORM.format(
+        name=escape(form_data.get("name"), "Not provided"),
+        email=escape(form_data.get("email"), "Not provided"),
+        message=escape(form_data.get("message"), "No message"),
+        timestamp=_timestamp(submitted_at),
+    )
+
+
+def render_spec_submission(submission: Any) -> str:
+    """Telegram HTML for a TechSpecSubmission saved by the chat assistant."""
+    out = [_BRIEF_HEADER]
+    out.extend(line.format(escape(getattr(submission, attr, None))) for attr, line in _BRIEF_CONTACT_LINES)
+    out.append(_BRIEF_DIVIDER)
+    out.extend(line.format(escape(getattr(submission, attr, None))) for attr, line in _BRIEF_FIELD_LINES)
+    out.append(_BRIEF_FOOTER.format(id=submission.id))
+    return "".join(out)
+
+
+def render_questionnaire_email(form_data: Dict[str, str], submitted_at: Optional[datetime] = None) -> Tuple[str, str]:
+    """(subject, HTML body) of the admin email for a project questionnaire."""
+    def field(key: str, default: str) -> str:
+        return html.escape(form_data.get(key) or default)
+
+    project_type = form_data.get("project_type") or "Not specified"
+    body = _QUESTIONNAIRE_EMAIL.format(
+        timestamp=(submitted_at or datetime.utcnow()).strftime("%Y-%m-%d %H:%M:%S"),
+        contact_name=field("contact_name", "Not provided"),
+        contact_email=field("contact_email", "Not provided"),
+        project_type=html.escape(project_type),
+        project_goal=field("project_goal", "Not provided"),
+        target_users=field("target_users", "Not provided"),
+        timeline=field("timeline", "Not specified"),
+        budget_range=field("budget_range", "Not specified"),
+    )
+    return f"New Project Questionnaire: {project_type}", body
+
+
+def render_tech_spec_email(tech_spec_data: Dict[str, Any], contact_info: Dict[str, str],
+                           submitted_at: Optional[datetime] = None) -> Tuple[str, str]:
+    """(subject, HTML body) of the admin email for a tech spec."""
+    sections = "".join(
+        _TECH_SPEC_EMAIL_SECTION.format(
+            number=i + 1,
+            question=html.escape(answer.get("question") or "Question"),
+            answer=html.escape(answer.get("answer") or "No answer"),
+        )
+        for i, answer in enumerate(tech_spec_data.get("answers", []))
+    )
+    body = _TECH_SPEC_EMAIL.format(
+        timestamp=(submitted_at or datetime.utcnow()).strftime("%Y-%m-%d %H:%M:%S"),
+        name=html.escape(contact_info.get("name") or "Not provided"),
+        email=html.escape(contact_info.get("email") or "Not provided"),
+        phone=html.escape(contact_info.get("phone") or "Not provided"),
+        sections=sections,
+    )
+    return f"New Technical Specification: {contact_info.get('name') or 'Unknown'}", body
+
+
+def render_project_update_email(project: Any, update: Any) -> Tuple[str, str]:
+    """(subject, HTML body) of the client email for a project update."""
+    body = _PROJECT_UPDATE_EMAIL.format(
+        project=html.escape(project.title or "Your project"),
+        title=html.escape(update.title or ""),
+        milestone="<p><strong>Milestone reached</strong></p>" if update.is_milestone else "",
+        content=html.escape(update.content or "").replace("\n", "<br>"),
+    )
+    return f"{project.title or 'Project'} update: {update.title}", body
@@ -0,0 +1,221 @@
+"""
+openai_client.py
+
+One shared OpenAI client per API key for the whole process.
+
+The client owns a keep-alive HTTP connection pool, so chat turns reuse TLS
+connections instead of opening a new one per call. Timeouts and the retry /
+backoff policy are set here once (the SDK retries connection errors, 408/409,
+429 and 5xx with exponential backoff and jitter). Calls that run under a
+deadline (llm_executor.run) use without_retries(): the SDK's timeout is per
+attempt, so the executor retries itself within the remaining budget.
+
+A circuit breaker sits in front of the provider: after FAILURE_THRESHOLD
+consecutive provider failures it opens and every call fails immediately with
+CircuitOpenError for RESET_TIMEOUT seconds; then a single trial call is let
+through (half-open) and its outcome closes or re-opens the breaker. Callers
+treat CircuitOpenError like any other provider error and degrade to their
+fallback (chat_fix.simple_chat_response for the chat API).
+
+Settings (env):
+  OPENAI_POOL_SIZE          keep-alive connections per process (default 20)
+  OPENAI_KEEPALIVE_EXPIRY   idle seconds before a pooled connection closes (default 60)
+  OPENAI_CONNECT_TIMEOUT    TCP/TLS connect timeout in seconds (default 5)
+  OPENAI_MAX_RETRIES        retries per call, by the SDK or llm_executor (default 2)
+  OPENAI_BREAKER_THRESHOLD  consecutive failures that open the breaker (default 5)
+  OPENAI_BREAKER_RESET      seconds the breaker stays open (default 30)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import openai
+from openai import OpenAI
+
+try:
+    import httpx  # transport of the OpenAI SDK
+except ImportError:  # pragma: no cover - depends on the installed SDK
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "45"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+FAILURE_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+
+# Errors that say "the provider is degraded" — client errors (400/401/404)
+# are our own fault and never open the breaker.
+PROVIDER_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.InternalServerError,
+    openai.RateLimitError,
+    TimeoutError,               # includes llm_executor.LLMTimeoutError
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call."""
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go to the provider now."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError("OpenAI circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("OpenAI circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+            if reopen or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                logger.warning(
+                    f"OpenAI circuit breaker opened after {self._failures} failures "
+                    f"for {self.reset_timeout:.0f}s"
+                )
+
+    def record_neutral(self) -> None:
+        """A call that told nothing about the provider: only free the trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, exc: Optional[BaseException]) -> None:
+        """Record the outcome of a call; only provider-side errors count as failures."""
+        if exc is None:
+            self.record_success()
+        elif isinstance(exc, PROVIDER_ERRORS):
+            self.record_failure()
+        elif isinstance(exc, openai.APIStatusError):
+            # The provider answered (e.g. 400) — it is healthy
+            self.record_success()
+        else:
+            # The call did not complete: a client that disconnected mid-stream
+            # (GeneratorExit), a bug in the caller's own code. Neither proves
+            # the provider healthy, so the failure streak is left as it is.
+            self.record_neutral()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self._state(), "failures": self._failures}
+
+
+breaker = CircuitBreaker()
+
+_clients: Dict[str, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def _http_client():
+    if httpx is None:
+        return None
+    return openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def _resolve_api_key(api_key: Optional[str]) -> Optional[str]:
+    if api_key:
+        return api_key
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context() and current_app.config.get("OPENAI_API_KEY"):
+            return current_app.config["OPENAI_API_KEY"]
+    except Exception:
+        pass
+    return os.getenv("OPENAI_API_KEY")
+
+
+def get_client(api_key: Optional[str] = None) -> OpenAI:
+    """Return the process-wide client for `api_key` (default: configured key)."""
+    key = _resolve_api_key(api_key)
+    if not key:
+        raise RuntimeError("OPENAI_API_KEY is not configured")
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=key,
+                timeout=openai.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES,
+                http_client=_http_client(),
+            )
+            _clients[key] = client
+        return client
+
+
+_no_retry_clients: Dict[int, tuple] = {}  # id(client) → (client, copy)
+
+
+def without_retries(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    The same SDK method (e.g. client.responses.create) bound to a copy of its
+    client with max_retries=0; the copy shares the connection pool. Anything
+    that is not a method of an SDK resource is returned unchanged.
+    """
+    resource = getattr(fn, "__self__", None)
+    client = getattr(resource, "_client", None)
+    if not isinstance(client, OpenAI) or client.max_retries == 0:
+        return fn
+    cached = _no_retry_clients.get(id(client))
+    if cached is None or cached[0] is not client:
+        with _clients_lock:
+            cached = (client, client.with_options(max_retries=0))
+            _no_retry_clients[id(client)] = cached
+    return getattr(type(resource)(cached[1]), fn.__name__)
+
+
+def stats() -> dict:
+    return {"clients": len(_clients), "breaker": breaker.stats()}
@@ -10,6 +10,9 @@ from datetime import datetime
 from typing import Tuple, Dict, List, Optional
 from openai import APIError, APIConnectionError, RateLimitError, AuthenticationError
 
+from app.services import llm_executor
+from app.services.openai_client import get_client
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
@@ -29,7 +32,7 @@ class OpenAIService:
         # Логируем только факт наличия ключа, без раскрытия его признаков
         logger.info(f"OpenAI API key configured: {'Yes' if self.api_key else 'No'}")
         
-        openai.api_key = self.api_key
+        self.client = get_client(self.api_key)
     
     def test_connection(self) -> tuple[bool, str]:
         """
@@ -54,7 +57,7 @@ class OpenAIService:
             logger.info("Testing basic connectivity to OpenAI API...")
             
             # Простой тестовый запрос - получение списка моделей
-            response = openai.models.list()
+            response = self.client.models.list()
             
             if response.data:
                 model_count = len(response.data)
@@ -242,14 +245,15 @@ Keywords: {keywords}
             }}
             """
             
-            response = openai.chat.completions.create(
+            response = llm_executor.run(
+                self.client.chat.completions.create,
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 response_format={"type": "json_object"},
-                timeout=60
+                deadline=60
             )
             
             # Получаем содержимое ответа
@@ -293,10 +297,12 @@ Keywords: {keywords}
             last_error = None
             for model_name in model_candidates:
                 try:
-                    response = openai.images.generate(
+                    response = llm_executor.run(
+                        self.client.images.generate,
                         model=model_name,
                         prompt=prompt,
-                        size="1024x1024"
+                        size="1024x1024",
+                        deadline=120
                     )
 
                     if not response.data:
@@ -398,7 +404,8 @@ Keywords: {keywords}
             Provide only the image prompt text, nothing else.
             """
             
-            response = openai.chat.completions.create(
+            response = llm_executor.run(
+                self.client.chat.completions.create,
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -0,0 +1,222 @@
+"""
+pm_snapshot.py
+
+Precomputed project context for the PM agent.
+
+A PM turn reads one row of project_context_snapshots by client_id. When the
+row is missing or stale (content NULL — see the invalidation listeners in
+app/models/project.py) the text is rebuilt with four set-based queries no
+matter how many projects the client has:
+
+    1. the client's projects
+    2. task counts per project (GROUP BY)
+    3. in-progress / blocked tasks of those projects
+    4. the latest updates per project (ROW_NUMBER window)
+
+The rebuilt text is stored only if `version` did not move meanwhile, so a
+change committed during the rebuild is never masked by outdated text. A
+client without a row gets an empty one (INSERT ... ON CONFLICT DO NOTHING)
+before the build starts, so the invalidation listeners always have a row to
+bump and the first build goes through the same version guard.
+The snapshot text is byte-stable between changes, which keeps the PM prompt
+prefix cacheable on the provider side.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.project import Project, ProjectContextSnapshot, ProjectTask, ProjectUpdate
+
+logger = logging.getLogger(__name__)
+
+UPDATES_PER_PROJECT = 5
+ACTIVE_TASKS_PER_PROJECT = 5
+BLOCKED_TASKS_PER_PROJECT = 3
+
+NO_PROJECTS_TEXT = (
+    "STATUS: No active projects yet. The client may have submitted a "
+    "technical specification that is being reviewed by the team."
+)
+
+
+def _fmt_date(d) -> str:
+    if d is None:
+        return "—"
+    if isinstance(d, (date, datetime)):
+        return d.strftime("%d.%m.%Y")
+    return str(d)
+
+
+# ── build ─────────────────────────────────────────────────────────────────────
+
+def build_snapshot_text(client_id: int) -> str:
+    """Render the project block for one client with set-based queries."""
+    projects = (
+        db.session.query(
+            Project.id, Project.title, Project.status, Project.description,
+            Project.start_date, Project.estimated_end_date,
+        )
+        .filter(Project.client_id == client_id)
+        .order_by(Project.id)
+        .all()
+    )
+    if not projects:
+        return NO_PROJECTS_TEXT
+
+    project_ids = [p.id for p in projects]
+
+    counts = {
+        row.project_id: (row.total, int(row.completed or 0))
+        for row in db.session.query(
+            ProjectTask.project_id,
+            func.count(ProjectTask.id).label("total"),
+            func.sum(case((ProjectTask.status == "completed", 1), else_=0)).label("completed"),
+        )
+        .filter(ProjectTask.project_id.in_(project_ids))
+        .group_by(ProjectTask.project_id)
+    }
+
+    active: Dict[int, List] = defaultdict(list)
+    blocked: Dict[int, List] = defaultdict(list)
+    for task in (
+        db.session.query(ProjectTask.project_id, ProjectTask.title, ProjectTask.description, ProjectTask.status)
+        .filter(ProjectTask.project_id.in_(project_ids),
+                ProjectTask.status.in_(("in_progress", "blocked")))
+        .order_by(ProjectTask.id)
+    ):
+        (active if task.status == "in_progress" else blocked)[task.project_id].append(task)
+
+    rank = func.row_number().over(
+        partition_by=ProjectUpdate.project_id,
+        order_by=(ProjectUpdate.created_at.desc(), ProjectUpdate.id.desc()),
+    ).label("rank")
+    ranked = (
+        db.session.query(
+            ProjectUpdate.project_id, ProjectUpdate.title, ProjectUpdate.content,
+            ProjectUpdate.is_milestone, ProjectUpdate.created_at, rank,
+        )
+        .filter(ProjectUpdate.project_id.in_(project_ids))
+        .subquery()
+    )
+    updates: Dict[int, List] = defaultdict(list)
+    for row in (
+        db.session.query(ranked)
+        .filter(ranked.c.rank <= UPDATES_PER_PROJECT)
+        .order_by(ranked.c.project_id, ranked.c.rank)
+    ):
+        updates[row.project_id].append(row)
+
+    lines: list[str] = []
+    for idx, proj in enumerate(projects, 1):
+        total_tasks, completed_tasks = counts.get(proj.id, (0, 0))
+        progress = int((completed_tasks / total_tasks) * 100) if total_tasks else 0
+
+        lines.append(f"── PROJECT {idx}: {proj.title} ──")
+        lines.append(f"Status   : {(proj.status or 'unknown').upper()}")
+        lines.append(f"Progress : {progress}%")
+        lines.append(f"Start    : {_fmt_date(proj.start_date)}")
+        lines.append(f"Deadline : {_fmt_date(proj.estimated_end_date)}")
+        lines.append(f"Tasks    : {completed_tasks}/{total_tasks} completed")
+
+        if proj.description:
+            lines.append(f"Goal     : {proj.description[:200]}")
+
+        # Current work
+        if active[proj.id]:
+            lines.append("In progress:")
+            for t in active[proj.id][:ACTIVE_TASKS_PER_PROJECT]:
+                lines.append(f"  • {t.title}" + (f": {t.description[:80]}" if t.description else ""))
+
+        # Blockers
+        if blocked[proj.id]:
+            lines.append("⚠ Blocked:")
+            for t in blocked[proj.id][:BLOCKED_TASKS_PER_PROJECT]:
+                lines.append(f"  • {t.title}")
+
+        # Recent updates
+        if updates[proj.id]:
+            lines.append("Recent updates:")
+            for u in updates[proj.id]:
+                milestone = " 🏆 MILESTONE" if u.is_milestone else ""
+                lines.append(
+                    f"  [{_fmt_date(u.created_at)}] {u.title}{milestone}"
+                    + (f" — {u.content[:120]}" if u.content else "")
+                )
+        else:
+            lines.append("Recent updates: none yet")
+
+        lines.append("")  # blank line between projects
+
+    return "\n".join(lines)
+
+
+# ── lookup ────────────────────────────────────────────────────────────────────
+
+def _ensure_row(client_id: int) -> int:
+    """Create the client's (stale) snapshot row if missing; returns its version."""
+    table = ProjectContextSnapshot.__table__
+    values = {'client_id': client_id, 'version': 0, 'content': None}
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.session.execute(insert(table).values(**values).on_conflict_do_nothing(index_elements=['client_id']))
+        db.session.commit()
+    else:
+        try:
+            db.session.execute(table.insert().values(**values))
+            db.session.commit()
+        except IntegrityError:
+            # Another request created it first
+            db.session.rollback()
+    return db.session.execute(
+        select(table.c.version).where(table.c.client_id == client_id)
+    ).scalar_one()
+
+
+def _store(client_id: int, version: int, content: str) -> bool:
+    """Persist a rebuilt snapshot unless it was invalidated while building."""
+    table = ProjectContextSnapshot.__table__
+    try:
+        stored = db.session.execute(
+            table.update()
+            .where(table.c.client_id == client_id, table.c.version == version)
+            .values(content=content, built_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return bool(stored)
+    except Exception as exc:
+        logger.warning(f"Could not store PM snapshot for client {client_id}: {exc}")
+        db.session.rollback()
+        return False
+
+
+def get_snapshot_text(client_id: int) -> str:
+    """Return the client's project context: one indexed read when fresh."""
+    row = (
+        db.session.query(ProjectContextSnapshot.version, ProjectContextSnapshot.content)
+        .filter(ProjectContextSnapshot.client_id == client_id)
+        .first()
+    )
+    if row is not None and row.content is not None:
+        return row.content
+
+    try:
+        version = row.version if row is not None else _ensure_row(client_id)
+    except Exception as exc:
+        logger.warning(f"Could not create PM snapshot row for client {client_id}: {exc}")
+        db.session.rollback()
+        return build_snapshot_text(client_id)
+
+    content = build_snapshot_text(client_id)
+    _store(client_id, version, content)
+    return content
@@ -0,0 +1,211 @@
+"""
+prompt_assembler.py
+
+Token-budgeted prompt assembly for the chat agents.
+
+Message order is fixed so the provider's prefix cache can reuse the head of
+the prompt between turns:
+
+    [stable system messages: prompt, language line, site/project context]
+    [rolling summary of older turns]                  (only when one exists)
+    [most recent turns that fit the budget]
+    [current user message]
+
+Older turns that no longer fit into the agent's input budget are folded into a
+persisted rolling summary per conversation_id (ConversationSummary). The
+summary records the ChatMessage id of the last folded message, and the next
+turns continue strictly after it; history without store ids (an older widget)
+falls back to matching that message's content. The summariser itself is
+injected by the caller so this module stays provider-free.
+
+Token counts use `tiktoken` when it is installed, otherwise a UTF-8 byte
+heuristic (≈4 bytes per token) that errs on the safe side for Cyrillic text.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # optional dependency
+    _ENCODING = None
+
+logger = logging.getLogger(__name__)
+
+# Input token budget per agent (system + context + history + user message)
+AGENT_INPUT_BUDGETS: Dict[str, int] = {
+    "greeter": 3000,
+    "spec": 6000,
+    "pm": 6000,
+    "portfolio": 3000,
+}
+DEFAULT_BUDGET = 4000
+MESSAGE_OVERHEAD = 4  # role/separator tokens per message
+
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], str]
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+def _message_hash(message: Dict[str, Any]) -> str:
+    raw = f"{message.get('role')}\x00{message.get('content') or ''}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class AssembledPrompt:
+    messages: List[Dict[str, Any]]
+    prompt_tokens: int
+    budget: int
+    summarized: bool = False
+    dropped: int = 0
+    kept_turns: int = 0
+
+
+def fit_to_budget(
+    history: List[Dict[str, Any]],
+    available: int,
+) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split history into (overflow, kept): kept are the newest messages whose
+    combined size fits `available` tokens, overflow is everything older.
+    """
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for idx in range(len(history) - 1, -1, -1):
+        cost = message_tokens(history[idx])
+        if used + cost > available:
+            return history[: idx + 1], kept
+        kept.insert(0, history[idx])
+        used += cost
+    return [], kept
+
+
+# ── summary persistence ───────────────────────────────────────────────────────
+
+def _load_summary(conversation_id: Optional[str]):
+    if not conversation_id or conversation_id == "anon":
+        return None
+    try:
+        from app.models.conversation_summary import ConversationSummary
+        return ConversationSummary.query.filter_by(conversation_id=conversation_id).first()
+    except Exception as exc:
+        logger.warning(f"Could not load conversation summary: {exc}")
+        return None
+
+
+def _save_summary(record, conversation_id: str, summary: str, last: Dict[str, Any], folded: int) -> None:
+    try:
+        from app import db
+        from app.models.conversation_summary import ConversationSummary
+
+        if record is None:
+            record = ConversationSummary(conversation_id=conversation_id, covered_count=0)
+            db.session.add(record)
+        record.summary = summary
+        record.covered_message_id = last.get("id")
+        record.covered_hash = _message_hash(last)
+        record.covered_count = (record.covered_count or 0) + folded
+        db.session.commit()
+    except Exception as exc:
+        logger.warning(f"Could not persist conversation summary: {exc}")
+        try:
+            from app import db
+            db.session.rollback()
+        except Exception:
+            pass
+
+
+def _unsummarized(history: List[Dict[str, Any]], record) -> List[Dict[str, Any]]:
+    """
+    Return the part of history that is newer than the last folded message.
+
+    Store rows are cut by id: short replies ("да", "ok") repeat, so a content
+    match could land on a later copy and lose every turn in between. Only
+    history without ids is matched by content; if the folded message is no
+    longer in that (client-trimmed) window, the whole window is newer.
+    """
+    if record.covered_message_id and history and all(m.get("id") for m in history):
+        return [m for m in history if m["id"] > record.covered_message_id]
+    if not record.covered_hash:
+        return history
+    for idx in range(len(history) - 1, -1, -1):
+        if _message_hash(history[idx]) == record.covered_hash:
+            return history[idx + 1:]
+    return history
+
+
+# ── assembly ──────────────────────────────────────────────────────────────────
+
+def assemble(
+    *,
+    agent: str,
+    stable: List[Dict[str, Any]],
+    user_text: str,
+    prior_messages: Optional[List[Dict[str, Any]]] = None,
+    conversation_id: Optional[str] = None,
+    summarizer: Optional[Summarizer] = None,
+) -> AssembledPrompt:
+    """Build the message list for one turn within the agent's input budget."""
+    budget = AGENT_INPUT_BUDGETS.get(agent, DEFAULT_BUDGET)
+    user_message = {"role": "user", "content": user_text}
+
+    history = [
+        {"role": m.get("role"), "content": (m.get("content") or "").strip(), "id": m.get("id")}
+        for m in (prior_messages or [])
+        if m.get("role") in ("user", "assistant") and (m.get("content") or "").strip()
+    ]
+
+    fixed_tokens = sum(message_tokens(m) for m in stable) + message_tokens(user_message)
+
+    record = _load_summary(conversation_id) if history else None
+    summary_text = record.summary if record else None
+    if record:
+        history = _unsummarized(history, record)
+
+    def summary_message(text: Optional[str]) -> List[Dict[str, Any]]:
+        if not text:
+            return []
+        return [{"role": "system", "content": f"SUMMARY OF EARLIER CONVERSATION:\n{text}"}]
+
+    available = budget - fixed_tokens - sum(message_tokens(m) for m in summary_message(summary_text))
+    overflow, kept = fit_to_budget(history, max(available, 0))
+
+    summarized = False
+    if overflow and summarizer and conversation_id and conversation_id != "anon":
+        try:
+            summary_text = summarizer(summary_text, overflow)
+            summarized = True
+            _save_summary(record, conversation_id, summary_text, overflow[-1], len(overflow))
+            # The new summary may be longer than the old one — re-fit the tail
+            available = budget - fixed_tokens - sum(message_tokens(m) for m in summary_message(summary_text))
+            _, kept = fit_to_budget(kept, max(available, 0))
+        except Exception as exc:
+            logger.warning(f"Conversation summarization failed, trimming instead: {exc}")
+
+    turns = [{"role": m["role"], "content": m["content"]} for m in kept]
+    messages = stable + summary_message(summary_text) + turns + [user_message]
+    prompt_tokens = sum(message_tokens(m) for m in messages)
+
+    return AssembledPrompt(
+        messages=messages,
+        prompt_tokens=prompt_tokens,
+        budget=budget,
+        summarized=summarized,
+        dropped=len(history) - len(kept),
+        kept_turns=len(kept),
+    )
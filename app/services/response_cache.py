@@ -0,0 +1,151 @@
+"""
+response_cache.py
+
+Cache for opening chat turns ("what do you build?", "how much does a bot cost?").
+
+Only turns without prior history are cached — the answer then depends solely on
+agent, language, the user's text and the prompt/context the model saw, which is
+exactly what the key is made of:
+
+    sha256(agent | language | normalized text | sha256(system prompt + context))
+
+Because the prompt fingerprint is part of the key, editing SYSTEM_PROMPTS or
+site_knowledge produces new keys and old entries are never served again.
+
+Tiers:
+  1. in-process LRU with TTL (always on)
+  2. optional shared tier in Redis when REDIS_URL is set and `redis` is installed,
+     so gunicorn workers share hits
+
+Settings (env):
+  RESPONSE_CACHE_ENABLED  default "true"
+  RESPONSE_CACHE_TTL      seconds, default 3600
+  RESPONSE_CACHE_SIZE     in-process entries, default 512
+  REDIS_URL               enables the shared tier
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+try:
+    import redis  # optional shared tier
+except ImportError:  # pragma: no cover - depends on deployment
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("true", "yes", "1")
+TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+MAX_TEXT_LEN = 200  # longer messages are specific enough to never repeat
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def fingerprint(*parts: Optional[str]) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def make_key(agent: str, language: str, user_text: str, prompt_fingerprint: str) -> Optional[str]:
+    """Return the cache key, or None when the text is not worth caching."""
+    normalized = normalize_text(user_text)
+    if not normalized or len(normalized) > MAX_TEXT_LEN:
+        return None
+    return "chatcache:" + fingerprint(agent, language, normalized, prompt_fingerprint)
+
+
+class _LRUCache:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, size: int, ttl: int):
+        self.size = size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_local = _LRUCache(SIZE, TTL)
+_shared = None
+
+if redis is not None and os.getenv("REDIS_URL"):
+    try:
+        _shared = redis.Redis.from_url(os.getenv("REDIS_URL"), socket_timeout=0.2, socket_connect_timeout=0.2)
+    except Exception as exc:
+        logger.warning(f"Response cache: shared tier disabled ({exc})")
+
+
+def get(key: Optional[str]) -> Optional[str]:
+    if not ENABLED or not key:
+        return None
+    value = _local.get(key)
+    if value is not None:
+        return value
+    if _shared is not None:
+        try:
+            raw = _shared.get(key)
+            if raw is not None:
+                value = raw.decode("utf-8")
+                _local.set(key, value)
+                return value
+        except Exception as exc:
+            logger.warning(f"Response cache: shared tier read failed ({exc})")
+    return None
+
+
+def put(key: Optional[str], value: Optional[str]) -> None:
+    if not ENABLED or not key or not value:
+        return
+    _local.set(key, value)
+    if _shared is not None:
+        try:
+            _shared.setex(key, TTL, value.encode("utf-8"))
+        except Exception as exc:
+            logger.warning(f"Response cache: shared tier write failed ({exc})")
+
+
+def clear() -> None:
+    """Drop the in-process tier (shared entries expire on their own TTL)."""
+    _local.clear()
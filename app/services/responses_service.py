@@ -1,11 +1,14 @@
 # app/services/responses_service.py
 from __future__ import annotations
+import logging
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from pydantic import BaseModel, Field, ValidationError
-from openai import OpenAI
+from app.services import llm_executor, prompt_assembler, response_cache
+from app.services.openai_client import get_client
+
+logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
 
 
@@ -78,34 +81,139 @@ _LANG_NAMES = {
 }
 
 
-def build_messages(
+_SUMMARY_SYSTEM = (
+    "You maintain a running summary of a sales/spec chat between a client and an assistant. "
+    "Merge the previous summary with the new turns. Keep every concrete fact the client gave "
+    "(goals, features, budget, timeline, integrations, contact details) and open questions. "
+    "Max 200 words, bullet points, same language as the conversation."
+)
+
+
+def _summarize(previous: Optional[str], turns: List[Dict[str, str]]) -> str:
+    """Fold turns that fell out of the token budget into the rolling summary."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    resp = llm_executor.run(
+        get_client().responses.create,
+        model=MODEL,
+        input=[
+            {"role": "system", "content": _SUMMARY_SYSTEM},
+            {"role": "user", "content": f"PREVIOUS SUMMARY:\n{previous or '—'}\n\nNEW TURNS:\n{transcript}"},
+        ],
+    )
+    return resp.output_text.strip()
+
+
+def assemble_messages(
     user_text: str,
     agent: str,
     context: Optional[str],
     language: str,
     prior_messages: Optional[List[Dict[str, Any]]] = None,
-) -> List[Dict[str, Any]]:
+    conversation_id: Optional[str] = None,
+) -> prompt_assembler.AssembledPrompt:
+    """
+    Stable prefix first (system prompt, language line, context) so the provider's
+    prompt cache can reuse it; history is fitted into the agent's token budget
+    and older turns are folded into the conversation's rolling summary.
+    """
     system_prompt = SYSTEM_PROMPTS.get(agent, SYSTEM_PROMPTS["greeter"])
     lang_name = _LANG_NAMES.get(language, language)
 
-    messages: List[Dict[str, Any]] = [
+    stable: List[Dict[str, Any]] = [
         {"role": "system", "content": system_prompt},
         {"role": "system", "content": f"Detected user language: {lang_name}. Reply in {lang_name}."},
     ]
     if context:
-        messages.append({"role": "system", "content": f"PROJECT CONTEXT:\n{context}"})
+        stable.append({"role": "system", "content": f"PROJECT CONTEXT:\n{context}"})
 
-    # Inject prior conversation turns (spec agent multi-turn context)
-    if prior_messages:
-        # Keep the last 20 turns max to stay within token budget
-        for m in prior_messages[-20:]:
-            role = m.get("role", "user")
-            content = (m.get("content") or "").strip()
-            if content and role in ("user", "assistant"):
-                messages.append({"role": role, "content": content})
+    return prompt_assembler.assemble(
+        agent=agent,
+        stable=stable,
+        user_text=user_text,
+        prior_messages=prior_messages,
+        conversation_id=conversation_id,
+        summarizer=_summarize,
+    )
 
-    messages.append({"role": "user", "content": user_text})
-    return messages
+
+def build_messages(
+    user_text: str,
+    agent: str,
+    context: Optional[str],
+    language: str,
+    prior_messages: Optional[List[Dict[str, Any]]] = None,
+    conversation_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    return assemble_messages(
+        user_text=user_text,
+        agent=agent,
+        context=context,
+        language=language,
+        prior_messages=prior_messages,
+        conversation_id=conversation_id,
+    ).messages
+
+
+def _usage_info(prompt: prompt_assembler.AssembledPrompt, usage: Any, conversation_id: str, agent: str) -> Dict[str, Any]:
+    """Per-request prompt accounting: provider-reported tokens when available, estimate otherwise."""
+    details = getattr(usage, "input_tokens_details", None) if usage is not None else None
+    info = {
+        "prompt_tokens": getattr(usage, "input_tokens", None) or prompt.prompt_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "estimated_prompt_tokens": prompt.prompt_tokens,
+        "budget": prompt.budget,
+        "summarized": prompt.summarized,
+        "dropped_turns": prompt.dropped,
+    }
+    logger.info(
+        f"LLM usage conv={conversation_id} agent={agent} prompt={info['prompt_tokens']} "
+        f"cached={info['cached_tokens']} summarized={info['summarized']} dropped={info['dropped_turns']}"
+    )
+    return info
+
+
+# Agents whose first-turn answers are safe to share between visitors.
+# PM answers depend on the client's own project data and are never cached.
+_CACHEABLE_AGENTS = ("greeter", "spec")
+_knowledge_version: Optional[str] = None
+
+
+def _get_knowledge_version() -> str:
+    """Fingerprint of SYSTEM_PROMPTS and site knowledge; changes whenever either is edited."""
+    global _knowledge_version
+    if _knowledge_version is None:
+        import json
+        from app.agents import site_knowledge as sk
+
+        tables = [
+            sk.SITE_STRUCTURE, sk.SERVICES_TZ_FORM, sk.BRIEF_FORM_INFO,
+            sk.COMPANY_INFO, sk.ASSISTANT_ROLES,
+        ]
+        _knowledge_version = response_cache.fingerprint(
+            json.dumps(SYSTEM_PROMPTS, sort_keys=True, ensure_ascii=False),
+            json.dumps(tables, sort_keys=True, ensure_ascii=False, default=str),
+        )
+    return _knowledge_version
+
+
+def cache_key(
+    *,
+    user_text: str,
+    agent: str,
+    language: str,
+    context: Optional[str] = None,
+    prior_messages: Optional[List[Dict[str, Any]]] = None,
+    **_: Any,
+) -> Optional[str]:
+    """
+    Response-cache key for an opening turn, or None when the turn must not be cached
+    (prior history present, personalised agent, empty or long text).
+    """
+    if prior_messages or agent not in _CACHEABLE_AGENTS:
+        return None
+    system_prompt = SYSTEM_PROMPTS.get(agent, SYSTEM_PROMPTS["greeter"])
+    prompt_fp = response_cache.fingerprint(_get_knowledge_version(), system_prompt, context)
+    return response_cache.make_key(agent, language, user_text, prompt_fp)
 
 
 def respond(
@@ -122,14 +230,36 @@ def respond(
     Універсальний виклик Responses API.
     prior_messages: previous turns [{role,content}] injected before the current user message.
     Якщо structured=True — просимо модель віддати JSON, валідований Pydantic'ом.
+    Відповідь містить "cache": "hit" | "miss" | "bypass".
     """
-    messages = build_messages(
+    key = None
+    if not structured:
+        key = cache_key(
+            user_text=user_text,
+            agent=agent,
+            language=language,
+            context=context,
+            prior_messages=prior_messages,
+        )
+        cached = response_cache.get(key)
+        if cached is not None:
+            return {
+                "agent": agent,
+                "conversation_id": conversation_id,
+                "answer": cached,
+                "followup_suggestion": None,
+                "cache": "hit",
+            }
+
+    prompt = assemble_messages(
         user_text=user_text,
         agent=agent,
         context=context,
         language=language,
         prior_messages=prior_messages,
+        conversation_id=conversation_id,
     )
+    messages = prompt.messages
 
     if structured:
         schema_hint = (
@@ -140,12 +270,14 @@ def respond(
         )
         messages.insert(0, {"role": "system", "content": schema_hint})
 
-    resp = client.responses.create(
+    resp = llm_executor.run(
+        get_client().responses.create,
         model=MODEL,
         input=messages,
     )
 
     text = resp.output_text
+    usage = _usage_info(prompt, getattr(resp, "usage", None), conversation_id, agent)
 
     if structured:
         try:
@@ -153,18 +285,66 @@ def respond(
             data = json.loads(text)
             data.setdefault("agent", agent)
             data.setdefault("conversation_id", conversation_id)
-            return ChatAnswer(**data).model_dump()
+            return {**ChatAnswer(**data).model_dump(), "usage": usage}
         except (ValueError, ValidationError):
             return {
                 "agent": agent,
                 "conversation_id": conversation_id,
                 "answer": text,
                 "followup_suggestion": None,
+                "usage": usage,
             }
 
+    response_cache.put(key, text)
+
     return {
         "agent": agent,
         "conversation_id": conversation_id,
         "answer": text,
         "followup_suggestion": None,
+        "cache": "miss" if key else "bypass",
+        "usage": usage,
     }
+
+
+def stream(
+    *,
+    user_text: str,
+    agent: str,
+    conversation_id: str,
+    language: str = "uk",
+    context: Optional[str] = None,
+    prior_messages: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[str]:
+    """
+    Streaming counterpart of respond(): yields answer text deltas as the
+    Responses API produces them. Structured (JSON) output is not supported here.
+    """
+    prompt = assemble_messages(
+        user_text=user_text,
+        agent=agent,
+        context=context,
+        language=language,
+        prior_messages=prior_messages,
+        conversation_id=conversation_id,
+    )
+
+    # Streams stay on the request thread but still hold executor capacity
+    with llm_executor.reserve():
+        events = get_client().responses.create(
+            model=MODEL,
+            input=prompt.messages,
+            stream=True,
+            timeout=llm_executor.CALL_TIMEOUT,
+        )
+
+        for event in events:
+            event_type = getattr(event, "type", "")
+            if event_type == "response.output_text.delta":
+                delta = getattr(event, "delta", "")
+                if delta:
+                    yield delta
+            elif event_type == "response.completed":
+                _usage_info(prompt, getattr(getattr(event, "response", None), "usage", None), conversation_id, agent)
+            elif event_type in ("response.failed", "error"):
+                raise RuntimeError(f"Responses stream failed for conversation {conversation_id}")
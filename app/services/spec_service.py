@@ -1,15 +1,27 @@
 """
 spec_service.py
 
-Handles the full pipeline when the SPEC chat agent conversation ends:
+Handles the SPEC chat agent pipeline:
   1. detect_confirmation(message) → bool
   2. history_to_transcript(history)  → plain-text transcript (for LLM extraction)
-  3. history_to_messages(history)    → list[{role,content}]  (for LLM context)
+  3. history_to_messages(history)    → list[{role,content[,id]}]  (for LLM context)
   4. extract_spec_fields(transcript, language) → dict
+     update_draft(...) → after every spec turn, extract only what the latest
+     exchange adds and merge it into a draft TechSpecSubmission (background)
   5. save_submission(fields, user_id) → TechSpecSubmission
   6. notify_telegram(submission) → bool
-
-The chat_widget JS sends `history` (array of {text, type}) with every spec request.
+  7. finalize_submission(...) → on confirmation, promote the draft to 'new'
+
+Extraction prompts stay small: each draft update sees the current field values
+plus the messages stored since the draft's extracted_message_id, normally one
+exchange. That counter lives on the draft row, so any worker can tell whether
+the draft is behind the stored history: an update that failed or is still
+running in another process simply leaves it behind, and the confirm turn
+extracts the missing messages itself. The full-transcript extraction is only
+used when no draft exists.
+
+History is read from the server-side conversation store (ChatMessage rows,
+{role, content}); the legacy widget format {text, type} is still accepted.
 The controller calls this service when it detects a confirmation word.
 """
 from __future__ import annotations
@@ -17,66 +29,70 @@ from __future__ import annotations
 import json
 import logging
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-from openai import OpenAI
+from app.services import llm_executor
+from app.services.openai_client import get_client
 
 logger = logging.getLogger(__name__)
 
-_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 _MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
 
 # ── 1. Confirmation detection ─────────────────────────────────────────────────
 
-_CONFIRM_KEYWORDS = {
-    # English
-    "confirm", "confirmed", "yes", "submit", "send", "ok", "okay", "proceed",
-    "approve", "approved", "done", "finish", "go ahead",
-    # German
-    "bestätigen", "bestätigt", "ja", "senden", "einreichen", "weiter",
-    "genehmigen", "fertig", "los", "genau", "richtig",
-    # Ukrainian
-    "підтвердити", "підтверджую", "так", "надіслати", "відправити",
-    "готово", "гаразд", "добре",
-    # Russian
-    "подтвердить", "подтверждаю", "да", "отправить", "надіслати",
-    "готово", "хорошо", "ладно",
-}
-
+# Keywords live in app/agents/intent_router.CONFIRM_WORDS
 
 def is_confirmation(message: str) -> bool:
     """Return True if the user message is a confirmation of the spec summary."""
-    words = set(message.lower().strip().split())
-    return bool(words & _CONFIRM_KEYWORDS)
+    from app.agents.intent_router import classify
+    return classify(message).confirmation
 
 
 # ── 2. History helpers ────────────────────────────────────────────────────────
 
+def _entry_role_text(entry: Dict[str, Any]) -> tuple[str, str]:
+    """
+    Accept both history shapes: server-side store rows {role, content} and the
+    legacy JS conversationHistory entries {text, type}.
+    """
+    if "role" in entry:
+        role = "user" if entry.get("role") == "user" else "assistant"
+        return role, (entry.get("content") or "").strip()
+    role = "user" if entry.get("type") == "user" else "assistant"
+    return role, (entry.get("text") or "").strip()
+
+
 def history_to_transcript(history: List[Dict[str, Any]]) -> str:
     """
-    Convert JS conversationHistory [{text, type}, …] to a readable text transcript.
+    Convert the conversation history to a readable text transcript.
     Used as input for the LLM field extraction call.
     """
     lines: list[str] = []
     for entry in history:
-        role = "Client" if entry.get("type") == "user" else "Assistant"
-        text = (entry.get("text") or "").strip()
+        role, text = _entry_role_text(entry)
         if text:
-            lines.append(f"{role}: {text}")
+            lines.append(f"{'Client' if role == 'user' else 'Assistant'}: {text}")
     return "\n".join(lines)
 
 
-def history_to_messages(history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+def history_to_messages(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Convert JS conversationHistory to OpenAI message format for conversation context.
-    Maps type 'user' → role 'user', everything else → role 'assistant'.
+    Convert the conversation history to OpenAI message format for conversation context.
+    User entries → role 'user', everything else → role 'assistant'. Store rows
+    keep their ChatMessage id (prompt_assembler uses it to find where the
+    rolling summary ends; it is not sent to the model).
     """
-    messages: list[dict[str, str]] = []
+    messages: list[dict[str, Any]] = []
     for entry in history:
-        role = "user" if entry.get("type") == "user" else "assistant"
-        text = (entry.get("text") or "").strip()
+        role, text = _entry_role_text(entry)
         if text:
-            messages.append({"role": role, "content": text})
+            message: dict[str, Any] = {"role": role, "content": text}
+            if entry.get("id"):
+                message["id"] = entry["id"]
+            messages.append(message)
     return messages
 
 
@@ -102,32 +118,84 @@ def extract_spec_fields(transcript: str, language: str = "en") -> Dict[str, Any]
     Returns a dict matching TechSpecSubmission columns.
     """
     try:
-        resp = _client.responses.create(
+        resp = llm_executor.run(
+            get_client().responses.create,
             model=_MODEL,
             input=[
                 {"role": "system", "content": _EXTRACT_SYSTEM},
                 {"role": "user", "content": f"Transcript (language: {language}):\n\n{transcript}"},
             ],
         )
-        raw = resp.output_text.strip()
-
-        # Strip potential markdown fences
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        raw = raw.strip("`").strip()
-
-        data = json.loads(raw)
-        return data
+        return _parse_json(resp.output_text)
     except Exception as exc:
         logger.error(f"extract_spec_fields failed: {exc}")
         return {}
 
 
+def _parse_json(raw: str) -> Dict[str, Any]:
+    raw = (raw or "").strip()
+
+    # Strip potential markdown fences
+    if raw.startswith("```"):
+        raw = raw.split("```")[1]
+        if raw.startswith("json"):
+            raw = raw[4:]
+    raw = raw.strip("`").strip()
+
+    data = json.loads(raw)
+    return data if isinstance(data, dict) else {}
+
+
+SPEC_FIELDS = (
+    "project_type", "project_goal", "target_users", "essential_features",
+    "nice_to_have_features", "timeline", "budget_range", "integrations",
+    "technical_requirements", "similar_projects", "success_metrics",
+    "security_requirements", "support_level", "existing_assets", "additional_info",
+    "contact_name", "contact_email", "company_name", "contact_phone",
+)
+
+_DELTA_SYSTEM = (
+    "You are a data-extraction assistant maintaining a technical specification draft. "
+    "You get the current draft as JSON and the latest exchange between the client and "
+    "the spec assistant. Return ONLY a valid JSON object containing the fields that this "
+    "exchange adds or changes, with their complete new values (merge with the current "
+    "value when the client adds to it). Omit fields that did not change. Allowed keys:\n  "
+    + ", ".join(SPEC_FIELDS) + "\n"
+    "Return {} when nothing changed. No explanation, no markdown, no code fences."
+)
+
+
+def extract_exchange_fields(current: Dict[str, Any], exchange: str, language: str = "en") -> Dict[str, Any]:
+    """
+    Extract only the fields changed by `exchange`, a transcript excerpt of the
+    messages the draft has not seen yet (normally one exchange). The prompt
+    holds the draft and that excerpt, so its size does not grow with the
+    conversation. Raises on LLM/parse errors so the caller can mark the draft
+    incomplete.
+    """
+    draft = {k: v for k, v in current.items() if v}
+    resp = llm_executor.run(
+        get_client().responses.create,
+        model=_MODEL,
+        input=[
+            {"role": "system", "content": _DELTA_SYSTEM},
+            {"role": "user", "content": (
+                f"Current draft (language: {language}):\n{json.dumps(draft, ensure_ascii=False)}\n\n"
+                f"{exchange}"
+            )},
+        ],
+    )
+    data = _parse_json(resp.output_text)
+    return {k: v for k, v in data.items() if k in SPEC_FIELDS}
+
+
 # ── 4. DB save ────────────────────────────────────────────────────────────────
 
-def save_submission(fields: Dict[str, Any], user_id: Optional[int] = None) -> Any:
+def save_submission(
+    fields: Dict[str, Any],
+    user_id: Optional[int] = None,
+    conversation_id: Optional[str] = None,
+) -> Any:
     """
     Create and persist a TechSpecSubmission from extracted fields.
     Returns the saved model instance or None on error.
@@ -157,7 +225,8 @@ def save_submission(fields: Dict[str, Any], user_id: Optional[int] = None) -> An
             company_name=_str(fields.get("company_name")),
             contact_phone=_str(fields.get("contact_phone")),
             status="new",
-            client_id=user_id,
+            client_id=_client_id(user_id),
+            conversation_id=conversation_id,
         )
 
         db.session.add(submission)
@@ -183,6 +252,202 @@ def _str(val: Any) -> Optional[str]:
     return s if s else None
 
 
+def _client_id(user_id: Any) -> Optional[int]:
+    """Only logged-in users have an integer id; widget ids are anonymous UUIDs."""
+    return user_id if isinstance(user_id, int) else None
+
+
+# ── 4b. Incremental draft ─────────────────────────────────────────────────────
+
+# One worker keeps this process's updates in order; each update is one short
+# LLM call that still goes through llm_executor's admission limit. Which
+# messages a draft has seen is stored on the row (extracted_message_id), not
+# here: _pending only lets the confirm turn wait for an update this process
+# is already running instead of repeating its LLM call.
+_draft_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spec-draft")
+_pending: Dict[str, Future] = {}
+_draft_lock = threading.Lock()
+
+DRAFT_WAIT_SECONDS = 10.0  # how long the confirm turn waits for an update running here
+DRAFT_ATTEMPTS = 3  # re-reads when another worker advanced the draft meanwhile
+
+
+def _latest_submission(conversation_id: str):
+    from app.models.tech_spec_submission import TechSpecSubmission
+    return (
+        TechSpecSubmission.query
+        .filter_by(conversation_id=conversation_id)
+        .order_by(TechSpecSubmission.id.desc())
+        .first()
+    )
+
+
+def _latest_message_id(conversation_id: str) -> Optional[int]:
+    from app import db
+    from app.models.chat_message import ChatMessage
+    return db.session.query(db.func.max(ChatMessage.id)).filter(
+        ChatMessage.conversation_id == conversation_id
+    ).scalar()
+
+
+def _messages_after(conversation_id: str, after_id: int, through_id: int) -> List[Dict[str, Any]]:
+    """Stored messages the draft has not seen, oldest first (at most HISTORY_LIMIT)."""
+    from app import db
+    from app.models.chat_message import ChatMessage
+    from app.services.conversation_store import HISTORY_LIMIT
+    rows = (
+        db.session.query(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+        .filter(
+            ChatMessage.conversation_id == conversation_id,
+            ChatMessage.id > after_id,
+            ChatMessage.id <= through_id,
+        )
+        .order_by(ChatMessage.id.desc())
+        .limit(HISTORY_LIMIT)
+        .all()
+    )
+    return [{"id": r.id, "role": r.role, "content": r.content} for r in reversed(rows)]
+
+
+def _fit(column_name: str, value: Optional[str]) -> Optional[str]:
+    """Truncate to the column length so a verbose extraction cannot fail the UPDATE."""
+    from app.models.tech_spec_submission import TechSpecSubmission
+    length = getattr(TechSpecSubmission.__table__.c[column_name].type, "length", None)
+    if value and length and len(value) > length:
+        return value[:length]
+    return value
+
+
+def _catch_up(
+    conversation_id: str,
+    through_message_id: int,
+    language: str = "en",
+    user_id: Any = None,
+) -> Optional[Any]:
+    """
+    Extract the messages after the draft's extracted_message_id (up to
+    `through_message_id`) and merge them into the draft. The write only
+    applies if nobody moved the draft meanwhile; otherwise it starts over from
+    the new state. Returns the draft, or None when the conversation was
+    already finalized. Raises on extraction errors (the draft stays behind).
+    """
+    from sqlalchemy import func, update
+
+    from app import db
+    from app.models.tech_spec_submission import TechSpecSubmission
+
+    draft = None
+    for _ in range(DRAFT_ATTEMPTS):
+        draft = _latest_submission(conversation_id)
+        if draft is not None and draft.status != "draft":
+            return None
+        done = (draft.extracted_message_id or 0) if draft is not None else 0
+        if done >= through_message_id:
+            return draft
+        messages = _messages_after(conversation_id, done, through_message_id)
+        if not messages:
+            return draft
+        current = {f: getattr(draft, f) for f in SPEC_FIELDS} if draft is not None else {}
+        changes = extract_exchange_fields(current, history_to_transcript(messages), language)
+        values = {}
+        for field, value in changes.items():
+            value = _fit(field, _str(value))
+            if value:
+                values[field] = value
+        values["extracted_message_id"] = messages[-1]["id"]
+
+        if draft is None:
+            draft = TechSpecSubmission(
+                conversation_id=conversation_id,
+                status="draft",
+                client_id=_client_id(user_id),
+                **values,
+            )
+            db.session.add(draft)
+            db.session.commit()
+            return draft
+
+        table = TechSpecSubmission.__table__
+        applied = db.session.execute(
+            update(table)
+            .where(
+                table.c.id == draft.id,
+                table.c.status == "draft",
+                func.coalesce(table.c.extracted_message_id, 0) == done,
+            )
+            .values(updated_at=datetime.utcnow(), **values)
+        ).rowcount
+        db.session.commit()
+        if applied:
+            db.session.refresh(draft)
+            return draft
+    return draft
+
+
+def update_draft(
+    conversation_id: str,
+    through_message_id: int,
+    language: str = "en",
+    user_id: Any = None,
+) -> Optional[Any]:
+    """
+    Fold the spec turn stored as messages up to `through_message_id` (and any
+    earlier turn the draft missed) into the conversation's draft submission.
+    Returns the draft, or None when it was finalized or the extraction failed.
+    """
+    from app import db
+
+    try:
+        return _catch_up(conversation_id, through_message_id, language, user_id)
+    except Exception as exc:
+        # extracted_message_id was not advanced: the next update or the confirm turn retries
+        logger.warning(f"Spec draft update failed for {conversation_id}: {exc}")
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        return None
+
+
+def _run_draft_update(app, *args) -> None:
+    with app.app_context():
+        try:
+            update_draft(*args)
+        finally:
+            from app import db
+            db.session.remove()
+
+
+def schedule_draft_update(
+    conversation_id: Optional[str],
+    through_message_id: Optional[int],
+    language: str = "en",
+    user_id: Any = None,
+) -> None:
+    """Queue update_draft() for one stored spec turn without delaying the reply."""
+    if not conversation_id or conversation_id == "anon" or not through_message_id:
+        return
+    try:
+        from flask import current_app
+        app = current_app._get_current_object()
+        future = _draft_pool.submit(
+            _run_draft_update, app, conversation_id, through_message_id, language, user_id,
+        )
+    except Exception as exc:
+        # Nothing lost: the draft stays behind the stored history until caught up
+        logger.warning(f"Could not schedule spec draft update: {exc}")
+        return
+    with _draft_lock:
+        _pending[conversation_id] = future
+    future.add_done_callback(lambda f, cid=conversation_id: _forget(cid, f))
+
+
+def _forget(conversation_id: str, future: Future) -> None:
+    with _draft_lock:
+        if _pending.get(conversation_id) is future:
+            del _pending[conversation_id]
+
+
 # ── 5. Telegram notification ──────────────────────────────────────────────────
 
 def notify_telegram(submission: Any) -> bool:
@@ -190,50 +455,99 @@ def notify_telegram(submission: Any) -> bool:
     Send a Telegram notification to the admin when a new spec is submitted via chat.
     """
     try:
-        from app.services.telegram_service import send_telegram_message
-
-        msg = (
-            "<b>🤖 New Tech Spec via Chat Assistant</b>\n\n"
-            f"<b>Contact:</b> {submission.contact_name or '—'}\n"
-            f"<b>Email:</b> {submission.contact_email or '—'}\n"
-            f"<b>Phone:</b> {submission.contact_phone or '—'}\n"
-            f"<b>Company:</b> {submission.company_name or '—'}\n\n"
-            "<b>═══════════ PROJECT BRIEF ═══════════</b>\n\n"
-            f"<b>Type:</b> {submission.project_type or '—'}\n"
-            f"<b>Goal:</b> {submission.project_goal or '—'}\n"
-            f"<b>Users:</b> {submission.target_users or '—'}\n"
-            f"<b>MVP features:</b> {submission.essential_features or '—'}\n"
-            f"<b>Nice-to-have:</b> {submission.nice_to_have_features or '—'}\n"
-            f"<b>Timeline:</b> {submission.timeline or '—'}\n"
-            f"<b>Budget:</b> {submission.budget_range or '—'}\n"
-            f"<b>Integrations:</b> {submission.integrations or '—'}\n"
-            f"<b>Tech requirements:</b> {submission.technical_requirements or '—'}\n"
-            f"<b>Similar projects:</b> {submission.similar_projects or '—'}\n"
-            f"<b>Success metrics:</b> {submission.success_metrics or '—'}\n"
-            f"<b>Security/GDPR:</b> {submission.security_requirements or '—'}\n"
-            f"<b>Support:</b> {submission.support_level or '—'}\n"
-            f"<b>Existing assets:</b> {submission.existing_assets or '—'}\n"
-            f"<b>Additional info:</b> {submission.additional_info or '—'}\n\n"
-            f"<i>Saved as TechSpecSubmission #{submission.id}</i>"
-        )
+        from app.utils.telegram_queue import queue_telegram_message
+
+        from app.services.notification_renderer import render_spec_submission
 
-        # Telegram message limit is 4096 chars; truncate if needed
-        if len(msg) > 4000:
-            msg = msg[:3950] + "\n…<i>(truncated)</i>"
+        msg = render_spec_submission(submission)
 
-        return send_telegram_message(msg)
+        # Messages over Telegram's 4096-char limit are split by the dispatcher
+        return queue_telegram_message(msg)
 
     except Exception as exc:
         logger.error(f"notify_telegram failed: {exc}")
         return False
 
 
-# ── 6. High-level entry point ─────────────────────────────────────────────────
+# ── 6. High-level entry points ────────────────────────────────────────────────
+
+def finalize_submission(
+    conversation_id: Optional[str],
+    history: List[Dict[str, Any]],
+    user_id: Optional[int],
+    language: str = "en",
+) -> Optional[Any]:
+    """
+    Confirmation turn: promote the conversation's draft to status 'new' and
+    notify — a single UPDATE when the draft has seen every stored message.
+    A draft behind the stored history (an update failed, or is still running
+    in another worker) is caught up first; the full transcript is only
+    extracted when no draft exists.
+    """
+    if not conversation_id or conversation_id == "anon":
+        return save_and_notify(history, user_id=user_id, language=language)
+
+    with _draft_lock:
+        pending = _pending.get(conversation_id)
+    if pending is not None:
+        try:
+            pending.result(timeout=DRAFT_WAIT_SECONDS)
+        except Exception:
+            pass
+
+    from sqlalchemy import update
+
+    from app import db
+    from app.models.tech_spec_submission import TechSpecSubmission
+
+    try:
+        draft = _latest_submission(conversation_id)
+        if draft is not None and draft.status != "draft":
+            draft = None
+        latest = _latest_message_id(conversation_id) if draft is not None else None
+        if latest and (draft.extracted_message_id or 0) < latest:
+            try:
+                draft = _catch_up(conversation_id, latest, language, user_id)
+            except Exception as exc:
+                logger.warning(f"Spec draft catch-up failed for {conversation_id}, finalizing as is: {exc}")
+                db.session.rollback()
+                draft = _latest_submission(conversation_id)
+                if draft is not None and draft.status != "draft":
+                    draft = None
+        if draft is not None:
+            table = TechSpecSubmission.__table__
+            promoted = db.session.execute(
+                update(table)
+                .where(table.c.id == draft.id, table.c.status == "draft")
+                .values(status="new", client_id=draft.client_id or _client_id(user_id),
+                        updated_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            db.session.refresh(draft)
+            if not promoted:
+                # Another worker confirmed this draft at the same moment and notifies for it
+                return draft
+            logger.info(f"TechSpecSubmission finalized from draft: id={draft.id}")
+    except Exception as exc:
+        logger.error(f"finalize_submission failed: {exc}")
+        db.session.rollback()
+        draft = None
+
+    if draft is None:
+        return save_and_notify(history, user_id=user_id, language=language, conversation_id=conversation_id)
+
+    try:
+        notify_telegram(draft)
+    except Exception as exc:
+        logger.error(f"Telegram notification failed after finalize: {exc}")
+    return draft
+
 
 def save_and_notify(
     history: List[Dict[str, Any]],
     user_id: Optional[int],
     language: str = "en",
+    conversation_id: Optional[str] = None,
 ) -> Optional[Any]:
     """
     Full pipeline: transcript → extract fields → save to DB → Telegram.
@@ -245,7 +559,7 @@ def save_and_notify(
         return None
 
     fields = extract_spec_fields(transcript, language)
-    submission = save_submission(fields, user_id=user_id)
+    submission = save_submission(fields, user_id=user_id, conversation_id=conversation_id)
 
     if submission:
         try:
@@ -4,11 +4,13 @@ This module provides functions to connect to Telegram API using direct IP addres
 when DNS resolution fails.
 """
 
-import requests
 import logging
-import time
+import threading
 import os
 
+from app.services.telegram_ratelimit import limiter, retry_after_from
+from app.services.telegram_transport import TELEGRAM_HOST, TIMEOUT, api_url, get_session, race_connect
+
 logger = logging.getLogger(__name__)
 
 # Known IP addresses for api.telegram.org
@@ -21,6 +23,31 @@ TELEGRAM_IPS = [
     '91.108.56.100'
 ]
 
+# Address that delivered last; it starts first in the next race
+_last_good = None
+_last_good_lock = threading.Lock()
+
+
+def _candidates():
+    with _last_good_lock:
+        preferred = _last_good
+    if preferred in TELEGRAM_IPS:
+        return [preferred] + [ip for ip in TELEGRAM_IPS if ip != preferred]
+    return list(TELEGRAM_IPS)
+
+
+def _remember(ip):
+    global _last_good
+    with _last_good_lock:
+        _last_good = ip
+
+
+def _forget(ip):
+    global _last_good
+    with _last_good_lock:
+        if _last_good == ip:
+            _last_good = None
+
 def get_telegram_config():
     """
     Get Telegram configuration from environment variables.
@@ -37,59 +64,73 @@ def get_telegram_config():
     
     return bot_token, chat_id, True
 
-def send_via_ip_addresses(message, max_retries=3):
+def send_via_ip_addresses(message, max_retries=3, bot_token=None, chat_id=None):
     """
     Send message to Telegram API using direct IP addresses instead of domain name.
     This is a workaround for environments with DNS resolution issues.
+    Connections to all known IPs are raced with staggered starts (last
+    working IP first); the request goes over the first one that connects,
+    through the shared pool in telegram_transport, verified against the
+    api.telegram.org certificate.
     
     Args:
         message (str): Message to send
-        max_retries (int): Maximum number of retry attempts
+        max_retries (int): Maximum number of races (each IP that fails a request is left out of the next)
+        bot_token (str): Bot token (default: from environment)
+        chat_id (str): Chat id (default: from environment)
     
     Returns:
         bool: True if successful, False otherwise
     """
-    bot_token, chat_id, is_valid = get_telegram_config()
+    if bot_token and chat_id:
+        is_valid = True
+    else:
+        bot_token, chat_id, is_valid = get_telegram_config()
     
     if not is_valid:
         logger.error("Invalid Telegram configuration - missing bot token or chat ID")
         return False
     
+    session = get_session()
+    failed = set()
     for attempt in range(max_retries):
-        # Try with each IP
-        for ip in TELEGRAM_IPS:
-            try:
-                logger.info(f"Attempting to connect to Telegram API using IP {ip} (attempt {attempt+1}/{max_retries})")
-                url = f"https://{ip}/bot{bot_token}/sendMessage"
-                headers = {'Host': 'api.telegram.org'}
-                payload = {
-                    'chat_id': chat_id,
-                    'text': message,
-                    'parse_mode': 'HTML'
-                }
-                
-                # Отключаем проверку сертификата для прямых IP-подключений
-                # так как IP-адрес не будет соответствовать имени сертификата
-                response = requests.post(
-                    url, 
-                    headers=headers,
-                    data=payload, 
-                    timeout=(5, 15),
-                    verify=False  # Отключаем SSL верификацию для IP-соединений
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Message sent successfully using IP {ip}")
-                    return True
-                else:
-                    logger.error(f"Failed to send message using IP {ip}: {response.status_code}, {response.text}")
-            except Exception as e:
-                logger.error(f"Error sending to IP {ip}: {str(e)}")
-        
-        # Wait before next retry
-        if attempt < max_retries - 1:
-            wait_time = 2 ** attempt
-            logger.info(f"Waiting {wait_time} seconds before next retry...")
-            time.sleep(wait_time)
+        candidates = [ip for ip in _candidates() if ip not in failed]
+        if not candidates:
+            break
+        # Staggered parallel connects: bounded by ~one connect timeout
+        ip = race_connect(candidates)
+        if ip is None:
+            logger.error(f"No Telegram IP accepted a connection (tried {', '.join(candidates)})")
+            return False
+        try:
+            logger.info(f"Sending Telegram message via IP {ip} (attempt {attempt+1}/{max_retries})")
+            url = api_url(bot_token, 'sendMessage', address=ip)
+            headers = {'Host': TELEGRAM_HOST}
+            payload = {
+                'chat_id': chat_id,
+                'text': message,
+                'parse_mode': 'HTML'
+            }
+            
+            response = session.post(
+                url, 
+                headers=headers,
+                data=payload, 
+                timeout=TIMEOUT
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Message sent successfully using IP {ip}")
+                _remember(ip)
+                return True
+            elif response.status_code == 429:
+                limiter.block(chat_id, retry_after_from(response))
+                return False
+            else:
+                logger.error(f"Failed to send message using IP {ip}: {response.status_code}, {response.text}")
+        except Exception as e:
+            logger.error(f"Error sending to IP {ip}: {str(e)}")
+        failed.add(ip)
+        _forget(ip)
     
     return False
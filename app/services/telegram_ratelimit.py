@@ -0,0 +1,118 @@
+"""
+telegram_ratelimit.py
+
+Per-chat send rate for the Telegram Bot API.
+
+Telegram allows about one message per second into a chat (with short bursts)
+and answers faster senders with 429 and `parameters.retry_after`. Every
+queued send takes a token from the chat's bucket first; a 429 blocks the
+bucket until retry_after has passed, and the queue reschedules the message
+for that moment instead of retrying into the limit.
+
+Settings (env):
+  TELEGRAM_CHAT_RATE    sustained messages per second per chat (default 1)
+  TELEGRAM_CHAT_BURST   messages that may go out back to back (default 3)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+
+
+class TokenBucket:
+    """Classic token bucket plus a hard block set from retry_after."""
+
+    def __init__(self, rate: float = CHAT_RATE, burst: float = CHAT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # monotonic
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class ChatRateLimiter:
+    """One TokenBucket per chat id."""
+
+    def __init__(self, rate: float = CHAT_RATE, burst: float = CHAT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, chat_id: Optional[str]) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def delay(self, chat_id: Optional[str]) -> float:
+        with self._lock:
+            return self._bucket(chat_id).delay(time.monotonic())
+
+    def acquire(self, chat_id: Optional[str]) -> float:
+        """Take a token, sleeping until one is available; returns the time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                bucket = self._bucket(chat_id)
+                now = time.monotonic()
+                wait = bucket.delay(now)
+                if wait <= 0:
+                    bucket.take(now)
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def block(self, chat_id: Optional[str], retry_after: float) -> None:
+        """Telegram said 429: no sends to this chat for `retry_after` seconds."""
+        with self._lock:
+            bucket = self._bucket(chat_id)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            bucket.tokens = min(bucket.tokens, 0)
+        logger.warning(f"Telegram rate limit for chat {chat_id}: paused for {retry_after:.0f}s")
+
+    def retry_at(self, chat_id: Optional[str]) -> float:
+        """Wall-clock time the chat is unblocked (0 when not blocked)."""
+        with self._lock:
+            remaining = self._bucket(chat_id).blocked_until - time.monotonic()
+        return time.time() + remaining if remaining > 0 else 0.0
+
+
+limiter = ChatRateLimiter()
+
+
+def retry_after_from(response, default: float = 5.0) -> float:
+    """Read retry_after from a 429 response (JSON parameters, then the header)."""
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return default
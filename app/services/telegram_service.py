@@ -1,11 +1,15 @@
 import os
+import re
 import requests
 import logging
-import socket
 import time
-from typing import Dict, Any, Optional
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.notification_renderer import render_contact_form, render_tech_spec
+from app.services.telegram_ratelimit import limiter, retry_after_from
+from app.services.telegram_transport import TIMEOUT, api_url, get_session
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram sendMessage limit
 
 logger = logging.getLogger(__name__)
 
@@ -25,28 +29,88 @@ def get_telegram_config() -> tuple:
     
     return bot_token, chat_id, True
 
-def create_resilient_session() -> requests.Session:
+# Telegram HTML: tags, entities, runs of whitespace, words
+_TOKEN_RE = re.compile(r"<[^>]*>|&#?\w+;|\s+|[^<&\s]+|[<&]")
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def _open_tags(stack: List[Tuple[str, str]], token: str) -> List[Tuple[str, str]]:
+    """Open tags (name, opening tag) after `token`."""
+    tag = _TAG_RE.fullmatch(token)
+    if tag is None or token.endswith("/>"):
+        return stack
+    closing, name = tag.group(1), tag.group(2).lower()
+    if not closing:
+        return stack + [(name, token)]
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == name:
+            return stack[:i]
+    return stack
+
+
+def _closing(stack: List[Tuple[str, str]]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def split_message(message: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
     """
-    Create a requests session with retry mechanism for better network resilience.
+    Split a message into parts of at most `limit` characters, preferring
+    paragraph breaks, then line breaks, then spaces.
+
+    The message is Telegram HTML: cuts never fall inside a tag or an entity
+    such as &amp;, and tags open at a cut are closed at the end of the part
+    and reopened at the start of the next one, so every part parses.
     
+    Args:
+        message (str): The message to split
+        limit (int): Maximum part length
+        
     Returns:
-        requests.Session: Session with retry configuration
+        List[str]: Parts in order (one part if the message fits)
     """
-    session = requests.Session()
-    
-    # Configure retry strategy
-    retry_strategy = Retry(
-        total=3,  # Total number of retries
-        status_forcelist=[429, 500, 502, 503, 504],  # Status codes to retry on
-        allowed_methods=["GET", "POST"],  # Methods to retry
-        backoff_factor=1  # Backoff factor for exponential backoff
-    )
-    
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    
-    return session
+    if len(message) <= limit:
+        return [message]
+
+    parts = []
+    tokens = _TOKEN_RE.findall(message)[::-1]  # next token last
+    current: List[str] = []
+    length, has_text = 0, False
+    stack: List[Tuple[str, str]] = []
+    cut = None  # best break so far: (rank, index in current, open tags there)
+    while tokens:
+        token = tokens.pop()
+        after = _open_tags(stack, token)
+        if length + len(token) + len(_closing(after)) <= limit:
+            if token.isspace():
+                rank = 3 if "\n\n" in token else 2 if "\n" in token else 1
+                if has_text and (cut is None or rank >= cut[0]):
+                    cut = (rank, len(current), stack)
+            elif after is stack:
+                has_text = True
+            current.append(token)
+            length += len(token)
+            stack = after
+            continue
+
+        tokens.append(token)
+        if cut is not None:
+            _, index, open_at = cut
+            head, rest = current[:index], current[index + 1:]
+        elif has_text:
+            head, rest, open_at = current, [], stack
+        else:
+            # A single word longer than the limit: hard cut
+            tokens.pop()
+            room = max(1, limit - length - len(_closing(stack)))
+            head, rest, open_at = current + [token[:room]], [], stack
+            tokens.append(token[room:])
+        parts.append("".join(head).rstrip() + _closing(open_at))
+        tokens.extend(reversed([tag for _, tag in open_at] + rest))
+        current, length, has_text, stack, cut = [], 0, False, [], None
+
+    if has_text:
+        parts.append("".join(current))
+    return [p for p in parts if _TAG_RE.sub("", p).strip()]
 
 def send_telegram_message(message: str, max_retries: int = 3) -> bool:
     """
@@ -67,11 +131,8 @@ def send_telegram_message(message: str, max_retries: int = 3) -> bool:
         logger.error("Invalid Telegram configuration - missing bot token or chat ID")
         return False
     
-    # Set DNS cache timeout to 0 to force new DNS resolution
-    socket.setdefaulttimeout(15)  # 15 seconds timeout
-    
-    # Use our resilient session with retries
-    session = create_resilient_session()
+    # Process-wide keep-alive session with retries and cached DNS
+    session = get_session()
     
     # Flag to track if we need to try IP-based fallback
     dns_failed = False
@@ -79,7 +140,7 @@ def send_telegram_message(message: str, max_retries: int = 3) -> bool:
     # First try standard domain-based approach
     for attempt in range(max_retries):
         try:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+            url = api_url(bot_token, 'sendMessage')
             payload = {
                 'chat_id': chat_id,
                 'text': message,
@@ -88,11 +149,15 @@ def send_telegram_message(message: str, max_retries: int = 3) -> bool:
             
             # Use a direct requests call to bypass any potential database operations
             logger.info(f"Sending Telegram message via domain (attempt {attempt+1}/{max_retries})")
-            response = session.post(url, data=payload, timeout=(5, 15))  # Connect timeout, Read timeout
+            response = session.post(url, data=payload, timeout=TIMEOUT)  # Connect timeout, Read timeout
             
             if response.status_code == 200:
                 logger.info(f"Message sent to Telegram successfully")
                 return True
+            elif response.status_code == 429:
+                # Rate limited: the queue reschedules after retry_after
+                limiter.block(chat_id, retry_after_from(response))
+                return False
             else:
                 logger.error(f"Failed to send message to Telegram. Status code: {response.status_code}, Response: {response.text}")
                 
@@ -108,7 +173,7 @@ def send_telegram_message(message: str, max_retries: int = 3) -> bool:
                 
         except requests.exceptions.ConnectionError as e:
             logger.error(f"Connection error sending message to Telegram: {str(e)}")
-            if "getaddrinfo failed" in str(e):
+            if "getaddrinfo failed" in str(e) or "Failed to resolve" in str(e):
                 # DNS resolution issue, mark for IP fallback
                 logger.info("DNS resolution failed, will try direct IP connection")
                 dns_failed = True
@@ -135,7 +200,7 @@ def send_telegram_message(message: str, max_retries: int = 3) -> bool:
         logger.info("Trying IP-based fallback for Telegram API...")
         try:
             from app.services.telegram_ip_service import send_via_ip_addresses
-            return send_via_ip_addresses(message, max_retries=2)
+            return send_via_ip_addresses(message, max_retries=2, bot_token=bot_token, chat_id=chat_id)
         except Exception as e:
             logger.error(f"IP-based fallback also failed: {str(e)}")
             return False
@@ -154,67 +219,7 @@ def send_tech_spec_notification(tech_spec_data: Dict[str, Any], contact_info: Op
     Returns:
         bool or str: True if the message was sent successfully, or the message content if return_message_only=True
     """
-    # Format the technical specification data into a readable message
-    message = "<b>🔔 New Technical Specification Submitted</b>\n\n"
-    
-    # Add contact information if available
-    if contact_info:
-        message += "<b>📋 Contact Information:</b>\n"
-        if contact_info.get('name'):
-            message += f"<b>Name:</b> {contact_info.get('name')}\n"
-        if contact_info.get('email'):
-            message += f"<b>Email:</b> {contact_info.get('email')}\n"
-        if contact_info.get('phone'):
-            message += f"<b>Phone:</b> {contact_info.get('phone')}\n"
-        message += "\n"
-    
-    # Add divider for better readability
-    message += "<b>═══════════ TECHNICAL SPECIFICATION ═══════════</b>\n\n"
-    
-    # Add each section of the tech spec with detailed questions and answers
-    if 'answers' in tech_spec_data:
-        # First, load the TechSpecTemplate to get all questions
-        from app.agents.tech_spec import TechSpecTemplate
-        template = TechSpecTemplate(language=tech_spec_data.get('language', 'en'))
-        
-        for i, answer in enumerate(tech_spec_data.get('answers', [])):
-            if 'question' in answer and 'answer' in answer:
-                section_title = answer.get('question', '')
-                message += f"<b>{i+1}. {section_title}</b>\n\n"
-                
-                # Get the actual questions for this section
-                section_questions = []
-                if i < len(template.sections):
-                    section_questions = template.sections[i]['questions']
-                
-                # Split the answers by newline
-                answer_text = answer.get('answer', '')
-                answers_list = answer_text.split('\n')
-                
-                # If we have all the answers (one per line) and the questions
-                if len(answers_list) >= len(section_questions) and section_questions:
-                    # Display each question with its corresponding answer
-                    for q_idx, question in enumerate(section_questions):
-                        if q_idx < len(answers_list):
-                            message += f"   <b>❓ {question}</b>\n"
-                            answer_line = answers_list[q_idx].strip()
-                            if answer_line:  # Only add if we have an answer
-                                message += f"   <b>👉</b> {answer_line}\n\n"
-                            else:
-                                message += f"   <i>No answer provided</i>\n\n"
-                else:
-                    # Fallback to displaying the entire answer text
-                    formatted_answer = answer_text.replace('\n', '\n   ')
-                    if formatted_answer.strip():
-                        message += f"   {formatted_answer}\n\n"
-                    else:
-                        message += f"   <i>No details provided</i>\n\n"
-    
-    # Add timestamp
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    message += f"<b>═════════════════════════════════════════</b>\n"
-    message += f"<i>Submitted at: {timestamp}</i>"
+    message = render_tech_spec(tech_spec_data, contact_info)
     
     # If only returning the message content, do so now
     if return_message_only:
@@ -223,28 +228,20 @@ def send_tech_spec_notification(tech_spec_data: Dict[str, Any], contact_info: Op
     # Otherwise send the message
     return send_telegram_message(message)
 
-def send_contact_form_notification(form_data: Dict[str, str]) -> bool:
+def send_contact_form_notification(form_data: Dict[str, str], return_message_only: bool = False) -> bool:
     """
     Send a notification about a new contact form submission.
     
     Args:
         form_data (Dict[str, str]): The form data containing name, email, and message
+        return_message_only (bool): If True, returns the message string instead of sending it
         
     Returns:
-        bool: True if the message was sent successfully, False otherwise
+        bool or str: True if the message was sent successfully, or the message content if return_message_only=True
     """
-    name = form_data.get('name', 'Not provided')
-    email = form_data.get('email', 'Not provided')
-    message_content = form_data.get('message', 'No message')
-    
-    message = "<b>📩 New Contact Form Submission</b>\n\n"
-    message += f"<b>Name:</b> {name}\n"
-    message += f"<b>Email:</b> {email}\n"
-    message += f"<b>Message:</b>\n{message_content}\n"
-    
-    # Add timestamp
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    message += f"\n<i>Submitted at: {timestamp}</i>"
+    message = render_contact_form(form_data)
     
+    if return_message_only:
+        return message
+        
     return send_telegram_message(message)
@@ -0,0 +1,265 @@
+"""
+telegram_transport.py
+
+Process-wide HTTP transport for the Telegram Bot API.
+
+Both delivery paths — the domain path in telegram_service and the direct-IP
+fallback in telegram_ip_service — share one pooled requests.Session, so a
+notification reuses an open keep-alive TLS connection instead of paying DNS,
+TCP and TLS handshakes every time.
+
+DNS answers for api.telegram.org are cached for DNS_TTL seconds. When the
+resolver fails, the last good answer keeps being used (stale-on-error), which
+covers the flaky-resolver environments the IP fallback was written for. A
+cached address that refuses connections is dropped so the next connection
+resolves again.
+
+Every pool verifies TLS against api.telegram.org, including pools opened to a
+bare IP by the fallback, so the fallback no longer needs verify=False.
+
+race_connect() implements "happy eyeballs" for the IP fallback: TCP
+connects to several addresses start RACE_STAGGER seconds apart (a refused
+connect starts the next one at once), the first socket that connects wins and
+is handed to the next pooled connection to that address; the others are
+closed. A race takes at most about one CONNECT_TIMEOUT.
+
+Timeouts are per request (CONNECT_TIMEOUT, READ_TIMEOUT); nothing here
+touches socket.setdefaulttimeout, which would leak into every socket of the
+process (database connections included).
+
+Settings (env):
+  TELEGRAM_POOL_SIZE        keep-alive connections per host (default 4)
+  TELEGRAM_DNS_TTL          seconds a resolved address is reused (default 300)
+  TELEGRAM_CONNECT_TIMEOUT  TCP/TLS connect timeout in seconds (default 5)
+  TELEGRAM_READ_TIMEOUT     response timeout in seconds (default 15)
+  TELEGRAM_RACE_STAGGER     delay between racing connection attempts (default 0.25)
+"""
+from __future__ import annotations
+
+import errno
+import ipaddress
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_HOST = "api.telegram.org"
+
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "4"))
+DNS_TTL = float(os.getenv("TELEGRAM_DNS_TTL", "300"))
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "15"))
+RACE_STAGGER = float(os.getenv("TELEGRAM_RACE_STAGGER", "0.25"))
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+PREPARED_SOCKET_TTL = 30.0  # a raced socket not picked up by then is closed
+
+
+# ── DNS cache ─────────────────────────────────────────────────────────────────
+
+class DNSCache:
+    """host → resolved addresses with a TTL; serves stale answers when DNS fails."""
+
+    def __init__(self, ttl: float = DNS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    def resolve(self, host: str, port: int = 443) -> List[str]:
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            if entry:
+                logger.warning(f"DNS lookup for {host} failed; using cached {entry[1][0]}")
+                return entry[1]
+            raise
+
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host: str, port: int = 443) -> None:
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+dns_cache = DNSCache()
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+        return True
+    except ValueError:
+        return False
+
+
+# ── connection racing ─────────────────────────────────────────────────────────
+
+_prepared: Dict[Tuple[str, int], Tuple[float, socket.socket]] = {}
+_prepared_lock = threading.Lock()
+
+_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035}  # 10035: WSAEWOULDBLOCK
+
+
+def _park(address: str, port: int, sock: socket.socket) -> None:
+    with _prepared_lock:
+        old = _prepared.pop((address, port), None)
+        _prepared[(address, port)] = (time.monotonic(), sock)
+    if old:
+        old[1].close()
+
+
+def _take_prepared(address: str, port: int) -> Optional[socket.socket]:
+    with _prepared_lock:
+        entry = _prepared.pop((address, port), None)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > PREPARED_SOCKET_TTL:
+        entry[1].close()
+        return None
+    return entry[1]
+
+
+def race_connect(
+    addresses: List[str],
+    port: int = 443,
+    timeout: float = CONNECT_TIMEOUT,
+    stagger: float = RACE_STAGGER,
+) -> Optional[str]:
+    """
+    Race TCP connects to `addresses` (in preference order) and return the
+    first address that accepted, or None. The winning socket is parked for
+    the next pooled connection to that address.
+    """
+    waiting = list(addresses)
+    selector = selectors.DefaultSelector()
+    next_start = time.monotonic()
+    try:
+        while waiting or selector.get_map():
+            now = time.monotonic()
+            if waiting and now >= next_start:
+                address = waiting.pop(0)
+                family = socket.AF_INET6 if ":" in address else socket.AF_INET
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                if sock.connect_ex((address, port)) in _IN_PROGRESS:
+                    selector.register(sock, selectors.EVENT_WRITE, (address, now + timeout))
+                    next_start = now + stagger
+                else:
+                    sock.close()
+                    next_start = now
+                continue
+
+            deadlines = [key.data[1] for key in selector.get_map().values()]
+            wake = min(deadlines + ([next_start] if waiting else []))
+            for key, _ in selector.select(max(0.0, wake - now)):
+                sock, (address, _) = key.fileobj, key.data
+                selector.unregister(sock)
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    sock.setblocking(True)
+                    sock.settimeout(timeout)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    _park(address, port, sock)
+                    return address
+                sock.close()
+                next_start = time.monotonic()  # failed fast: start the next one now
+
+            now = time.monotonic()
+            for key in list(selector.get_map().values()):
+                if key.data[1] <= now:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+        return None
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+
+class _CachedDNSHTTPSConnection(HTTPSConnection):
+    """Connects to the cached address; TLS still uses the real host name."""
+
+    def _new_conn(self):
+        if _is_ip(self.host):
+            return _take_prepared(self.host, self.port) or super()._new_conn()
+        self._dns_host = dns_cache.resolve(self.host, self.port)[0]
+        try:
+            return super()._new_conn()
+        except Exception:
+            dns_cache.invalidate(self.host, self.port)
+            raise
+
+
+class _CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+class TelegramAdapter(HTTPAdapter):
+    """Keep-alive pools that resolve through dns_cache and verify api.telegram.org."""
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        # Direct-IP pools present the Telegram certificate too
+        pool_kwargs.setdefault("server_hostname", TELEGRAM_HOST)
+        pool_kwargs.setdefault("assert_hostname", TELEGRAM_HOST)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            **self.poolmanager.pool_classes_by_scheme,
+            "https": _CachedDNSHTTPSConnectionPool,
+        }
+
+
+# ── session ───────────────────────────────────────────────────────────────────
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=3,  # Total number of retries
+        status_forcelist=[500, 502, 503, 504],  # 429 goes back to the queue scheduler
+        allowed_methods=["GET", "POST"],  # Methods to retry
+        backoff_factor=1  # Backoff factor for exponential backoff
+    )
+    adapter = TelegramAdapter(pool_connections=8, pool_maxsize=POOL_SIZE, max_retries=retry_strategy)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return this process's Telegram session (rebuilt after fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+        return _session
+
+
+def api_url(bot_token: str, method: str, address: Optional[str] = None) -> str:
+    """Bot API URL; `address` replaces the host name with a literal IP."""
+    return f"https://{address or TELEGRAM_HOST}/bot{bot_token}/{method}"
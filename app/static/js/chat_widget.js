@@ -419,6 +419,58 @@
     return indicator;
   }
 
+  /**
+   * Reads `delta` / `done` / `error` events from /api/chat/stream, showing the
+   * answer in a live bubble while it is generated. The live bubble is removed
+   * at the end so the caller renders the final answer through appendMessage().
+   */
+  async function readChatStream(resp, thinking) {
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    let live = null;
+    let final = {};
+
+    const handleEvent = (block) => {
+      let name = 'message';
+      let data = '';
+      block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) name = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (!data) return;
+      let evt;
+      try { evt = JSON.parse(data); } catch (e) { return; }
+      if (name === 'delta') {
+        if (!live) {
+          if (thinking) thinking.remove();
+          live = document.createElement('div');
+          live.className = 'chat-msg bot high-contrast';
+          messagesEl.appendChild(live);
+        }
+        answer += evt.text || '';
+        live.textContent = answer;
+        messagesEl.scrollTop = messagesEl.scrollHeight;
+      } else if (name === 'done' || name === 'error') {
+        final = evt;
+      }
+    };
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const parts = buffer.split('\n\n');
+      buffer = parts.pop();
+      parts.forEach(handleEvent);
+    }
+    if (buffer.trim()) handleEvent(buffer);
+    if (live) live.remove();
+
+    return { ...final, answer: final.answer || answer };
+  }
+
   /**
    * Sends message to backend API
    */
@@ -436,33 +488,28 @@
       // Show typing indicator
       const thinking = showTypingIndicator();
       
-      // Include conversation history for spec agent context & save trigger
-      // Trim to last 30 entries to keep payload small
-      const historySlice = conversationHistory.slice(-30).map(e => ({
-        text: e.text || '',
-        type: e.type || 'bot'
-      }));
+      // History is kept server-side; only report the last message id we have seen
+      const body = JSON.stringify({
+        message,
+        last_message_id: metadata.last_message_id || null,
+        metadata: {
+          ...metadata,
+          // Ensure these keys are always present for API
+          user_id: metadata.user_id || getStableUserId(),
+          language: metadata.language || detectLanguage(),
+          suppress_greeting: !!metadata.suppress_greeting
+        }
+      });
 
-      const resp = await fetch('/api/chat', {
+      const canStream = !!(window.ReadableStream && window.TextDecoder);
+      const resp = await fetch(canStream ? '/api/chat/stream' : '/api/chat', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({
-          message,
-          history: historySlice,
-          metadata: {
-            ...metadata,
-            // Ensure these keys are always present for API
-            user_id: metadata.user_id || getStableUserId(),
-            language: metadata.language || detectLanguage(),
-            suppress_greeting: !!metadata.suppress_greeting
-          }
-        })
+        body
       });
       
-      // Remove typing indicator
-      if (thinking) thinking.remove();
-      
       if (!resp.ok) {
+        if (thinking) thinking.remove();
         // Если произошла ошибка 400 или 302 (перенаправление из-за CSRF), 
         // перезагрузим страницу чтобы обновить CSRF токен
         if (resp.status === 400 || resp.status === 302) {
@@ -478,12 +525,20 @@
         throw new Error(`Server responded with ${resp.status}`);
       }
       
-      const result = await resp.json();
+      const result = canStream && resp.body
+        ? await readChatStream(resp, thinking)
+        : await resp.json();
+
+      // Remove typing indicator
+      if (thinking) thinking.remove();
       
       // Update conversation ID if provided
       if (result.conversation_id) {
         metadata.conversation_id = result.conversation_id;
       }
+      if (result.message_id) {
+        metadata.last_message_id = result.message_id;
+      }
       
       if (result.answer) {
         appendMessage(result.answer, 'bot');
@@ -495,6 +550,8 @@
       if (result.spec_saved) {
         conversationHistory = [];
         localStorage.removeItem('rozoom_history');
+        delete metadata.conversation_id;
+        delete metadata.last_message_id;
         metadata.selected_agent = 'greeter';
         metadata.active_specialist = 'greeter';
       }
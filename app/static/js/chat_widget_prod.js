@@ -15,6 +15,8 @@
       conversationId = genUUID();
       localStorage.setItem('chat_conversation_id', conversationId);
     }
+    // History is kept server-side; we only report the last message we have seen
+    var lastMessageId = parseInt(localStorage.getItem('chat_last_message_id') || '', 10) || null;
     var userId = localStorage.getItem('rozoom_user_id');
     if (!userId) {
       userId = genUUID();
@@ -95,25 +97,25 @@
         selected_agent: selectedAgent
       };
 
-      fetch('/api/chat', {
-        method: 'POST',
-        headers: headers,
-        body: JSON.stringify({ message: text, metadata: metadata })
-      })
-      .then(function(res){ return res.json().catch(function(){ return {}; }); })
+      var payload = JSON.stringify({ message: text, last_message_id: lastMessageId, metadata: metadata });
+
+      streamChat(payload, headers, thinking)
       .then(function(data){
-        if (thinking && thinking.remove) thinking.remove();
-        var ans = (data && data.answer) ? data.answer : (
-          metadata.language === 'uk' ? 'Сталася помилка. Спробуйте ще раз.' :
-          metadata.language === 'ru' ? 'Произошла ошибка. Попробуйте еще раз.' :
-          metadata.language === 'de' ? 'Ein Fehler ist aufgetreten. Bitte versuchen Sie es erneut.' :
-          'An error occurred. Please try again.'
-        );
-        appendMsg(ans, 'bot');
         if (data && data.conversation_id) {
           conversationId = data.conversation_id;
           localStorage.setItem('chat_conversation_id', conversationId);
         }
+        if (data && data.message_id) {
+          lastMessageId = data.message_id;
+          localStorage.setItem('chat_last_message_id', String(lastMessageId));
+        }
+        // Brief saved: the next message starts a fresh conversation
+        if (data && data.spec_saved) {
+          conversationId = genUUID();
+          lastMessageId = null;
+          localStorage.setItem('chat_conversation_id', conversationId);
+          localStorage.removeItem('chat_last_message_id');
+        }
       })
       .catch(function(){
         if (thinking && thinking.remove) thinking.remove();
@@ -126,6 +128,86 @@
       });
     }
 
+    function errorText(lang) {
+      return lang === 'uk' ? 'Сталася помилка. Спробуйте ще раз.' :
+             lang === 'ru' ? 'Произошла ошибка. Попробуйте еще раз.' :
+             lang === 'de' ? 'Ein Fehler ist aufgetreten. Bitte versuchen Sie es erneut.' :
+             'An error occurred. Please try again.';
+    }
+
+    // Plain JSON request — used when the browser cannot read streamed bodies
+    function postChatJson(payload, headers, thinking) {
+      return fetch('/api/chat', { method: 'POST', headers: headers, body: payload })
+      .then(function(res){ return res.json().catch(function(){ return {}; }); })
+      .then(function(data){
+        if (thinking && thinking.remove) thinking.remove();
+        appendMsg((data && data.answer) ? data.answer : errorText(detectLanguage()), 'bot');
+        return data;
+      });
+    }
+
+    // POST to the SSE endpoint and render `delta` events as they arrive.
+    // Resolves with the payload of the final `done` (or `error`) event.
+    function streamChat(payload, headers, thinking) {
+      if (!window.ReadableStream || !window.TextDecoder) {
+        return postChatJson(payload, headers, thinking);
+      }
+      return fetch('/api/chat/stream', { method: 'POST', headers: headers, body: payload })
+      .then(function(res){
+        if (!res.ok || !res.body) return postChatJson(payload, headers, thinking);
+
+        var reader = res.body.getReader();
+        var decoder = new TextDecoder();
+        var buffer = '';
+        var bubble = null;
+        var answer = '';
+        var final = null;
+
+        function handleEvent(block) {
+          var name = 'message', data = '';
+          block.split('\n').forEach(function(line){
+            if (line.indexOf('event:') === 0) name = line.slice(6).trim();
+            else if (line.indexOf('data:') === 0) data += line.slice(5).trim();
+          });
+          if (!data) return;
+          var evt;
+          try { evt = JSON.parse(data); } catch (e) { return; }
+          if (name === 'delta') {
+            if (!bubble) {
+              if (thinking && thinking.remove) thinking.remove();
+              bubble = appendMsg('', 'bot');
+            }
+            answer += evt.text || '';
+            bubble.innerHTML = answer.replace(/\n/g, '<br>');
+            messages.scrollTop = messages.scrollHeight;
+          } else if (name === 'done' || name === 'error') {
+            final = evt;
+            if (name === 'error' && !bubble) {
+              if (thinking && thinking.remove) thinking.remove();
+              bubble = appendMsg(evt.answer || errorText(detectLanguage()), 'bot');
+            }
+          }
+        }
+
+        function pump() {
+          return reader.read().then(function(chunk){
+            if (chunk.done) {
+              if (buffer.trim()) handleEvent(buffer);
+              if (thinking && thinking.remove) thinking.remove();
+              if (!bubble) appendMsg(errorText(detectLanguage()), 'bot');
+              return final || {};
+            }
+            buffer += decoder.decode(chunk.value, { stream: true });
+            var parts = buffer.split('\n\n');
+            buffer = parts.pop();
+            parts.forEach(handleEvent);
+            return pump();
+          });
+        }
+        return pump();
+      });
+    }
+
     // Agent toggle events removed — agent is auto-selected from the page.
     // Keep wireAgentButton stub in case templates call openChat directly.
 
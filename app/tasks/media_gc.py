@@ -0,0 +1,24 @@
+"""
+Еженедельная уборка: media_blobs без ссылок и устаревшие сгенерированные файлы картинок
+"""
+
+import logging
+from app import create_app
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def collect_media_garbage():
+    """
+    Задача для сборки мусора в хранилище картинок
+    Запускается через планировщик
+    """
+    app = create_app()
+    with app.app_context():
+        from app.services.media_store import collect_garbage
+        report = collect_garbage()
+        logger.info(
+            f"Media GC finished: {len(report.blobs)} blob(s), {len(report.files)} file(s) removed, "
+            f"{report.recounted} refcount(s) corrected"
+        )
@@ -14,3 +14,31 @@ def init_app(app):
         if not text:
             return ''
         return Markup(markdown.markdown(text))
+
+    # URL картинки поста с хешем содержимого: браузеры и CDN кешируют её навсегда
+    @app.template_global('blog_image_url')
+    def blog_image_url(post, **kwargs):
+        from flask import url_for
+        image_hash = getattr(post, 'image_hash', None)
+        if image_hash:
+            kwargs['v'] = image_hash
+        return url_for('blog.get_image', post_id=post.id, **kwargs)
+
+    # Уменьшенные варианты картинки (card/hero/og) для <picture>/srcset
+    @app.template_global('blog_image_variant_url')
+    def blog_image_variant_url(post, name, fmt, **kwargs):
+        from flask import url_for
+        return url_for('blog.get_image_variant', post_id=post.id, name=name, fmt=fmt,
+                       v=post.image_hash, **kwargs)
+
+    @app.template_global('blog_image_srcset')
+    def blog_image_srcset(post, kind, fmt):
+        from app.services.image_variants import SPECS, SRCSETS
+        return ', '.join(
+            f"{blog_image_variant_url(post, name, fmt)} {SPECS[name].width}w" for name in SRCSETS[kind]
+        )
+
+    @app.template_global('image_variant_formats')
+    def image_variant_formats():
+        from app.services.image_variants import supported_formats
+        return supported_formats()
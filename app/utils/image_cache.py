@@ -0,0 +1,99 @@
+"""
+image_cache.py
+
+Content-addressed disk cache for image bytes stored in the database.
+
+Every blog image is identified by the SHA-256 of its bytes
+(BlogPost.image_hash, the key of its row in media_blobs). The cache keeps
+the bytes once per hash on local disk, so the image route reads a blob from
+the database at most once per host and afterwards streams the file. A file
+never changes under its name — a new image is a new hash — so entries need no
+invalidation, and the hash doubles as the strong ETag and the version in
+image URLs (blog_image_url()).
+
+Settings (env):
+  IMAGE_CACHE_DIR   cache directory (default data/image_cache)
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
+CACHE_DIR = os.getenv('IMAGE_CACHE_DIR') or os.path.join(DATA_DIR, 'image_cache')
+
+_HASH_RE = re.compile(r'[0-9a-f]{64}')
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def derived_key(source_hash: str, name: str) -> str:
+    """Cache key of a file derived from `source_hash` (e.g. 'card-480.webp')."""
+    return hashlib.sha256(f"{source_hash}/{name}".encode()).hexdigest()
+
+
+def is_hash(value: Optional[str]) -> bool:
+    return bool(value) and _HASH_RE.fullmatch(value) is not None
+
+
+def sniff_mime(head: bytes) -> str:
+    """Image MIME type from the first bytes (PNG when unknown)."""
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if head[:2] == b'\xff\xd8':
+        return 'image/jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return 'image/png'
+
+
+def path_for(digest: str, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, digest[:2], digest)
+
+
+def get(digest: str, cache_dir: Optional[str] = None) -> Optional[str]:
+    """Path of the cached bytes for `digest`, or None on a miss."""
+    if not is_hash(digest):
+        return None
+    path = path_for(digest, cache_dir)
+    return path if os.path.isfile(path) else None
+
+
+def put(digest: str, data: bytes, cache_dir: Optional[str] = None) -> Optional[str]:
+    """Store `data` under `digest` (atomically) and return its path; None if the disk refuses."""
+    if not is_hash(digest) or not data:
+        return None
+    path = path_for(digest, cache_dir)
+    if os.path.isfile(path):
+        return path
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as exc:
+        logger.warning(f"Image cache write failed for {digest[:12]}: {exc}")
+        return None
+    return path
+
+
+def read_head(path: str, size: int = 16) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read(size)
@@ -0,0 +1,324 @@
+"""
+mail_queue.py
+
+Outgoing email off the request path.
+
+queue_mail() stores the message in a SQLite outbox and wakes the sender
+thread; the request handler returns without touching SMTP. The outbox is the
+same store as the Telegram queue (app/utils/telegram_outbox.py) in its own
+file, one JSON document per mail, so mails get the same states
+(pending / leased / sent / dead), per-message attempts and last_error, and
+leases that let every gunicorn worker run a sender without sending twice.
+
+The sender claims due mails in batches and sends a batch over one
+authenticated SMTP connection (STARTTLS/SSL and login once per batch instead
+of once per mail). Each mail's lease is renewed right before it is sent, so a
+slow batch cannot outlive its claim and have its tail sent by another worker
+as well. Failures are rescheduled per mail with jittered
+exponential backoff; permanent 5xx rejections and mails that used up
+MAX_RETRIES become dead letters.
+
+SMTP settings are the Flask-Mail ones (MAIL_SERVER, MAIL_PORT, MAIL_USE_TLS,
+MAIL_USE_SSL, MAIL_USERNAME, MAIL_PASSWORD, MAIL_DEFAULT_SENDER), taken from
+the app config by init_app().
+
+Settings (env):
+  MAIL_QUEUE_DB          outbox file (default data/mail_queue.sqlite3)
+  MAIL_MAX_RETRIES       attempts per mail before it is a dead letter (default 5)
+  MAIL_RETRY_INTERVAL    base backoff delay in seconds (default 60)
+  MAIL_POLL_INTERVAL     longest idle sleep of the sender in seconds (default 30)
+  MAIL_SMTP_TIMEOUT      SMTP socket timeout in seconds (default 20)
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Iterable, List, Optional, Union
+
+from app.utils.telegram_outbox import DATA_DIR, OutboxMessage, TelegramOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(DATA_DIR, 'mail_queue.sqlite3')
+
+MAX_RETRIES = int(os.getenv('MAIL_MAX_RETRIES', '5'))
+RETRY_INTERVAL = float(os.getenv('MAIL_RETRY_INTERVAL', '60'))
+POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', '30'))
+SMTP_TIMEOUT = float(os.getenv('MAIL_SMTP_TIMEOUT', '20'))
+BACKOFF_CAP = 3600
+BATCH_SIZE = 20  # mails per SMTP connection
+MIN_WAKE = 1.0
+
+
+class MailOutbox(TelegramOutbox):
+    """The Telegram outbox store, kept in its own file for mail."""
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path or os.getenv('MAIL_QUEUE_DB') or DEFAULT_PATH)
+
+
+@dataclass(frozen=True)
+class SMTPSettings:
+    server: str = 'localhost'
+    port: int = 25
+    use_tls: bool = False
+    use_ssl: bool = False
+    username: Optional[str] = None
+    password: Optional[str] = None
+    default_sender: Optional[str] = None
+    timeout: float = SMTP_TIMEOUT
+
+    @classmethod
+    def from_config(cls, config) -> 'SMTPSettings':
+        sender = config.get('MAIL_DEFAULT_SENDER')
+        if isinstance(sender, (tuple, list)):  # Flask-Mail allows (name, address)
+            sender = f"{sender[0]} <{sender[1]}>"
+        return cls(
+            server=config.get('MAIL_SERVER') or 'localhost',
+            port=int(config.get('MAIL_PORT') or 25),
+            use_tls=bool(config.get('MAIL_USE_TLS')),
+            use_ssl=bool(config.get('MAIL_USE_SSL')),
+            username=config.get('MAIL_USERNAME'),
+            password=config.get('MAIL_PASSWORD'),
+            default_sender=sender,
+        )
+
+
+def _build_message(mail: dict, default_sender: Optional[str]) -> EmailMessage:
+    msg = EmailMessage()
+    msg['Subject'] = mail['subject']
+    msg['From'] = mail.get('sender') or default_sender or 'noreply@localhost'
+    msg['To'] = ', '.join(mail['recipients'])
+    msg['Date'] = formatdate(mail.get('created_at'), localtime=True)
+    msg['Message-ID'] = mail.get('message_id') or make_msgid()
+    msg.set_content(mail.get('body') or 'This message requires an HTML-capable mail client.')
+    if mail.get('html'):
+        msg.add_alternative(mail['html'], subtype='html')
+    return msg
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """5xx rejections (and unreadable outbox rows) will not succeed on retry."""
+    if isinstance(exc, ValueError):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return exc.smtp_code >= 500
+    return False
+
+
+class MailSender:
+    """Background thread that drains the mail outbox in per-connection batches."""
+
+    def __init__(
+        self,
+        outbox: Optional[MailOutbox] = None,
+        settings: Optional[SMTPSettings] = None,
+        max_retries: int = MAX_RETRIES,
+        retry_interval: float = RETRY_INTERVAL,
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        self.outbox = outbox or MailOutbox()
+        self.settings = settings or SMTPSettings()
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.connections = 0  # SMTP sessions opened by this process
+
+    def init_app(self, app) -> None:
+        self.settings = SMTPSettings.from_config(app.config)
+
+    # ── producer side ─────────────────────────────────────────────────────────
+
+    def submit(
+        self,
+        subject: str,
+        recipients: Union[str, Iterable[str]],
+        html: Optional[str] = None,
+        body: Optional[str] = None,
+        sender: Optional[str] = None,
+        dedupe_key: Optional[str] = None,
+    ) -> int:
+        """
+        Store the mail durably, wake the sender and return the outbox id.
+        A mail with a `dedupe_key` already in the outbox is not stored again.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        mail = {
+            'subject': subject,
+            'recipients': list(recipients),
+            'html': html,
+            'body': body,
+            'sender': sender,
+            'created_at': time.time(),
+            'message_id': make_msgid(),
+        }
+        mail_id = self.outbox.enqueue(json.dumps(mail, ensure_ascii=False), dedupe_key=dedupe_key)
+        self.start()
+        self._wake.set()
+        return mail_id
+
+    # ── lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the sender thread in this process if it is not running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="mail-sender", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10) -> bool:
+        """Stop after the current batch; unsent mails stay in the outbox."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return True
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    # ── consumer side ─────────────────────────────────────────────────────────
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.process_due()
+            except Exception as exc:
+                logger.error(f"Mail outbox run failed: {exc}")
+            self._wake.wait(self._idle_timeout())
+            self._wake.clear()
+
+    def _idle_timeout(self) -> float:
+        try:
+            due = self.outbox.next_due_at()
+        except Exception:
+            return self.poll_interval
+        if due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(MIN_WAKE, due - time.time()))
+
+    def process_due(self, now: Optional[float] = None) -> int:
+        """Send every due mail, one SMTP connection per claimed batch; returns mails sent."""
+        now = now or time.time()
+        sent = 0
+        while not self._stopping.is_set():
+            batch = self.outbox.claim(BATCH_SIZE, now=now)
+            if not batch:
+                break
+            sent += self.send_batch(batch)
+        return sent
+
+    def send_batch(self, batch: List[OutboxMessage]) -> int:
+        conn: Optional[smtplib.SMTP] = None
+        sent = 0
+        try:
+            for item in batch:
+                if not self.outbox.renew([item]):
+                    # The lease ran out during earlier sends; another worker owns it now
+                    logger.warning(f"Lease on mail {item.id} expired before sending; left to its new owner")
+                    continue
+                if item.attempts >= self.max_retries:
+                    self.outbox.mark_dead(item.id, count_attempt=False, lease=item.lease)
+                    continue
+                try:
+                    mail = json.loads(item.text)
+                    message = _build_message(mail, self.settings.default_sender)
+                    if conn is None:
+                        conn = self._connect()
+                    conn.send_message(message)
+                except (smtplib.SMTPException, OSError, ValueError) as exc:
+                    self._failed(item, exc)
+                    if not _is_permanent(exc) and conn is not None:
+                        # Connection state is unknown after a transport error
+                        self._close(conn)
+                        conn = None
+                    continue
+                self.outbox.mark_sent(item.id, lease=item.lease)
+                sent += 1
+                logger.info(f"Mail {item.id} sent to {', '.join(mail['recipients'])}")
+        finally:
+            if conn is not None:
+                self._close(conn)
+        return sent
+
+    def _connect(self) -> smtplib.SMTP:
+        s = self.settings
+        smtp_cls = smtplib.SMTP_SSL if s.use_ssl else smtplib.SMTP
+        conn = smtp_cls(s.server, s.port, timeout=s.timeout)
+        try:
+            if s.use_tls and not s.use_ssl:
+                conn.starttls()
+            if s.username and s.password:
+                conn.login(s.username, s.password)
+        except Exception:
+            self._close(conn)
+            raise
+        self.connections += 1
+        return conn
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP) -> None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _failed(self, item: OutboxMessage, exc: Exception) -> None:
+        attempts = item.attempts + 1
+        error = f"{type(exc).__name__}: {exc}"[:500]
+        if _is_permanent(exc) or attempts >= self.max_retries:
+            logger.error(f"Mail {item.id} failed permanently after {attempts} attempt(s): {error}")
+            self.outbox.mark_dead(item.id, error, lease=item.lease)
+            return
+        delay = self.backoff(attempts)
+        logger.warning(f"Mail {item.id} failed (attempt {attempts}/{self.max_retries}), "
+                       f"retrying in {delay:.0f}s: {error}")
+        self.outbox.mark_retry(item.id, time.time() + delay, error, lease=item.lease)
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential in the attempts so far, capped at BACKOFF_CAP, half-range jitter."""
+        delay = min(BACKOFF_CAP, self.retry_interval * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+mail_sender = MailSender()
+atexit.register(mail_sender.stop)
+
+
+def queue_mail(
+    subject: str,
+    recipients: Union[str, Iterable[str]],
+    html: Optional[str] = None,
+    body: Optional[str] = None,
+    sender: Optional[str] = None,
+    dedupe_key: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Queue an email for background delivery and return its outbox id
+    (None if it could not be stored). Never waits on SMTP.
+    """
+    try:
+        return mail_sender.submit(subject, recipients, html=html, body=body, sender=sender,
+                                  dedupe_key=dedupe_key)
+    except Exception as exc:
+        logger.error(f"Could not queue mail '{subject}': {exc}")
+        return None
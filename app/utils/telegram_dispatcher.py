@@ -0,0 +1,276 @@
+"""
+telegram_dispatcher.py
+
+Background delivery of Telegram notifications.
+
+Request handlers call queue_telegram_message() (app/utils/telegram_queue.py),
+which stores the message in the outbox and pushes it onto a bounded in-memory
+channel; the handler returns right away. One dispatcher thread per process
+takes messages from the channel and sends them, so retries, backoff and the
+IP fallback of telegram_service never run on a web thread.
+
+Bursts are smoothed before they reach Telegram: after taking a message the
+thread keeps collecting for COALESCE_WINDOW seconds (longer while the chat's
+rate limiter has no token), then merges small messages into as few sends
+under 4096 characters as possible (telegram_queue.coalesce). Oversized
+messages are split at paragraph boundaries when submitted
+(telegram_service.split_message), so every outbox row fits one send.
+
+The channel is only a fast path — the outbox is the source of truth. A
+submitted message is stored already leased by this process (see
+telegram_outbox), so dispatchers of other gunicorn workers and the standalone
+processors leave it alone while it waits in the channel:
+
+    * channel full     → the lease is released and any process's outbox
+                         poll sends it (counted as overflow)
+    * idle → the thread sleeps until the earliest next_attempt_at in the
+      outbox (at most POLL_INTERVAL) and then sends what is due (retries with
+      their own backoff, overflow, messages left over by a previous process)
+    * shutdown         → leases of unsent channel messages are released
+    * process dies     → its leases expire after LEASE_TIMEOUT
+
+Settings (env):
+  TELEGRAM_CHANNEL_SIZE       in-memory channel capacity (default 1000)
+  TELEGRAM_POLL_INTERVAL      seconds between outbox polls when idle (default 15)
+  TELEGRAM_COALESCE_WINDOW    seconds to gather a burst before sending (default 1)
+  TELEGRAM_SHUTDOWN_TIMEOUT   seconds to finish the current send on shutdown (default 10)
+
+The thread starts lazily in the process that submits (gunicorn preloads the
+app in the master, and threads do not survive fork); gunicorn_config.py
+starts it in post_fork and stops it in worker_exit.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from app.services.telegram_ratelimit import limiter
+from app.services.telegram_service import MAX_MESSAGE_LENGTH, split_message
+from app.utils.telegram_outbox import OutboxMessage, new_lease
+from app.utils.telegram_queue import TelegramQueue, coalesce, telegram_queue
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_SIZE = int(os.getenv("TELEGRAM_CHANNEL_SIZE", "1000"))
+POLL_INTERVAL = float(os.getenv("TELEGRAM_POLL_INTERVAL", "15"))
+SHUTDOWN_TIMEOUT = float(os.getenv("TELEGRAM_SHUTDOWN_TIMEOUT", "10"))
+COALESCE_WINDOW = float(os.getenv("TELEGRAM_COALESCE_WINDOW", "1"))
+MAX_GATHER = 100  # messages collected into one burst at most
+MIN_WAKE = 1.0    # shortest idle sleep, so an undeliverable due message cannot spin the thread
+
+_STOP = object()
+
+
+class TelegramDispatcher:
+    """Single delivery thread fed by a bounded channel backed by the outbox."""
+
+    def __init__(
+        self,
+        telegram_queue: TelegramQueue,
+        capacity: int = CHANNEL_SIZE,
+        poll_interval: float = POLL_INTERVAL,
+        coalesce_window: float = COALESCE_WINDOW,
+    ):
+        self.queue = telegram_queue
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.coalesce_window = coalesce_window
+        self._channel: "queue.Queue" = queue.Queue(maxsize=capacity)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._counters = {"submitted": 0, "delivered": 0, "failed": 0, "overflow": 0}
+        self._high_water = 0
+
+    # ── producer side (request threads) ───────────────────────────────────────
+
+    def submit(self, message: str, dedupe_key: Optional[str] = None) -> List[int]:
+        """
+        Store `message` durably and schedule it; never blocks on the network.
+        Returns the outbox ids (several when the message had to be split).
+        With `dedupe_key`, submitting the same key again stores nothing new.
+        """
+        parts = split_message(message)
+        return [
+            self._submit_part(part, f"{dedupe_key}:{i}" if dedupe_key else None)
+            for i, part in enumerate(parts)
+        ]
+
+    def _submit_part(self, message: str, dedupe_key: Optional[str] = None) -> int:
+        lease = new_lease()
+        # A known dedupe_key returns the stored row unleased; renew() then skips it
+        message_id = self.queue.outbox.enqueue(message, lease=lease, dedupe_key=dedupe_key)
+        self.start()
+        try:
+            self._channel.put_nowait(OutboxMessage(message_id, message, 0, lease))
+        except queue.Full:
+            # Backpressure: an outbox poll (of any process) picks it up
+            self.queue.outbox.release(message_id, lease)
+            self._count("overflow")
+            logger.warning(
+                f"Telegram channel full ({self.capacity}); message {message_id} left in the outbox"
+            )
+        else:
+            depth = self._channel.qsize()
+            with self._lock:
+                self._counters["submitted"] += 1
+                self._high_water = max(self._high_water, depth)
+        return message_id
+
+    # ── lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the delivery thread in this process if it is not running."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent's channel contents are the parent's
+                self._channel = queue.Queue(maxsize=self.capacity)
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+            self._thread.start()
+            logger.info(f"Telegram dispatcher started (pid {self._pid})")
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> bool:
+        """
+        Stop after the message being sent; undelivered messages stay in the
+        outbox. Returns False if the thread did not finish within `timeout`.
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return True
+        self._stopping.set()
+        try:
+            self._channel.put_nowait(_STOP)
+        except queue.Full:
+            pass  # the thread checks _stopping between messages
+        thread.join(timeout)
+        stopped = not thread.is_alive()
+        released = self._release_channel() if stopped else 0
+        logger.info(
+            f"Telegram dispatcher {'stopped' if stopped else 'still sending after shutdown timeout'}; "
+            f"{released} channel messages released to the outbox"
+        )
+        return stopped
+
+    def _release_channel(self) -> int:
+        released = 0
+        while True:
+            try:
+                item = self._channel.get_nowait()
+            except queue.Empty:
+                return released
+            if item is not _STOP and self.queue.outbox.release(item.id, item.lease):
+                released += 1
+
+    # ── consumer side (dispatcher thread) ─────────────────────────────────────
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                item = self._channel.get(timeout=self._idle_timeout())
+            except queue.Empty:
+                self._poll()
+                continue
+            if item is _STOP:
+                break
+            burst = [item]
+            stop = self._gather(burst)
+            self._deliver(burst)
+            if stop:
+                break
+
+    def _gather(self, burst: List[OutboxMessage]) -> bool:
+        """Collect more channel messages for the coalescing window; True on stop."""
+        chat_id = os.environ.get("TELEGRAM_CHAT_ID")
+        deadline = time.monotonic() + max(self.coalesce_window, limiter.delay(chat_id))
+        length = len(burst[0].text)
+        while length < MAX_MESSAGE_LENGTH and len(burst) < MAX_GATHER:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._channel.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return True
+            burst.append(item)
+            length += len(item.text)
+        return False
+
+    def _deliver(self, burst: List[OutboxMessage]) -> None:
+        try:
+            # Extend the leases for the send; a message whose lease expired in
+            # the channel may have been claimed by another process meanwhile
+            held = self.queue.outbox.renew(burst)
+            for group in coalesce(held):
+                delivered = self.queue.deliver_batch(group)
+                self._count("delivered", delivered)
+                if delivered < len(group):
+                    self._count("failed", len(group) - delivered)
+        except Exception as exc:
+            self._count("failed", len(burst))
+            logger.error(f"Telegram dispatcher failed on messages {[m.id for m in burst]}: {exc}")
+
+    def _idle_timeout(self) -> float:
+        """Sleep until the next retry is due, bounded by poll_interval."""
+        try:
+            due = self.queue.outbox.next_due_at()
+        except Exception:
+            return self.poll_interval
+        if due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(MIN_WAKE, due - time.time()))
+
+    def _poll(self) -> None:
+        if not os.environ.get("TELEGRAM_BOT_TOKEN") or not os.environ.get("TELEGRAM_CHAT_ID"):
+            return
+        try:
+            sent = self.queue.process_due(time.time())
+            if sent:
+                self._count("delivered", sent)
+        except Exception as exc:
+            logger.error(f"Telegram outbox poll failed: {exc}")
+
+    # ── metrics ───────────────────────────────────────────────────────────────
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            high_water = self._high_water
+        try:
+            counts = self.queue.outbox.counts()
+            backlog = counts.get("pending", 0) + counts.get("leased", 0)
+        except Exception:
+            backlog = None
+        return {
+            "alive": bool(self._thread and self._thread.is_alive() and self._pid == os.getpid()),
+            "channel_depth": self._channel.qsize(),
+            "channel_capacity": self.capacity,
+            "channel_high_water": high_water,
+            "backlog": backlog,
+            **counters,
+        }
+
+
+dispatcher = TelegramDispatcher(telegram_queue)
+atexit.register(dispatcher.stop)
+
+
+def stats() -> dict:
+    return dispatcher.stats()
@@ -0,0 +1,396 @@
+"""
+telegram_outbox.py
+
+Durable store for outgoing Telegram notifications.
+
+One SQLite file in WAL mode replaces the directory of JSON files the queue
+used to keep (one file per message, found again by parsing every file).
+Each message gets a stable integer id when it is enqueued; every state change
+is a single UPDATE keyed by that id and guarded by the expected state, and due
+messages are read through the (state, next_attempt_at, id) index. Enqueue,
+dequeue and completion therefore cost O(log n) however large the backlog is.
+The index doubles as the retry scheduler's priority queue: each message
+carries its own next_attempt_at, so a failing message never holds back the
+ones behind it.
+
+Any number of processes may deliver from the same file (gunicorn workers,
+scripts/telegram_queue_processor.py, the cron script). A sender first
+claims due messages: in one write transaction they move to 'leased' with a
+fresh lease token and next_attempt_at = now + LEASE_TIMEOUT (the visibility
+timeout). Completion is guarded by the token, so a message is settled by
+exactly one claimant; a sender that dies leaves a lease that expires and the
+message becomes claimable again.
+
+States:
+    pending  — waiting for delivery at next_attempt_at
+    leased   — claimed by one sender until next_attempt_at
+    sent     — delivered; purged after SENT_RETENTION seconds
+    dead     — dead letter after the queue's max_retries; see replay()
+               and `flask telegram-queue replay`
+
+The file lives at data/telegram_queue.sqlite3 (override with
+TELEGRAM_QUEUE_DB). Legacy JSON files from data/telegram_queue are imported
+with scripts/migrate_telegram_queue.py.
+
+Settings (env):
+  TELEGRAM_QUEUE_DB         outbox file (default data/telegram_queue.sqlite3)
+  TELEGRAM_LEASE_TIMEOUT    seconds a claimed message stays invisible (default 120)
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
+DEFAULT_PATH = os.path.join(DATA_DIR, 'telegram_queue.sqlite3')
+LEGACY_DIR = os.path.join(DATA_DIR, 'telegram_queue')
+
+SENT_RETENTION = 7 * 24 * 3600  # keep delivered rows a week for troubleshooting
+LEASE_TIMEOUT = float(os.getenv('TELEGRAM_LEASE_TIMEOUT', '120'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    text            TEXT    NOT NULL,
+    state           TEXT    NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL,
+    created_at      REAL    NOT NULL,
+    updated_at      REAL    NOT NULL,
+    last_error      TEXT,
+    dedupe_key      TEXT UNIQUE,
+    lease           TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_messages_due ON messages (state, next_attempt_at, id);
+UPDATE messages SET state = 'dead' WHERE state = 'dropped';
+"""
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    id: int
+    text: str
+    attempts: int
+    lease: Optional[str] = None  # token of the claim this copy was handed out under
+
+
+def new_lease() -> str:
+    return uuid.uuid4().hex
+
+
+class TelegramOutbox:
+    """SQLite-backed message store; safe to share between threads."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('TELEGRAM_QUEUE_DB') or DEFAULT_PATH
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not cross threads or fork: one per thread and process
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(os.path.dirname(os.path.abspath(self.path))).mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {r['name'] for r in conn.execute("PRAGMA table_info(messages)")}
+            if 'lease' not in columns:
+                try:
+                    conn.execute("ALTER TABLE messages ADD COLUMN lease TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another process added it first
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+            self._local.conn = None
+
+    # ── writes ────────────────────────────────────────────────────────────────
+
+    def enqueue(
+        self,
+        text: str,
+        attempts: int = 0,
+        created_at: Optional[float] = None,
+        next_attempt_at: Optional[float] = None,
+        dedupe_key: Optional[str] = None,
+        lease: Optional[str] = None,
+    ) -> int:
+        """
+        Store a pending message and return its id (the existing id for a known
+        dedupe_key). With `lease` the message is stored already claimed by the
+        caller, so no other sender picks it up while the caller delivers it.
+        """
+        now = time.time()
+        if lease is not None:
+            state, next_attempt_at = 'leased', now + LEASE_TIMEOUT
+        else:
+            state, next_attempt_at = 'pending', next_attempt_at or now
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO messages"
+            " (text, state, attempts, next_attempt_at, created_at, updated_at, dedupe_key, lease)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (text, state, attempts, next_attempt_at, created_at or now, now, dedupe_key, lease),
+        )
+        if cur.rowcount:
+            return cur.lastrowid
+        row = conn.execute("SELECT id FROM messages WHERE dedupe_key = ?", (dedupe_key,)).fetchone()
+        return row['id']
+
+    def claim(
+        self,
+        limit: int = 100,
+        now: Optional[float] = None,
+        lease_timeout: float = LEASE_TIMEOUT,
+    ) -> List[OutboxMessage]:
+        """
+        Lease up to `limit` due messages (earliest first) for one sender.
+        Expired leases are due again. The returned messages carry the lease
+        token that mark_sent / mark_retry / mark_dead / release expect.
+        """
+        now = now if now is not None else time.time()
+        lease = new_lease()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # claimants queue up on SQLite's write lock
+        try:
+            # Expired leases go back to pending; their next_attempt_at (the
+            # expiry) is already past, so they are due in the same read
+            conn.execute(
+                "UPDATE messages SET state = 'pending', lease = NULL"
+                " WHERE state = 'leased' AND next_attempt_at <= ?",
+                (now,),
+            )
+            rows = conn.execute(
+                "SELECT id, text, attempts FROM messages"
+                " WHERE state = 'pending' AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if rows:
+                ids = [r['id'] for r in rows]
+                conn.execute(
+                    "UPDATE messages SET state = 'leased', lease = ?, next_attempt_at = ?, updated_at = ?"
+                    f" WHERE id IN ({','.join('?' * len(ids))})",
+                    (lease, now + lease_timeout, now, *ids),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [OutboxMessage(r['id'], r['text'], r['attempts'], lease) for r in rows]
+
+    def renew(self, msgs: List[OutboxMessage], lease_timeout: float = LEASE_TIMEOUT) -> List[OutboxMessage]:
+        """Extend the leases of `msgs`; returns the ones still held by their token."""
+        now = time.time()
+        held = []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for msg in msgs:
+                cur = conn.execute(
+                    "UPDATE messages SET next_attempt_at = ?, updated_at = ?"
+                    " WHERE id = ? AND state = 'leased' AND lease = ?",
+                    (now + lease_timeout, now, msg.id, msg.lease),
+                )
+                if cur.rowcount == 1:
+                    held.append(msg)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return held
+
+    def release(self, message_id: int, lease: str) -> bool:
+        """Hand a claimed message back unsent; it is due again at once."""
+        return self._transition(
+            message_id, 'pending', "next_attempt_at = ?", (time.time(),), lease=lease,
+        )
+
+    def mark_sent(self, message_id: int, lease: Optional[str] = None) -> bool:
+        return self._transition(
+            message_id, 'sent', "attempts = attempts + 1, last_error = NULL", lease=lease,
+        )
+
+    def mark_retry(
+        self,
+        message_id: int,
+        next_attempt_at: float,
+        error: Optional[str] = None,
+        lease: Optional[str] = None,
+    ) -> bool:
+        return self._transition(
+            message_id, 'pending',
+            "attempts = attempts + 1, next_attempt_at = ?, last_error = ?",
+            (next_attempt_at, error),
+            lease=lease,
+        )
+
+    def mark_dead(
+        self,
+        message_id: int,
+        error: Optional[str] = None,
+        count_attempt: bool = True,
+        lease: Optional[str] = None,
+    ) -> bool:
+        return self._transition(
+            message_id, 'dead',
+            "attempts = attempts + ?, last_error = COALESCE(?, last_error)",
+            (1 if count_attempt else 0, error),
+            lease=lease,
+        )
+
+    def replay(self, message_ids: Optional[List[int]] = None) -> int:
+        """Move dead letters (all, or `message_ids`) back to pending with a fresh attempt count."""
+        now = time.time()
+        query = ("UPDATE messages SET state = 'pending', attempts = 0, next_attempt_at = ?,"
+                 " updated_at = ? WHERE state = 'dead'")
+        params: list = [now, now]
+        if message_ids is not None:
+            if not message_ids:
+                return 0
+            query += f" AND id IN ({','.join('?' * len(message_ids))})"
+            params += list(message_ids)
+        return self._conn().execute(query, params).rowcount
+
+    def _transition(
+        self,
+        message_id: int,
+        state: str,
+        assignments: str,
+        params: tuple = (),
+        lease: Optional[str] = None,
+    ) -> bool:
+        """
+        Move a message to `state` in one statement. Without `lease` the message
+        must be pending; with it, it must still be leased under that token.
+        False when the guard does not hold (already settled, or re-claimed
+        after the lease expired).
+        """
+        if lease is None:
+            guard, guard_params = "state = 'pending'", ()
+        else:
+            guard, guard_params = "state = 'leased' AND lease = ?", (lease,)
+        cur = self._conn().execute(
+            f"UPDATE messages SET state = ?, updated_at = ?, lease = NULL, {assignments}"
+            f" WHERE id = ? AND {guard}",
+            (state, time.time(), *params, message_id, *guard_params),
+        )
+        return cur.rowcount == 1
+
+    def purge_sent(self, older_than: float) -> int:
+        cur = self._conn().execute(
+            "DELETE FROM messages WHERE state = 'sent' AND updated_at < ?", (older_than,)
+        )
+        return cur.rowcount
+
+    # ── reads ─────────────────────────────────────────────────────────────────
+
+    def due(self, limit: int = 100, now: Optional[float] = None) -> List[OutboxMessage]:
+        """Pending messages whose next attempt is due, earliest first."""
+        rows = self._conn().execute(
+            "SELECT id, text, attempts FROM messages"
+            " WHERE state = 'pending' AND next_attempt_at <= ?"
+            " ORDER BY next_attempt_at, id LIMIT ?",
+            (now if now is not None else time.time(), limit),
+        ).fetchall()
+        return [OutboxMessage(r['id'], r['text'], r['attempts']) for r in rows]
+
+    def pending(self) -> List[OutboxMessage]:
+        rows = self._conn().execute(
+            "SELECT id, text, attempts FROM messages WHERE state = 'pending'"
+            " ORDER BY next_attempt_at, id"
+        ).fetchall()
+        return [OutboxMessage(r['id'], r['text'], r['attempts']) for r in rows]
+
+    def next_due_at(self) -> Optional[float]:
+        """Earliest retry or lease expiry (two index lookups), or None."""
+        row = self._conn().execute(
+            "SELECT MIN(t) AS t FROM ("
+            "SELECT MIN(next_attempt_at) AS t FROM messages WHERE state = 'pending'"
+            " UNION ALL "
+            "SELECT MIN(next_attempt_at) AS t FROM messages WHERE state = 'leased')"
+        ).fetchone()
+        return row['t']
+
+    def dead(self, limit: int = 100) -> List[sqlite3.Row]:
+        return self._conn().execute(
+            "SELECT id, text, attempts, last_error, updated_at FROM messages"
+            " WHERE state = 'dead' ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def get(self, message_id: int) -> Optional[sqlite3.Row]:
+        return self._conn().execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) AS n FROM messages GROUP BY state")
+        return {r['state']: r['n'] for r in rows}
+
+
+# ── legacy import ─────────────────────────────────────────────────────────────
+
+def import_legacy_files(
+    outbox: TelegramOutbox,
+    directory: str = LEGACY_DIR,
+    remove: bool = True,
+) -> int:
+    """
+    Import the JSON files written by the old file-based queue.
+    Each file is keyed by its name, so running the import twice is harmless.
+    Returns the number of files imported.
+    """
+    if not os.path.isdir(directory):
+        return 0
+
+    imported: List[str] = []
+    conn = outbox._conn()
+    conn.execute("BEGIN IMMEDIATE")  # one commit for the whole backlog
+    try:
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            filepath = os.path.join(directory, name)
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if not data.get('message'):
+                    logger.warning(f"Skipping {name}: no message")
+                    continue
+                timestamp = float(data.get('timestamp') or os.path.getmtime(filepath))
+                outbox.enqueue(
+                    data['message'],
+                    attempts=int(data.get('attempts', 0)),
+                    created_at=timestamp,
+                    next_attempt_at=timestamp,
+                    dedupe_key=f"file:{name}",
+                )
+            except (OSError, ValueError) as e:
+                logger.error(f"Error importing {name}: {e}")
+                continue
+            imported.append(filepath)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    if remove:
+        for filepath in imported:
+            os.remove(filepath)
+    return len(imported)
@@ -1,5 +1,8 @@
-from app.services.telegram_service import send_telegram_message
+from app.services.telegram_ratelimit import limiter
+from app.services.telegram_service import MAX_MESSAGE_LENGTH, send_telegram_message
+from app.utils.telegram_outbox import LEGACY_DIR, SENT_RETENTION, TelegramOutbox
 import logging
+import random
 import time
 import os
 import json
@@ -7,103 +10,38 @@ from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
-# Define path for file-based queue storage
-QUEUE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'telegram_queue')
-Path(QUEUE_DIR).mkdir(parents=True, exist_ok=True)
+# Legacy JSON-file queue directory; only written by the emergency fallback
+# below and imported by scripts/migrate_telegram_queue.py
+QUEUE_DIR = LEGACY_DIR
+
+BATCH_SIZE = 20  # due messages claimed per lease; renewed before each send
+BACKOFF_CAP = 3600  # longest delay between two attempts of one message, seconds
+MERGE_SEPARATOR = "\n\n➖➖➖➖➖\n\n"  # between notifications merged into one message
+
 
 class TelegramQueue:
     """
-    A queue for managing telegram messages and retrying failed attempts
-    with file-based persistence for reliability
+    A queue for managing telegram messages and retrying failed attempts,
+    persisted in the SQLite outbox (app/utils/telegram_outbox.py)
     """
-    def __init__(self, max_retries=5, retry_interval=60):
+    def __init__(self, max_retries=5, retry_interval=60, outbox=None):
         """
         Initialize the queue
         
         Args:
-            max_retries (int): Maximum number of retries per message
-            retry_interval (int): Time in seconds between retries
+            max_retries (int): Attempts per message before it becomes a dead letter
+            retry_interval (int): Base delay in seconds of the per-message exponential backoff
+            outbox (TelegramOutbox): Message store (default: data/telegram_queue.sqlite3)
         """
-        self.queue = []  # List of (message, attempts) tuples
         self.max_retries = max_retries
         self.retry_interval = retry_interval
         self.last_attempt = 0
-        
-        # Load any messages from the file-based queue
-        self._load_from_disk()
-    
-    def _load_from_disk(self):
-        """
-        Load any queued messages from disk
-        """
-        try:
-            if not os.path.exists(QUEUE_DIR):
-                return
-                
-            files = [f for f in os.listdir(QUEUE_DIR) if f.endswith('.json')]
-            for file in files:
-                try:
-                    with open(os.path.join(QUEUE_DIR, file), 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if 'message' in data:
-                            self.queue.append((data['message'], data.get('attempts', 0)))
-                except Exception as e:
-                    logger.error(f"Error loading message from {file}: {e}")
-                    
-            if self.queue:
-                logger.info(f"Loaded {len(self.queue)} messages from disk")
-        except Exception as e:
-            logger.error(f"Error loading queued messages from disk: {e}")
-    
-    def _save_to_disk(self, message, attempts):
-        """
-        Save a message to disk for persistence
-        
-        Args:
-            message (str): The message to save
-            attempts (int): Number of attempts made so far
-        """
-        try:
-            filename = f"telegram_msg_{int(time.time())}_{hash(message) % 10000}.json"
-            filepath = os.path.join(QUEUE_DIR, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'message': message,
-                    'attempts': attempts,
-                    'timestamp': time.time()
-                }, f)
-                
-            logger.info(f"Saved message to disk: {filepath}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to save message to disk: {e}")
-            return False
-    
-    def _remove_from_disk(self, message):
-        """
-        Remove a message from disk after successful sending
-        
-        Args:
-            message (str): The message to remove
-        """
-        try:
-            message_hash = hash(message) % 10000
-            files = [f for f in os.listdir(QUEUE_DIR) if f.endswith('.json')]
-            
-            for file in files:
-                filepath = os.path.join(QUEUE_DIR, file)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if data.get('message') == message:
-                            os.remove(filepath)
-                            logger.info(f"Removed message from disk: {filepath}")
-                            break
-                except Exception as e:
-                    logger.error(f"Error checking message file {file}: {e}")
-        except Exception as e:
-            logger.error(f"Failed to remove message from disk: {e}")
+        self.outbox = outbox or TelegramOutbox()
+
+    @property
+    def queue(self):
+        """Pending messages as (message, attempts) tuples, next due first"""
+        return [(m.text, m.attempts) for m in self.outbox.pending()]
             
     def add_message(self, message):
         """
@@ -111,111 +49,217 @@ class TelegramQueue:
         
         Args:
             message (str): The message to be sent
+
+        Returns:
+            int: Stable id of the stored message
         """
-        self.queue.append((message, 0))
-        # Save to disk for persistence
-        self._save_to_disk(message, 0)
-        logger.info(f"Added message to telegram queue. Queue size: {len(self.queue)}")
+        message_id = self.outbox.enqueue(message)
+        logger.info(f"Added message {message_id} to telegram queue")
         
         # Try to process the queue right away
         self.process_queue()
+        return message_id
     
     def process_queue(self):
         """
-        Process the message queue and attempt to send messages
+        Process the message queue and attempt to send messages that are due.
+        Each message has its own retry schedule, so there is no queue-wide
+        wait between runs.
+
+        Returns:
+            int: Number of messages delivered
         """
-        # Check if enough time has passed since last attempt
         current_time = time.time()
-        if current_time - self.last_attempt < self.retry_interval and self.last_attempt > 0:
-            return
-            
         self.last_attempt = current_time
-        
-        # No messages to process
-        if not self.queue:
-            return
             
         # Check if Telegram configuration is available
         if not os.environ.get('TELEGRAM_BOT_TOKEN') or not os.environ.get('TELEGRAM_CHAT_ID'):
             logger.warning("Cannot process Telegram queue: missing environment variables")
-            return
+            return 0
+        
+        return self.process_due(current_time)
+
+    def process_due(self, now=None):
+        """
+        Deliver every message that is due at `now`, ignoring retry_interval.
+        Messages are claimed in leased batches, so other processes running
+        the same loop never get the same message. Small messages are merged
+        (see coalesce) and sends are paced by the per-chat rate limiter.
+        One send can outlast the lease (retries, IP fallback, rate-limit
+        waits), so each group's leases are renewed right before it is sent
+        and messages another process took over meanwhile are skipped.
+
+        Returns:
+            int: Number of messages delivered
+        """
+        now = now or time.time()
+        # Failed messages are rescheduled past `now`, so every claim holds
+        # messages not seen yet in this run
+        sent = 0
+        while True:
+            batch = self.outbox.claim(BATCH_SIZE, now=now)
+            if not batch:
+                break
+            for group in coalesce(batch):
+                held = self.outbox.renew(group)
+                if len(held) < len(group):
+                    lost = ", ".join(str(m.id) for m in group if m not in held)
+                    logger.warning(f"Lease on Telegram message(s) {lost} expired before sending; left to their new owner")
+                if held:
+                    sent += self.deliver_batch(held)
+
+        if sent:
+            self.outbox.purge_sent(now - SENT_RETENTION)
         
-        # Process the queue
-        remaining_messages = []
-        for message, attempts in self.queue:
+        counts = self.outbox.counts()
+        remaining = counts.get('pending', 0) + counts.get('leased', 0)
+        if remaining:
+            logger.info(f"Telegram queue has {remaining} remaining messages")
+        return sent
+
+    def deliver(self, msg, now=None):
+        """
+        Send one stored message and record the outcome
+
+        Args:
+            msg (OutboxMessage): Pending message from the outbox
+            now (float): Unused; kept for callers passing the batch time
+
+        Returns:
+            bool: True if the message was delivered
+        """
+        return self.deliver_batch([msg]) == 1
+
+    def deliver_batch(self, msgs):
+        """
+        Send stored messages as one Telegram message and record the outcome
+        for each of them
+
+        Args:
+            msgs (list[OutboxMessage]): Messages claimed from the outbox (or
+                pending ones without a lease), combined length within the limit
+
+        Returns:
+            int: Number of messages delivered
+        """
+        live = []
+        for msg in msgs:
+            if msg.attempts >= self.max_retries:
+                logger.error(f"Telegram message {msg.id} already failed {msg.attempts} times; moving it to dead letters")
+                self.outbox.mark_dead(msg.id, count_attempt=False, lease=msg.lease)
+            else:
+                live.append(msg)
+        if not live:
+            return 0
+
+        ids = ", ".join(str(m.id) for m in live)
+        chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+        limiter.acquire(chat_id)
+        try:
+            success = send_telegram_message(MERGE_SEPARATOR.join(m.text for m in live))
+            error = None if success else "send failed"
+        except Exception as e:
+            # Handle any unexpected errors during sending
+            logger.error(f"Error processing queue message(s) {ids}: {str(e)}")
+            success, error = False, str(e)
+
+        if success:
+            logger.info(f"Successfully sent queued Telegram message(s) {ids}")
+            for msg in live:
+                if not self.outbox.mark_sent(msg.id, lease=msg.lease):
+                    logger.warning(f"Lease on Telegram message {msg.id} expired while it was being sent")
+            return len(live)
+
+        # Each message keeps its own schedule; after a failed merge they are
+        # retried one by one (see coalesce), so a bad message is isolated
+        rate_limited_until = limiter.retry_at(chat_id)
+        for msg in live:
+            attempts = msg.attempts + 1
             if attempts >= self.max_retries:
-                logger.error(f"Failed to send Telegram message after {attempts} attempts. Dropping message.")
-                # Remove failed message from disk to avoid buildup
-                self._remove_from_disk(message)
+                logger.error(f"Failed to send Telegram message {msg.id} after {attempts} attempts. Moving it to dead letters.")
+                self.outbox.mark_dead(msg.id, error, lease=msg.lease)
                 continue
-            
-            try:
-                # Exponential backoff - wait longer between retries
-                if attempts > 0:
-                    backoff_time = min(2 ** (attempts - 1), 300)  # Cap at 5 minutes
-                    logger.info(f"Using backoff delay of {backoff_time}s for retry {attempts}")
-                
-                # Try to send the message
-                success = send_telegram_message(message)
-                if success:
-                    logger.info("Successfully sent queued Telegram message")
-                    # Remove from disk storage
-                    self._remove_from_disk(message)
-                else:
-                    logger.warning(f"Failed to send queued message (attempt {attempts+1}/{self.max_retries}). Will retry later.")
-                    # Update the attempt count on disk
-                    self._remove_from_disk(message)  # Remove old entry
-                    self._save_to_disk(message, attempts + 1)  # Create new entry with updated attempts
-                    remaining_messages.append((message, attempts + 1))
-            except Exception as e:
-                # Handle any unexpected errors during sending
-                logger.error(f"Error processing queue message: {str(e)}")
-                # Keep message in queue for retry
-                self._remove_from_disk(message)  # Remove old entry
-                self._save_to_disk(message, attempts + 1)  # Create new entry with updated attempts
-                remaining_messages.append((message, attempts + 1))
-        
-        # Update the queue
-        self.queue = remaining_messages
-        
-        if self.queue:
-            logger.info(f"Telegram queue has {len(self.queue)} remaining messages")
+            # A 429 pauses the chat; retry no earlier than Telegram asked
+            next_attempt_at = max(time.time() + self.backoff(attempts), rate_limited_until)
+            logger.warning(f"Failed to send queued message {msg.id} (attempt {attempts}/{self.max_retries}). "
+                           f"Next attempt in {next_attempt_at - time.time():.0f}s.")
+            self.outbox.mark_retry(msg.id, next_attempt_at, error, lease=msg.lease)
+        return 0
+
+    def backoff(self, attempts):
+        """
+        Delay before the next attempt: exponential in the attempts made so
+        far, capped at BACKOFF_CAP, with jitter so failed messages spread out
+
+        Args:
+            attempts (int): Attempts made so far (1 after the first failure)
+
+        Returns:
+            float: Seconds to wait
+        """
+        delay = min(BACKOFF_CAP, self.retry_interval * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+def coalesce(msgs, limit=MAX_MESSAGE_LENGTH):
+    """
+    Group consecutive messages whose merged text fits in one Telegram message
+
+    Args:
+        msgs (list[OutboxMessage]): Messages in send order
+        limit (int): Maximum merged length
+
+    Returns:
+        list[list[OutboxMessage]]: Groups in send order
+    """
+    groups, current, length = [], [], 0
+    for msg in msgs:
+        if msg.attempts:
+            # Retries go out alone so a failing message cannot fail a merge again
+            if current:
+                groups.append(current)
+                current, length = [], 0
+            groups.append([msg])
+            continue
+        added = len(msg.text) + (len(MERGE_SEPARATOR) if current else 0)
+        if current and length + added > limit:
+            groups.append(current)
+            current, length = [], 0
+            added = len(msg.text)
+        current.append(msg)
+        length += added
+    if current:
+        groups.append(current)
+    return groups
 
 # Global queue instance
 telegram_queue = TelegramQueue()
 
-def queue_telegram_message(message):
+def queue_telegram_message(message, dedupe_key=None):
     """
-    Queue a message to be sent to Telegram with automatic retries
+    Hand a message to the background dispatcher and return immediately.
+    The message is stored in the outbox before this returns, so it survives
+    restarts; delivery and retries happen off the request thread.
     
     Args:
         message (str): The message to send
+        dedupe_key (str): Optional key; a message with a key already in the
+            outbox is not queued again
     
     Returns:
         bool: True if the message was successfully queued
     """
     try:
-        # Try to send directly first
-        from app.services.telegram_service import send_telegram_message
-        
-        try:
-            # Attempt immediate send
-            if send_telegram_message(message):
-                logger.info("Message sent immediately, no need to queue")
-                return True
-        except Exception as e:
-            # If direct send fails due to network/DB issues, continue to queue
-            logger.warning(f"Direct send failed, will queue message: {e}")
-        
-        # If immediate send failed or raised an exception, queue the message
-        telegram_queue.add_message(message)
+        from app.utils.telegram_dispatcher import dispatcher
+        dispatcher.submit(message, dedupe_key=dedupe_key)
         return True
     except Exception as e:
         logger.error(f"Error in queue_telegram_message: {e}")
         
-        # Last-ditch effort: try to save to disk directly
+        # Last-ditch effort: save a legacy JSON file (scripts/migrate_telegram_queue.py imports it)
         try:
-            filename = f"telegram_msg_emergency_{int(time.time())}_{hash(message) % 10000}.json"
+            Path(QUEUE_DIR).mkdir(parents=True, exist_ok=True)
+            filename = f"telegram_msg_emergency_{time.time_ns()}_{os.getpid()}.json"
             filepath = os.path.join(QUEUE_DIR, filename)
             
             with open(filepath, 'w', encoding='utf-8') as f:
@@ -234,28 +278,14 @@ def queue_telegram_message(message):
 
 def send_telegram_message_with_retry(message, max_immediate_retries=2):
     """
-    Attempt to send a message immediately with retries, with fallback to queue if it fails
+    Kept for existing callers: sending (and retrying) now happens on the
+    dispatcher thread, so this only queues the message.
     
     Args:
         message (str): The message to send
-        max_immediate_retries (int): Maximum number of immediate retries before queueing
+        max_immediate_retries (int): Ignored; retries are scheduled by the queue
     
     Returns:
-        bool: True if the message was sent or queued successfully
+        bool: True if the message was queued
     """
-    # Try sending with a few immediate retries first
-    for attempt in range(max_immediate_retries):
-        try:
-            if send_telegram_message(message):
-                return True
-            else:
-                logger.warning(f"Immediate send attempt {attempt+1}/{max_immediate_retries} failed")
-                # Small delay before next retry
-                time.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in immediate send attempt {attempt+1}: {e}")
-            # Continue to next attempt
-    
-    # If all immediate attempts fail, queue the message for later processing
-    logger.info(f"All {max_immediate_retries} immediate attempts failed, queueing message")
     return queue_telegram_message(message)
@@ -45,3 +45,24 @@ def post_fork(server, worker):
     """
     import asyncio
     asyncio.set_event_loop(asyncio.new_event_loop())
+
+    # Telegram delivery thread of this worker (drains the outbox backlog too)
+    from app.utils.telegram_dispatcher import dispatcher
+    dispatcher.start()
+
+    # Mail outbox sender of this worker
+    from app.utils.mail_queue import mail_sender
+    mail_sender.start()
+
+
+def worker_exit(server, worker):
+    """Let the Telegram dispatcher and the mail sender finish their current send
+    before the worker exits.
+
+    Unsent messages stay in the outboxes and are delivered by the next worker.
+    """
+    from app.utils.telegram_dispatcher import dispatcher
+    dispatcher.stop(timeout=min(10, graceful_timeout / 3))
+
+    from app.utils.mail_queue import mail_sender
+    mail_sender.stop(timeout=min(10, graceful_timeout / 3))
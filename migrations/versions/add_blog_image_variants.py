@@ -0,0 +1,44 @@
+"""Add blog_image_variants (resized AVIF/WebP/JPEG copies) and blog_posts.image_placeholder
+
+Revision ID: add_blog_image_variants
+Revises: add_blog_post_image_hash
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_blog_image_variants'
+down_revision = 'add_blog_post_image_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('blog_posts', sa.Column('image_placeholder', sa.Text(), nullable=True))
+    op.create_table(
+        'blog_image_variants',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('format', sa.String(length=8), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=False),
+        sa.Column('height', sa.Integer(), nullable=False),
+        sa.Column('source_hash', sa.String(length=64), nullable=False),
+        sa.Column('byte_size', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['post_id'], ['blog_posts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('post_id', 'name', 'format', name='uq_blog_image_variants_post_name_format'),
+    )
+    op.create_index('ix_blog_image_variants_post_id', 'blog_image_variants', ['post_id'], unique=False)
+    op.create_index('ix_blog_image_variants_source_hash', 'blog_image_variants', ['source_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_blog_image_variants_source_hash', table_name='blog_image_variants')
+    op.drop_index('ix_blog_image_variants_post_id', table_name='blog_image_variants')
+    op.drop_table('blog_image_variants')
+    op.drop_column('blog_posts', 'image_placeholder')
@@ -0,0 +1,40 @@
+"""Add image_hash (SHA-256 of image_data) to blog_posts for content-addressed image URLs
+
+Revision ID: add_blog_post_image_hash
+Revises: add_blog_post_search
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_blog_post_image_hash'
+down_revision = 'add_blog_post_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('blog_posts', sa.Column('image_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_blog_posts_image_hash', 'blog_posts', ['image_hash'], unique=False)
+
+    # Backfill one blob at a time so the migration never holds every image in memory
+    bind = op.get_bind()
+    ids = [row[0] for row in bind.execute(sa.text(
+        "SELECT id FROM blog_posts WHERE image_data IS NOT NULL"
+    ))]
+    for post_id in ids:
+        data = bind.execute(sa.text("SELECT image_data FROM blog_posts WHERE id = :id"), {'id': post_id}).scalar()
+        if data:
+            bind.execute(
+                sa.text("UPDATE blog_posts SET image_hash = :hash WHERE id = :id"),
+                {'hash': hashlib.sha256(bytes(data)).hexdigest(), 'id': post_id},
+            )
+
+
+def downgrade():
+    op.drop_index('ix_blog_posts_image_hash', table_name='blog_posts')
+    op.drop_column('blog_posts', 'image_hash')
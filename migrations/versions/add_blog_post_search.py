@@ -0,0 +1,64 @@
+"""Add full-text search index for blog posts (tsvector + GIN, or FTS5 on SQLite)
+
+Revision ID: add_blog_post_search
+Revises: add_tech_spec_idempotency_key
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_blog_post_search'
+down_revision = 'add_tech_spec_idempotency_key'
+branch_labels = None
+depends_on = None
+
+# app/services/blog_search.py reads this column; the app never creates it itself
+PG_CONFIG_SQL = "CASE WHEN slug LIKE '%-de' THEN 'german'::regconfig ELSE 'english'::regconfig END"
+PG_VECTOR_SQL = (
+    f"setweight(to_tsvector({PG_CONFIG_SQL}, coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector({PG_CONFIG_SQL}, coalesce(excerpt, '')), 'B') || "
+    f"setweight(to_tsvector({PG_CONFIG_SQL}, coalesce(content, '')), 'C')"
+)
+
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_posts_fts USING fts5("
+    "title, excerpt, content, content='blog_posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_ai AFTER INSERT ON blog_posts BEGIN "
+    "INSERT INTO blog_posts_fts(rowid, title, excerpt, content) "
+    "VALUES (new.id, new.title, new.excerpt, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_ad AFTER DELETE ON blog_posts BEGIN "
+    "INSERT INTO blog_posts_fts(blog_posts_fts, rowid, title, excerpt, content) "
+    "VALUES ('delete', old.id, old.title, old.excerpt, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS blog_posts_fts_au AFTER UPDATE OF title, excerpt, content ON blog_posts BEGIN "
+    "INSERT INTO blog_posts_fts(blog_posts_fts, rowid, title, excerpt, content) "
+    "VALUES ('delete', old.id, old.title, old.excerpt, old.content); "
+    "INSERT INTO blog_posts_fts(rowid, title, excerpt, content) "
+    "VALUES (new.id, new.title, new.excerpt, new.content); END",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({PG_VECTOR_SQL}) STORED"
+        )
+        op.execute("CREATE INDEX IF NOT EXISTS ix_blog_posts_search_vector ON blog_posts USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO blog_posts_fts(blog_posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_blog_posts_search_vector")
+        op.execute("ALTER TABLE blog_posts DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS blog_posts_fts_{suffix}")
+        op.execute("DROP TABLE IF EXISTS blog_posts_fts")
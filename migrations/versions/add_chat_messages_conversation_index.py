@@ -0,0 +1,27 @@
+"""Add (conversation_id, id) index to chat_messages for server-side history
+
+Revision ID: add_chat_messages_conv_index
+Revises: add_conversation_summaries
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_chat_messages_conv_index'
+down_revision = 'add_conversation_summaries'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_chat_messages_conversation_id_id',
+        'chat_messages',
+        ['conversation_id', 'id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_chat_messages_conversation_id_id', table_name='chat_messages')
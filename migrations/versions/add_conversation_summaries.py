@@ -0,0 +1,35 @@
+"""Add conversation_summaries table for rolling chat summaries
+
+Revision ID: add_conversation_summaries
+Revises: add_image_data_field
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_conversation_summaries'
+down_revision = 'add_image_data_field'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'conversation_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.String(length=64), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('covered_hash', sa.String(length=64), nullable=True),
+        sa.Column('covered_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_conversation_summaries_conversation_id'), 'conversation_summaries', ['conversation_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_conversation_summaries_conversation_id'), table_name='conversation_summaries')
+    op.drop_table('conversation_summaries')
@@ -0,0 +1,23 @@
+"""Mark the end of a rolling chat summary by ChatMessage id
+
+Revision ID: add_conversation_summary_covered_message_id
+Revises: add_tech_spec_extracted_message_id
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_conversation_summary_covered_message_id'
+down_revision = 'add_tech_spec_extracted_message_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('conversation_summaries', sa.Column('covered_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('conversation_summaries', 'covered_message_id')
@@ -0,0 +1,88 @@
+"""Move post and generated-content images into content-addressed media_blobs
+
+Revision ID: add_media_blobs
+Revises: add_blog_image_variants
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+import hashlib
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_media_blobs'
+down_revision = 'add_blog_image_variants'
+branch_labels = None
+depends_on = None
+
+REFERENCING_TABLES = ('blog_posts', 'generated_content')
+
+
+def upgrade():
+    op.create_table(
+        'media_blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('byte_size', sa.Integer(), nullable=False),
+        sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+    op.add_column('generated_content', sa.Column('image_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_generated_content_image_hash', 'generated_content', ['image_hash'], unique=False)
+
+    # One blob per distinct image: the EN post, the DE post and the generated
+    # content row of an article all end up pointing at the same hash.
+    bind = op.get_bind()
+    stored = set()
+    for table in REFERENCING_TABLES:
+        ids = [row[0] for row in bind.execute(sa.text(
+            f"SELECT id FROM {table} WHERE image_data IS NOT NULL"
+        ))]
+        for row_id in ids:
+            data = bind.execute(sa.text(f"SELECT image_data FROM {table} WHERE id = :id"), {'id': row_id}).scalar()
+            if not data:
+                continue
+            data = bytes(data)
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in stored:
+                bind.execute(
+                    sa.text("INSERT INTO media_blobs (sha256, data, byte_size, refcount, created_at) "
+                            "VALUES (:sha256, :data, :size, 0, :now)"),
+                    {'sha256': digest, 'data': data, 'size': len(data), 'now': datetime.utcnow()},
+                )
+                stored.add(digest)
+            bind.execute(sa.text(f"UPDATE {table} SET image_hash = :hash WHERE id = :id"),
+                         {'hash': digest, 'id': row_id})
+
+    op.execute(
+        "UPDATE media_blobs SET refcount = "
+        "(SELECT count(*) FROM blog_posts WHERE blog_posts.image_hash = media_blobs.sha256) + "
+        "(SELECT count(*) FROM generated_content WHERE generated_content.image_hash = media_blobs.sha256)"
+    )
+
+    for table in REFERENCING_TABLES:
+        op.drop_column(table, 'image_data')
+    if bind.dialect.name == 'postgresql':
+        for table in REFERENCING_TABLES:
+            op.create_foreign_key(f'fk_{table}_image_hash_media_blobs', table, 'media_blobs',
+                                  ['image_hash'], ['sha256'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for table in REFERENCING_TABLES:
+            op.drop_constraint(f'fk_{table}_image_hash_media_blobs', table, type_='foreignkey')
+    for table in REFERENCING_TABLES:
+        op.add_column(table, sa.Column('image_data', sa.LargeBinary(), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET image_data = "
+            f"(SELECT data FROM media_blobs WHERE media_blobs.sha256 = {table}.image_hash) "
+            f"WHERE image_hash IS NOT NULL"
+        )
+    op.drop_index('ix_generated_content_image_hash', table_name='generated_content')
+    op.drop_column('generated_content', 'image_hash')
+    op.drop_table('media_blobs')
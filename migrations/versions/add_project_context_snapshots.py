@@ -0,0 +1,41 @@
+"""Add project_context_snapshots and project foreign-key indexes
+
+Revision ID: add_project_context_snapshots
+Revises: add_tech_spec_conversation_id
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_project_context_snapshots'
+down_revision = 'add_tech_spec_conversation_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'project_context_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('built_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_project_context_snapshots_client_id', 'project_context_snapshots', ['client_id'], unique=True)
+    # Snapshot rebuilds filter children by project and projects by client
+    op.create_index('ix_projects_client_id', 'projects', ['client_id'], unique=False)
+    op.create_index('ix_project_tasks_project_id', 'project_tasks', ['project_id'], unique=False)
+    op.create_index('ix_project_updates_project_id', 'project_updates', ['project_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_project_updates_project_id', table_name='project_updates')
+    op.drop_index('ix_project_tasks_project_id', table_name='project_tasks')
+    op.drop_index('ix_projects_client_id', table_name='projects')
+    op.drop_index('ix_project_context_snapshots_client_id', table_name='project_context_snapshots')
+    op.drop_table('project_context_snapshots')
@@ -0,0 +1,30 @@
+"""Add conversation_id to tech_spec_submissions for incremental chat drafts
+
+Revision ID: add_tech_spec_conversation_id
+Revises: add_chat_messages_conv_index
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tech_spec_conversation_id'
+down_revision = 'add_chat_messages_conv_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tech_spec_submissions', sa.Column('conversation_id', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ix_tech_spec_submissions_conversation_id',
+        'tech_spec_submissions',
+        ['conversation_id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tech_spec_submissions_conversation_id', table_name='tech_spec_submissions')
+    op.drop_column('tech_spec_submissions', 'conversation_id')
@@ -0,0 +1,23 @@
+"""Track how far each chat spec draft has been extracted
+
+Revision ID: add_tech_spec_extracted_message_id
+Revises: add_media_blobs
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tech_spec_extracted_message_id'
+down_revision = 'add_media_blobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tech_spec_submissions', sa.Column('extracted_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('tech_spec_submissions', 'extracted_message_id')
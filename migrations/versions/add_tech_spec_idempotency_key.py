@@ -0,0 +1,30 @@
+"""Add idempotency_key to tech_spec_submissions for duplicate-safe questionnaire posts
+
+Revision ID: add_tech_spec_idempotency_key
+Revises: add_project_context_snapshots
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tech_spec_idempotency_key'
+down_revision = 'add_project_context_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tech_spec_submissions', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ix_tech_spec_submissions_idempotency_key',
+        'tech_spec_submissions',
+        ['idempotency_key'],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tech_spec_submissions_idempotency_key', table_name='tech_spec_submissions')
+    op.drop_column('tech_spec_submissions', 'idempotency_key')
@@ -31,8 +31,18 @@ def init_scheduler():
         misfire_grace_time=3600,  # 1 hour grace if server was down at 08:00
     )
 
+    # Weekly sweep of unreferenced media blobs and stale generated image files
+    scheduler.add_job(
+        func=_run_media_gc,
+        trigger=CronTrigger(day_of_week='sun', hour=3, minute=30),
+        id='media_gc',
+        name='Weekly media blob / image file garbage collection',
+        replace_existing=True,
+        misfire_grace_time=3600,
+    )
+
     scheduler.start()
-    logger.info("APScheduler started — content generation job registered (daily at 08:00 UTC)")
+    logger.info("APScheduler started — content generation (daily 08:00 UTC) and media GC (weekly) registered")
     return scheduler
 
 
@@ -43,3 +53,12 @@ def _run_content_generation():
         generate_scheduled_content()
     except Exception as e:
         logger.error(f"Scheduled content generation failed: {e}")
+
+
+def _run_media_gc():
+    """Wrapper that imports the task at call-time to avoid circular imports."""
+    try:
+        from app.tasks.media_gc import collect_media_garbage
+        collect_media_garbage()
+    except Exception as e:
+        logger.error(f"Scheduled media GC failed: {e}")
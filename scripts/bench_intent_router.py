@@ -0,0 +1,78 @@
+"""
+Microbenchmark: single-pass intent_router.classify() vs the previous routing
+(detect_language regex passes + substring trigger scan + set-based
+confirmation check).
+
+Chat-length turns (the regression corpus) and long pasted texts are timed
+separately: the router classifies only a message's head in full (see
+intent_router.SCAN_CHARS) and searches the rest for spec triggers, so a paste
+with no trigger anywhere is its slowest case. Each figure is the best of
+five runs; single runs vary a lot on a shared machine.
+
+Usage:
+    python scripts/bench_intent_router.py [iterations]
+"""
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.agents.intent_router import classify  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(__file__), '..', 'tests', 'intent_corpus.jsonl')
+
+_LEGACY_TRIGGERS = (
+    'тз', 'тех завдан', 'техзавдан', 'техніч', 'технічне завдан', 'техзадани', 'техзад',
+    'техническ', 'техзадан', 'тех задани', 'тех задание', 'техзадание',
+    'спец', 'спеціаліст', 'специалист', 'експерт',
+    'tech spec', 'technical spec', 'specification', 'requirements'
+)
+_LEGACY_CONFIRM = {
+    "confirm", "confirmed", "yes", "submit", "send", "ok", "okay", "proceed",
+    "approve", "approved", "done", "finish", "go ahead",
+    "bestätigen", "bestätigt", "ja", "senden", "einreichen", "weiter",
+    "genehmigen", "fertig", "los", "genau", "richtig",
+    "підтвердити", "підтверджую", "так", "надіслати", "відправити",
+    "готово", "гаразд", "добре",
+    "подтвердить", "подтверждаю", "да", "отправить", "хорошо", "ладно",
+}
+
+
+def legacy(text):
+    """The per-turn work route_and_respond did before the router."""
+    if re.search('[а-яА-Я]', text):
+        lang = 'ru'
+    elif re.search('[äöüÄÖÜß]', text):
+        lang = 'de'
+    else:
+        latin = len(re.findall('[a-zA-Z]', text))
+        german = len(re.findall('[äöüÄÖÜß]', text))
+        lang = 'en' if latin > german else None
+    lowered = text.lower()
+    spec = any(k in lowered for k in _LEGACY_TRIGGERS)
+    confirm = bool(set(lowered.strip().split()) & _LEGACY_CONFIRM)
+    return lang, spec, confirm
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS, encoding='utf-8') as fh:
+        turns = [json.loads(line)['text'] for line in fh if line.strip()]
+    pasted = ' '.join(turns) * 2
+    # No trigger anywhere: the router has to look through the whole rest
+    plain = ' '.join(t for t in turns if not classify(t).spec_trigger) * 3
+
+    for label, texts in (('chat turns', turns), (f'{len(pasted)}-char paste', [pasted]),
+                         (f'{len(plain)}-char paste, no trigger', [plain])):
+        print(label)
+        for name, fn in (('legacy', legacy), ('intent_router', classify)):
+            seconds = min(timeit.repeat(lambda: [fn(t) for t in texts], number=iterations, repeat=5))
+            per_call = seconds / (iterations * len(texts)) * 1e6
+            print(f"{name:>14}: {per_call:7.2f} µs/message ({iterations * len(texts)} messages)")
+
+
+if __name__ == '__main__':
+    main()
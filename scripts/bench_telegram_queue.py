@@ -0,0 +1,84 @@
+"""
+Throughput benchmark: N processes draining one Telegram outbox.
+
+Every process runs TelegramQueue.process_due() against the same SQLite file,
+as gunicorn workers and the standalone processors do. Sends are stubbed with
+a fixed latency (the Bot API round trip) and the per-chat rate limit is
+lifted, so the numbers show how claiming scales with processes; the run
+fails if any message was sent twice or not at all.
+
+Usage:
+    python scripts/bench_telegram_queue.py [messages] [latency_ms] [processes ...]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('OPENAI_API_KEY', 'bench')
+os.environ['TELEGRAM_CHAT_RATE'] = '1000000'
+os.environ['TELEGRAM_CHAT_BURST'] = '1000000'
+
+from app.utils.telegram_outbox import TelegramOutbox  # noqa: E402
+from app.utils.telegram_queue import TelegramQueue  # noqa: E402
+
+
+def _worker(path, latency, start, results):
+    sent = []
+
+    def send(text):
+        time.sleep(latency)
+        sent.append(text.split('|', 1)[0])
+        return True
+
+    start.wait()
+    with patch('app.utils.telegram_queue.send_telegram_message', side_effect=send):
+        TelegramQueue(outbox=TelegramOutbox(path)).process_due()
+    results.put(sent)
+
+
+def run(processes, messages, latency):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        outbox = TelegramOutbox(path)
+        padding = 'x' * 3000  # too long to merge: one send per message
+        for i in range(messages):
+            outbox.enqueue(f"{i}|{padding}")
+
+        ctx = multiprocessing.get_context('fork')
+        start, results = ctx.Event(), ctx.Queue()
+        workers = [ctx.Process(target=_worker, args=(path, latency, start, results)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        began = time.perf_counter()
+        start.set()
+        sent = [text for _ in workers for text in results.get()]
+        elapsed = time.perf_counter() - began
+        for worker in workers:
+            worker.join()
+
+        if sorted(sent, key=int) != [str(i) for i in range(messages)]:
+            raise SystemExit(f"{processes} processes: {len(sent)} sends, {len(set(sent))} distinct "
+                             f"for {messages} messages")
+        return elapsed
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    counts = [int(n) for n in sys.argv[3:]] or [1, 2, 4, 8]
+
+    print(f"{messages} messages, {latency * 1000:.0f} ms per send")
+    baseline = None
+    for processes in counts:
+        elapsed = run(processes, messages, latency)
+        baseline = baseline or elapsed
+        print(f"  {processes:2} process(es): {elapsed:6.2f}s  {messages / elapsed:7.0f} msg/s  "
+              f"x{baseline / elapsed:.1f}  (each message sent once)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Import the JSON files of the old file-based Telegram queue into the SQLite
+outbox (data/telegram_queue.sqlite3).
+
+Every file becomes one pending message with its attempt count and original
+timestamp. Files are keyed by name, so the import can be re-run safely;
+imported files are deleted unless --keep-files is given.
+
+Usage:
+    python scripts/migrate_telegram_queue.py [--source DIR] [--db PATH] [--keep-files]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from app.utils.telegram_outbox import LEGACY_DIR, TelegramOutbox, import_legacy_files
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s: %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source', default=LEGACY_DIR, help='directory with telegram_msg_*.json files')
+    parser.add_argument('--db', default=None, help='outbox SQLite file (default: TELEGRAM_QUEUE_DB or data/telegram_queue.sqlite3)')
+    parser.add_argument('--keep-files', action='store_true', help='do not delete imported files')
+    args = parser.parse_args()
+
+    outbox = TelegramOutbox(args.db)
+    started = time.perf_counter()
+    try:
+        imported = import_legacy_files(outbox, args.source, remove=not args.keep_files)
+    except Exception as e:
+        logger.error(f"Import failed, nothing was changed: {e}")
+        return 1
+
+    logger.info(
+        f"Imported {imported} messages from {args.source} into {outbox.path} "
+        f"in {time.perf_counter() - started:.2f}s; outbox now holds {outbox.counts()}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
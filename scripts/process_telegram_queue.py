@@ -2,6 +2,8 @@
 """
 Process the Telegram message queue and retry sending messages.
 This script is designed to be run as a cron job or scheduled task.
+Overlapping runs and running web workers are fine: messages are claimed
+under leases, so none is sent twice.
 """
 
 import os
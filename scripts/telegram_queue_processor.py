@@ -1,4 +1,12 @@
+"""
+Standalone Telegram queue processor.
+
+Safe to run next to the web workers and other processors: messages are
+claimed from the shared outbox under leases (app/utils/telegram_outbox.py),
+so each one is sent by exactly one process.
+"""
 import os
+import time
 import asyncio
 from app.utils.telegram_queue import TelegramQueue
 import logging
@@ -16,7 +24,8 @@ async def process_queue_periodically(queue, interval_seconds=60):
     
     Args:
         queue (TelegramQueue): The queue to process
-        interval_seconds (int): How often to process the queue
+        interval_seconds (int): Longest wait between runs; a run starts earlier
+            when the next retry (or an expired lease) is due sooner
     """
     while True:
         try:
@@ -26,8 +35,10 @@ async def process_queue_periodically(queue, interval_seconds=60):
         except Exception as e:
             logger.error(f"Error processing Telegram queue: {e}")
         
-        # Wait for next interval
-        await asyncio.sleep(interval_seconds)
+        # Wait for the next due message, at most one interval
+        next_due = queue.outbox.next_due_at()
+        wait = interval_seconds if next_due is None else min(interval_seconds, max(1, next_due - time.time()))
+        await asyncio.sleep(wait)
 
 async def main():
     """Main entry point for the queue processor"""
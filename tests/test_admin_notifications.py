@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from flask import Flask
+
+from app.auth import login_manager
+from app.routes.admin import admin, send_welcome_email
+
+
+@patch('app.utils.telegram_queue.queue_telegram_message')
+@patch('app.services.telegram_service.send_telegram_message', return_value=True)
+def test_welcome_credentials_bypass_the_outbox(mock_send, mock_queue):
+    """The temporary password is sent directly and never written to the Telegram outbox"""
+    with Flask(__name__).app_context():
+        send_welcome_email(SimpleNamespace(name='Ada', email='ada@example.com'), 's3cret')
+
+    assert 's3cret' in mock_send.call_args.args[0]
+    mock_queue.assert_not_called()
+
+
+@patch('app.utils.telegram_dispatcher.stats', return_value={'backlog': 0})
+@patch('app.services.openai_client.stats', return_value={'state': 'closed'})
+@patch('app.services.llm_executor.stats', return_value={'active': 0})
+def test_runtime_stats_are_for_admins_only(*_):
+    """Executor, breaker and dispatcher stats are served to admins; other users get 403"""
+    app = Flask(__name__)
+    app.config.update(LOGIN_DISABLED=True, SECRET_KEY='test')
+    login_manager.init_app(app)
+    app.register_blueprint(admin)
+    client = app.test_client()
+
+    with patch('app.routes.admin.current_user', SimpleNamespace(is_admin=False)):
+        assert client.get('/admin/runtime-stats').status_code == 403
+    with patch('app.routes.admin.current_user', SimpleNamespace(is_admin=True)):
+        assert client.get('/admin/runtime-stats').get_json() == {
+            'llm': {'active': 0}, 'openai': {'state': 'closed'}, 'telegram': {'backlog': 0}}
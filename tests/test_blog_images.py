@@ -0,0 +1,61 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+from app.models import BlogPost
+from app.routes.blog import blog
+from app.utils import image_cache
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'blog.db'}")
+    db.init_app(app)
+    app.register_blueprint(blog)
+    with patch.object(image_cache, 'CACHE_DIR', str(tmp_path / 'cache')), app.app_context():
+        db.create_all()
+        db.session.add(BlogPost(title="Post", slug="post", content="x", image_data=PNG))
+        db.session.commit()
+        yield app.test_client()
+        db.session.remove()
+
+
+def _count_queries():
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_hash_follows_image_data_and_versions_the_url(client):
+    """Assigning image_data sets image_hash; the versioned URL is immutable and strongly tagged"""
+    post = BlogPost.query.one()
+    digest = image_cache.content_hash(PNG)
+    assert post.image_hash == digest
+
+    response = client.get(f'/blog/image/{post.id}?v={digest}')
+    assert response.status_code == 200
+    assert response.data == PNG
+    assert response.mimetype == 'image/png'
+    assert response.headers['ETag'] == f'"{digest}"'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_repeat_views_skip_the_database(client):
+    """Once cached on disk, versioned URLs need no query and revalidation answers 304"""
+    post = BlogPost.query.one()
+    url = f'/blog/image/{post.id}?v={post.image_hash}'
+    client.get(url)
+
+    statements = _count_queries()
+    assert client.get(url).data == PNG
+    assert statements == []
+
+    response = client.get(f'/blog/image/{post.id}', headers={'If-None-Match': f'"{post.image_hash}"'})
+    assert response.status_code == 304
+    assert len(statements) == 1  # the metadata lookup; the blob is never read for a 304
@@ -0,0 +1,78 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from app import db
+from app.models import BlogCategory, BlogPost, BlogTag
+from app.services import blog_listing
+from app.services.blog_search import search_posts
+
+BODY = '<p>' + 'word ' * 2000 + '</p>'  # 10 KB article
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x02' * 4096
+
+
+@pytest.fixture
+def listing_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'blog.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        category = BlogCategory(name="News", slug="news")
+        tag = BlogTag(name="Flask", slug="flask")
+        db.session.add_all([
+            BlogPost(title="With blob", slug="blob", content=BODY, excerpt="Short", image_data=PNG,
+                     category=category, tags=[tag]),
+            BlogPost(title="With url", slug="url", content=BODY, image_url="/static/img/blog/x.png",
+                     category=category),
+            BlogPost(title="Bare word", slug="bare", content=BODY),
+        ])
+        db.session.commit()
+        db.session.expunge_all()
+        yield app
+        db.session.remove()
+
+
+def _statements():
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_cards_fetch_only_card_columns(listing_app):
+    """Card queries never select the body or blob bytes; has_image comes from SQL"""
+    statements = _statements()
+    posts = BlogPost.query.options(*blog_listing.card_options()).order_by(BlogPost.id).all()
+    assert [(p.tags and p.tags[0].slug, p.category and p.category.name) for p in posts] == [
+        ('flask', 'News'), ([], 'News'), ([], None)]
+    assert [p.has_image for p in posts] == [True, True, False]
+
+    sql = '\n'.join(statements)
+    assert 'blog_posts.content' not in sql
+    assert 'media_blobs' not in sql
+    assert len(statements) == 2  # posts + categories, tags
+
+    with pytest.raises(InvalidRequestError):
+        posts[0].content  # outside the projection: no silent per-card lazy load
+
+
+def test_teaser_is_cut_in_sql_and_body_is_deferred(listing_app):
+    """Related cards get a bounded teaser; plain loads leave the body until it is read"""
+    post = BlogPost.query.options(*blog_listing.card_options(teaser=True)).filter_by(slug='bare').one()
+    assert len(post.teaser) == blog_listing.TEASER_CHARS
+    db.session.expunge_all()
+
+    statements = _statements()
+    post = BlogPost.query.filter_by(slug='bare').one()
+    assert 'blog_posts.content' not in statements[0]
+    assert post.content == BODY
+
+
+def test_search_results_are_cards(listing_app):
+    """Search pages load the same projection as the listings"""
+    statements = _statements()
+    results = search_posts('word')
+    assert results.total == 3 and results.items[0].slug == 'bare'  # title hit ranks first
+    loads = [s for s in statements if s.lstrip().startswith('SELECT blog_posts.id')]
+    assert loads and not any('blog_posts.content' in s for s in loads)
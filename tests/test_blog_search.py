@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.models import BlogPost
+from app.services import blog_search
+
+
+@pytest.fixture
+def search_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'blog.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(BlogPost(title="Old post", slug="old-post", content="<p>Caching basics</p>"))
+        db.session.commit()
+        assert blog_search.ensure_search_index() == "fts5"
+        yield app
+        db.session.remove()
+
+
+def test_fts_ranks_title_hits_first_and_highlights(search_app):
+    """Posts written before and after the index exist are found, title hits rank first"""
+    db.session.add_all([
+        BlogPost(title="Flask notes", slug="flask-notes", content="<p>Use <b>caching</b> &amp; pools</p>"),
+        BlogPost(title="Caching in Flask", slug="caching-flask", content="<p>More</p>"),
+        BlogPost(title="Caching auf Deutsch", slug="caching-de", content="<p>Zwischenspeicher</p>"),
+        BlogPost(title="Draft", slug="draft", content="caching", published=False),
+    ])
+    db.session.commit()
+
+    results = blog_search.search_posts("cach")
+    assert results.total == 3
+    assert results.items[0].slug == "caching-flask"
+    assert {p.slug for p in results.items} == {"caching-flask", "flask-notes", "old-post"}
+    notes = next(p for p in results.items if p.slug == "flask-notes")
+    assert str(results.snippets[notes.id]) == "Use <mark>caching</mark> &amp; pools"
+
+    assert [p.slug for p in blog_search.search_posts("caching", german=True).items] == ["caching-de"]
+
+
+def test_index_follows_updates_and_deletes(search_app):
+    """Triggers keep the FTS table in step with blog_posts"""
+    post = BlogPost.query.filter_by(slug="old-post").one()
+    post.content = "<p>Rewritten about queues</p>"
+    db.session.commit()
+    assert blog_search.search_posts("caching").total == 0
+    assert blog_search.search_posts("queues").total == 1
+
+    db.session.delete(post)
+    db.session.commit()
+    assert blog_search.search_posts("queues").total == 0
+
+
+def test_query_syntax_and_markup_are_neutralised():
+    """Visitor input cannot inject FTS5 syntax; snippets only carry <mark> tags"""
+    assert blog_search.fts_match_expression('flask" OR (x*') == '"flask"* "OR"* "x"*'
+    assert blog_search.fts_match_expression("  ?! ") is None
+    snippet = 'ss="a">\x02Flask\x03 &lt;script&gt; <em>x</em> <a hr'
+    assert str(blog_search.highlight(snippet)) == "<mark>Flask</mark> &lt;script&gt; x"
+
+
+@pytest.mark.parametrize("columns, backend", [(["id", "search_vector"], "postgresql"), (["id"], "like")])
+def test_postgres_startup_only_checks_for_the_column(columns, backend):
+    """At startup PostgreSQL runs no DDL: the migration owns the column, without it search uses ILIKE"""
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    with patch.object(blog_search, "inspect") as inspect:
+        inspect.return_value.get_columns.return_value = [{"name": name} for name in columns]
+        assert blog_search.ensure_search_index(engine) == backend
+    engine.begin.assert_not_called()
+    engine.connect.assert_not_called()
@@ -0,0 +1,102 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.api import api_bp
+from app.auth import login_manager
+from app.services.openai_client import CircuitOpenError
+
+PLAN = {'llm': dict(user_text='hi', agent='greeter', conversation_id='c1', language='en', context=None)}
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'chat.db'}", SECRET_KEY='test')
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(api_bp)
+    with patch('app.agents.controller._plan_turn', return_value=PLAN), \
+            patch('app.agents.controller.responses_cache_key', return_value='key'), \
+            patch('app.agents.controller._remember_turn', return_value=42) as remember, \
+            patch('app.agents.controller.response_cache') as cache:
+        cache.get.return_value = None
+        client = app.test_client()
+        client.remember, client.cache = remember, cache
+        yield client
+
+
+def _events(client):
+    """POST a turn and parse the SSE body into [(event, payload)]."""
+    response = client.post('/api/chat/stream', json={'message': 'hi', 'metadata': {'conversation_id': 'c1',
+                                                                                  'language': 'en'}})
+    assert response.mimetype == 'text/event-stream'
+    events = []
+    for frame in response.get_data(as_text=True).split('\n\n'):
+        if frame:
+            head, data = frame.split('\n')
+            events.append((head.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+def test_deltas_then_done_and_one_saved_turn(client):
+    """Each chunk is a delta frame; done carries the stored message id; the turn is cached and saved once"""
+    with patch('app.agents.controller.responses_stream', return_value=iter(['Hel', 'lo'])):
+        events = _events(client)
+
+    assert events[:2] == [('delta', {'text': 'Hel'}), ('delta', {'text': 'lo'})]
+    kind, done = events[2]
+    assert kind == 'done' and len(events) == 3
+    assert (done['agent'], done['cache'], done['message_id'], done['spec_saved']) == ('greeter', 'miss', 42, False)
+    client.cache.put.assert_called_once_with('key', 'Hello')
+    client.remember.assert_called_once_with('hi', 'Hello', 'c1', 'greeter')
+
+
+def test_cache_hit_is_replayed_without_the_model(client):
+    """A cached answer is sent as one delta and the turn is still saved once"""
+    client.cache.get.return_value = 'Cached answer'
+    with patch('app.agents.controller.responses_stream') as stream:
+        events = _events(client)
+
+    stream.assert_not_called()
+    assert events[0] == ('delta', {'text': 'Cached answer'})
+    assert events[1][0] == 'done' and events[1][1]['cache'] == 'hit'
+    client.remember.assert_called_once_with('hi', 'Cached answer', 'c1', 'greeter')
+
+
+@patch('app.api.simple_chat_response', return_value={'agent': 'fallback', 'answer': 'Offline answer'})
+def test_open_circuit_before_any_delta_uses_the_fallback(mock_fallback, client):
+    """Nothing streamed yet: the error event carries the simple fallback answer; no turn is saved"""
+    with patch('app.agents.controller.responses_stream', side_effect=CircuitOpenError('open')):
+        events = _events(client)
+
+    assert events == [('error', {'agent': 'fallback', 'conversation_id': 'c1', 'answer': 'Offline answer'})]
+    client.remember.assert_not_called()
+
+
+@patch('app.api.simple_chat_response')
+def test_failure_after_a_delta_does_not_replace_the_answer(mock_fallback, client):
+    """Once text is on screen the fallback answer is not substituted and the partial turn is not saved"""
+    def partial():
+        yield 'Part'
+        raise CircuitOpenError('open')
+
+    with patch('app.agents.controller.responses_stream', return_value=partial()):
+        events = _events(client)
+
+    assert [kind for kind, _ in events] == ['delta', 'error']
+    mock_fallback.assert_not_called()
+    client.remember.assert_not_called()
+    client.cache.put.assert_not_called()
+
+
+def test_health_is_a_plain_status(client):
+    """The public health check exposes no runtime internals and touches no outbox"""
+    with patch('app.utils.telegram_dispatcher.stats') as telegram_stats:
+        response = client.get('/api/health')
+
+    assert response.get_json() == {'status': 'ok'}
+    telegram_stats.assert_not_called()
@@ -0,0 +1,29 @@
+from unittest.mock import patch
+
+from app.agents import controller
+from app.services.spec_service import history_to_messages
+
+
+def test_history_to_messages_accepts_store_and_legacy_rows():
+    """Store rows {role, content} and widget rows {text, type} map the same way; store ids are kept"""
+    stored = [{"id": 1, "role": "user", "content": "Hi"}, {"id": 2, "role": "assistant", "content": "Hello"}]
+    legacy = [{"type": "user", "text": "Hi"}, {"type": "bot", "text": "Hello"}]
+    expected = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    assert history_to_messages(stored) == [dict(m, id=i) for i, m in enumerate(expected, 1)]
+    assert history_to_messages(legacy) == expected
+
+
+@patch("app.agents.controller.conversation_store.load_history")
+def test_history_is_read_from_store(mock_load):
+    """Server-side history wins over anything the client sent"""
+    mock_load.return_value = [{"id": 7, "role": "user", "content": "stored"}]
+    metadata = {"conversation_id": "c1", "last_message_id": 7, "history": [{"type": "user", "text": "client"}]}
+    assert controller._load_history(metadata) == mock_load.return_value
+    mock_load.assert_called_once_with("c1", last_seen_id=7)
+
+
+@patch("app.agents.controller.conversation_store.load_history", return_value=[])
+def test_legacy_history_used_while_store_is_empty(mock_load):
+    """Older widgets still get spec context before their first stored turn"""
+    legacy = [{"type": "user", "text": "client"}]
+    assert controller._load_history({"conversation_id": "c1", "history": legacy}) == legacy
@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+from app.agents import controller, greetings
+
+
+def test_catalog_covers_every_specialist_and_language():
+    """Each specialist has a greeting and a switch message per language"""
+    catalog = greetings.build_catalog()
+    assert set(catalog) == set(controller.SPECIALISTS)
+    for per_language in catalog.values():
+        for lang in greetings.LANGUAGES:
+            assert per_language[lang]["greeting"] and per_language[lang]["switch"]
+
+
+def test_shipped_catalog_is_up_to_date():
+    """greetings.json matches the source data (run `flask regen-greetings`)"""
+    greetings.reload()
+    assert greetings._load() == greetings.build_catalog()
+
+
+@patch("app.agents.controller.responses_respond")
+def test_opening_turn_needs_no_llm(mock_respond):
+    """An empty message is answered from the catalog"""
+    plan = controller._plan_turn("", {"language": "de", "selected_agent": "requirements"})
+    assert plan["result"]["agent"] == "requirements"
+    assert plan["result"]["answer"] == greetings.get_message("spec", "de")
+    mock_respond.assert_not_called()
+
+
+def test_pm_greeting_only_for_logged_in_clients():
+    """A logged-out visitor on the PM agent gets the general greeting, a client the PM one"""
+    plan = controller._plan_turn("", {"language": "en", "selected_agent": "pm"})
+    assert plan["result"]["answer"] == greetings.get_message("greeter", "en")
+
+    with patch("app.agents.controller.authenticated_user", return_value=object()):
+        plan = controller._plan_turn("", {"language": "en", "selected_agent": "pm", "user_id": 7})
+    assert plan["result"]["answer"] == greetings.get_message("pm", "en")
@@ -0,0 +1,89 @@
+import io
+import os
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.models import BlogImageVariant, BlogPost
+from app.routes.blog import blog
+from app.services import image_variants
+from app.utils import image_cache
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _png(size=1024):
+    """Noisy square PNG, about as incompressible as a generated illustration."""
+    img = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'blog.db'}")
+    db.init_app(app)
+    app.register_blueprint(blog)
+    with patch.object(image_cache, 'CACHE_DIR', str(tmp_path / 'cache')), app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+
+
+def test_variants_are_an_order_of_magnitude_smaller(client):
+    """Card variants are cropped 2:1 and far smaller; the EN/DE twin copies instead of re-encoding"""
+    original = _png()
+    en = BlogPost(title="EN", slug="post", content="x", image_data=original)
+    de = BlogPost(title="DE", slug="post-de", content="x", image_data=original)
+    db.session.add_all([en, de])
+    db.session.commit()
+
+    written = image_variants.generate_for_post(en.id)
+    assert written == len(image_variants.expected_keys())
+    card = db.session.query(BlogImageVariant).filter_by(post_id=en.id, name='card-480', format='webp').one()
+    assert (card.width, card.height) == (480, 240)
+    assert card.byte_size * 10 < len(original)
+    assert en.image_placeholder.startswith('data:image/webp;base64,')
+    assert len(en.image_placeholder) < 1000
+
+    with patch.object(image_variants, 'render_variants') as render:
+        assert image_variants.generate_for_post(de.id) == written
+    render.assert_not_called()
+    assert image_variants.generate_for_post(en.id) == 0  # nothing missing
+
+
+def test_variant_rendered_on_first_request_then_served_from_disk(client):
+    """The first request renders and stores just that variant; versioned repeats skip the database"""
+    post = BlogPost(title="Post", slug="post", content="x", image_data=_png(256))
+    db.session.add(post)
+    db.session.commit()
+    url = f'/blog/image/{post.id}/card-480.webp?v={post.image_hash}'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert 'immutable' in response.headers['Cache-Control']
+    stored = BlogImageVariant.query.filter_by(post_id=post.id).all()
+    assert [(v.name, v.format) for v in stored] == [('card-480', 'webp')]
+
+    with patch.object(image_variants, 'variant_data') as variant_data:
+        assert client.get(url).data == response.data
+    variant_data.assert_not_called()
+
+    assert client.get(f'/blog/image/{post.id}/card-480.gif').status_code == 404
+
+
+def test_undecodable_original_redirects_to_the_original(client):
+    """A picture PIL cannot read is served as uploaded instead of failing the page"""
+    post = BlogPost(title="Post", slug="post", content="x", image_data=b'\x89PNG\r\n\x1a\n' + b'\x00' * 64)
+    db.session.add(post)
+    db.session.commit()
+
+    response = client.get(f'/blog/image/{post.id}/card-480.webp?v={post.image_hash}')
+    assert response.status_code == 302
+    assert response.location.endswith(f'/blog/image/{post.id}?v={post.image_hash}')
+    assert BlogImageVariant.query.count() == 0
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from app.agents.intent_router import classify
+
+CORPUS = os.path.join(os.path.dirname(__file__), "intent_corpus.jsonl")
+
+with open(CORPUS, encoding="utf-8") as fh:
+    CASES = [json.loads(line) for line in fh if line.strip()]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[c["text"][:30] or "<empty>" for c in CASES])
+def test_corpus_routing(case):
+    """Language, agent and confirmation match the regression corpus"""
+    intent = classify(case["text"], page=case.get("page"))
+    assert (intent.language, intent.agent, intent.confirmation) == (
+        case["language"], case["agent"], case["confirmation"])
+
+
+def test_long_message_spec_trigger_past_the_head():
+    """A spec trigger anywhere in a long paste routes to the spec agent"""
+    filler = "We sell handmade furniture and ship it across Europe. " * 10
+    assert classify(filler + "Please write the technical\nspecification.").agent == "spec"
+    assert classify(filler + "Our тз is attached.").agent == "spec"
+    assert classify(filler + "Неспецифичный запрос.").agent is None
+
+
+def test_long_message_confirmation_only_in_the_head():
+    """Confirmation words past SCAN_CHARS do not confirm a pasted text"""
+    filler = "We sell handmade furniture and ship it across Europe. " * 10
+    assert not classify(filler + "yes").confirmation
+    assert classify("yes " + filler).confirmation
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import openai
+import pytest
+
+from app.services import llm_executor
+from app.services.llm_executor import LLMExecutor, LLMBusyError, LLMTimeoutError
+from app.services.openai_client import without_retries
+
+
+def _call(value, timeout=None, delay=0.0):
+    time.sleep(delay)
+    return value
+
+
+def test_run_returns_result_and_passes_timeout():
+    """The time left before the deadline is forwarded to the SDK call as `timeout`"""
+    executor = LLMExecutor(workers=1, max_pending=0)
+    seen = {}
+
+    def fn(timeout=None):
+        seen['timeout'] = timeout
+        return 'ok'
+
+    assert executor.run(fn, deadline=3) == 'ok'
+    assert 2.5 < seen['timeout'] <= 3
+    assert executor.stats()['in_flight'] == 0
+
+
+def test_run_raises_on_deadline():
+    """A call exceeding its deadline raises LLMTimeoutError"""
+    executor = LLMExecutor(workers=1, max_pending=0)
+    with pytest.raises(LLMTimeoutError):
+        executor.run(_call, 'late', delay=0.3, deadline=0.05)
+    assert executor.stats()['timed_out'] == 1
+
+
+def test_rejects_when_at_capacity():
+    """Calls beyond workers + max_pending fail fast instead of queueing"""
+    executor = LLMExecutor(workers=1, max_pending=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking(timeout=None):
+        started.set()
+        release.wait(2)
+        return 'done'
+
+    worker = threading.Thread(target=executor.run, args=(blocking,))
+    worker.start()
+    started.wait(1)
+
+    with pytest.raises(LLMBusyError):
+        executor.run(_call, 'rejected')
+    with pytest.raises(LLMBusyError):
+        with executor.reserve():
+            pass
+
+    release.set()
+    worker.join(2)
+    assert executor.stats()['rejected'] == 2
+    for _ in range(100):
+        if executor.stats()['in_flight'] == 0:
+            break
+        time.sleep(0.01)
+    assert executor.run(_call, 'again') == 'again'
+
+
+def test_abandoned_call_releases_its_slot_at_the_deadline(monkeypatch):
+    """Retries stay inside the caller's deadline, so the slot is free when the caller gives up"""
+    monkeypatch.setattr(llm_executor, 'RETRY_BACKOFF', 0.01)
+    executor = LLMExecutor(workers=1, max_pending=0)
+    timeouts = []
+
+    def flaky(timeout=None):
+        timeouts.append(timeout)
+        if len(timeouts) == 1:
+            raise TimeoutError("connect timeout")  # a provider error: retried
+        time.sleep(timeout)  # the SDK gives up after `timeout`
+        raise TimeoutError("read timeout")
+
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        executor.run(flaky, deadline=0.3)
+    while executor.stats()['in_flight'] and time.monotonic() - started < 2:
+        time.sleep(0.01)
+
+    assert executor.stats()['in_flight'] == 0
+    assert time.monotonic() - started < 0.5
+    assert len(timeouts) == 2 and timeouts[1] < 0.3
+
+
+def test_sdk_methods_run_without_sdk_retries():
+    """The executor rebinds SDK methods to a retry-free copy of the shared client"""
+    client = openai.OpenAI(api_key='sk-test', max_retries=2)
+    method = without_retries(client.chat.completions.create)
+    assert method.__self__._client.max_retries == 0
+    assert without_retries(_call) is _call
@@ -0,0 +1,128 @@
+import socketserver
+import threading
+
+import pytest
+
+from app.utils.mail_queue import MailOutbox, MailSender, SMTPSettings
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stand-in ready")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb == "RCPT" and server.rcpt_reply:
+                self.reply(server.rcpt_reply)
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    chunk = self.rfile.readline().decode()
+                    if chunk.rstrip("\r\n") == ".":
+                        break
+                    data.append(chunk)
+                server.messages.append("".join(data))
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class _SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.rcpt_reply = None
+
+
+@pytest.fixture
+def smtp_server():
+    server = _SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sender(tmp_path, smtp_server):
+    settings = SMTPSettings(server="127.0.0.1", port=smtp_server.server_address[1],
+                            default_sender="site@example.com", timeout=5)
+    return MailSender(outbox=MailOutbox(str(tmp_path / "mail.sqlite3")), settings=settings)
+
+
+def test_batch_shares_one_smtp_connection(sender, smtp_server):
+    """Queued mails are delivered over a single SMTP session and marked sent"""
+    sender.start = lambda: None  # drive the sender by hand
+    ids = [sender.submit(f"Subject {i}", "admin@example.com", html=f"<p>{i}</p>") for i in range(3)]
+    assert smtp_server.messages == []  # submit never talks SMTP
+    assert sender.process_due() == 3
+
+    assert len(smtp_server.messages) == 3
+    assert smtp_server.connections == 1
+    assert all(sender.outbox.get(i)["state"] == "sent" for i in ids)
+
+
+def test_failures_are_retried_or_dead_lettered(sender, smtp_server):
+    """A 4xx is rescheduled with backoff; a 5xx rejection becomes a dead letter"""
+    sender.start = lambda: None  # drive the sender by hand
+    smtp_server.rcpt_reply = "451 try later"
+    retry_id = sender.submit("Later", "admin@example.com", body="hi")
+    sender.process_due()
+    row = sender.outbox.get(retry_id)
+    assert (row["state"], row["attempts"]) == ("pending", 1)
+    assert "451" in row["last_error"]
+
+    smtp_server.rcpt_reply = "550 no such user"
+    dead_id = sender.submit("Never", "nobody@example.com", body="hi")
+    sender.process_due()
+    assert sender.outbox.get(dead_id)["state"] == "dead"
+    assert smtp_server.messages == []
+
+
+def test_mails_whose_lease_expired_mid_batch_are_left_to_their_new_owner(sender, smtp_server):
+    """A slow batch outlives its lease; the mails another worker claimed meanwhile are not sent again"""
+    sender.start = lambda: None  # drive the sender by hand
+    ids = [sender.submit(f"Subject {i}", "admin@example.com", body="hi") for i in range(3)]
+    other = MailOutbox(sender.outbox.path)
+    stolen = []
+    connect = sender._connect
+
+    def slow_connection():
+        conn = connect()
+        send = conn.send_message
+
+        def send_message(message):
+            send(message)
+            if not stolen:
+                # The first send outlasts the lease; another worker claims the rest of the batch
+                sender.outbox._conn().execute(
+                    "UPDATE messages SET next_attempt_at = 0 WHERE state = 'leased' AND id != ?", (ids[0],))
+                stolen.extend(other.claim(10))
+        conn.send_message = send_message
+        return conn
+
+    sender._connect = slow_connection
+    assert sender.process_due() == 1
+    assert [m.id for m in stolen] == ids[1:]
+    assert len(smtp_server.messages) == 1
+    assert [sender.outbox.get(i)["state"] for i in ids] == ["sent", "leased", "leased"]
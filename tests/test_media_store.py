@@ -0,0 +1,106 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from app import db
+from app.models import BlogPost, GeneratedContent, MediaBlob
+from app.services import media_store
+from app.utils import image_cache
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x01' * 64
+
+
+@pytest.fixture
+def store_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'media.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _blob():
+    return db.session.get(MediaBlob, media_store.image_cache.content_hash(PNG))
+
+
+def test_one_blob_per_image_with_reference_counts(store_app):
+    """EN post, DE post and generated content share one blob; the count follows the rows"""
+    content = GeneratedContent(title_en="T", image_data=PNG)
+    db.session.add(content)
+    db.session.flush()
+    en = BlogPost(title="EN", slug="t", image_hash=content.image_hash)
+    de = BlogPost(title="DE", slug="t-de", image_hash=content.image_hash)
+    db.session.add_all([en, de])
+    db.session.commit()
+
+    assert MediaBlob.query.count() == 1
+    assert _blob().refcount == 3
+    assert de.image_data == PNG
+
+    db.session.delete(de)
+    en.image_data = b'other image'
+    db.session.commit()
+    assert _blob().refcount == 1
+    assert media_store.recount() == 0  # incremental counts agree with a full recount
+
+
+def test_gc_removes_orphans_after_grace_and_stale_files(store_app, tmp_path):
+    """Unreferenced blobs go once the grace period is over; only unreferenced generated files are swept"""
+    post = BlogPost(title="P", slug="p", image_data=PNG, image_url="/static/img/blog/blog_1_0123abcd.png")
+    db.session.add(post)
+    db.session.commit()
+    post.image_data = None
+    db.session.commit()
+
+    storage = tmp_path / 'img'
+    (storage / 'blog').mkdir(parents=True)
+    names = ('blog_1_0123abcd.png', 'blog_2_89abcdef.png', 'default-post.jpg')
+    for name in names:
+        (storage / 'blog' / name).write_bytes(b'x')
+        os.utime(storage / 'blog' / name, (time.time() - 7200,) * 2)
+
+    digest = image_cache.content_hash(PNG)
+    cache_keys = (digest, image_cache.derived_key(digest, 'card-480.webp'), image_cache.derived_key(digest, 'og.jpeg'))
+    with patch('app.utils.storage_config.StorageConfig.get_image_storage_path', return_value=str(storage)), \
+            patch.object(image_cache, 'CACHE_DIR', str(tmp_path / 'cache')):
+        for key in cache_keys:
+            image_cache.put(key, b'cached')
+        assert media_store.collect_garbage(grace_hours=24).blobs == []  # too young
+        db.session.execute(text("UPDATE media_blobs SET created_at = '2000-01-01 00:00:00'"))
+        db.session.commit()
+        report = media_store.collect_garbage(grace_hours=1)
+        assert [image_cache.get(key) for key in cache_keys] == [None] * 3  # original and variants
+
+    assert MediaBlob.query.count() == 0
+    assert [os.path.basename(p) for p in report.files] == ['blog_2_89abcdef.png']
+    assert sorted(os.listdir(storage / 'blog')) == ['blog_1_0123abcd.png', 'default-post.jpg']
+
+
+def test_reused_orphan_gets_a_new_grace_period(store_app):
+    """put() of bytes whose old blob lost its rows keeps GC away until the new row flushes"""
+    media_store.put(PNG)
+    db.session.execute(text("UPDATE media_blobs SET created_at = '2000-01-01 00:00:00'"))
+    db.session.commit()
+
+    media_store.put(PNG)  # the referencing row is not flushed yet
+    assert media_store.collect_garbage(grace_hours=1, files=False, rebuild_counts=False).blobs == []
+    assert MediaBlob.query.count() == 1
+
+
+def test_inline_images_are_adopted(store_app):
+    """Rows from before media_blobs (bytes in image_data) are moved into the store once"""
+    db.session.execute(text("ALTER TABLE blog_posts ADD COLUMN image_data BLOB"))
+    db.session.execute(text("INSERT INTO blog_posts (title, slug, image_data) VALUES ('a', 'a', :d), ('b', 'b-de', :d)"),
+                       {'d': PNG})
+    db.session.commit()
+
+    assert media_store.adopt_inline_images() == 2
+    assert media_store.adopt_inline_images() == 0
+    assert _blob().refcount == 2
+    assert {p.image_data for p in BlogPost.query} == {PNG}
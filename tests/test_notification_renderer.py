@@ -0,0 +1,55 @@
+import re
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services.notification_renderer import (
+    question_table, render_contact_form, render_spec_submission, render_tech_spec,
+)
+from app.services.telegram_service import split_message
+
+AT = datetime(2026, 1, 2, 3, 4, 5)
+
+
+def _balanced(part):
+    """Every opened tag is closed in the same part, in order"""
+    stack = []
+    for closing, name in re.findall(r"<(/?)(\w+)[^>]*>", part):
+        if closing:
+            if not stack or stack.pop() != name:
+                return False
+        else:
+            stack.append(name)
+    return not stack
+
+
+def test_user_input_is_escaped():
+    """Markup in submitted values cannot break Telegram's HTML parser"""
+    message = render_contact_form({'name': 'A <b>', 'email': 'a&b@x.io', 'message': '1 < 2'}, submitted_at=AT)
+    assert '<b>Name:</b> A &lt;b&gt;\n' in message
+    assert 'a&amp;b@x.io' in message and '1 &lt; 2' in message
+    assert message.endswith('<i>Submitted at: 2026-01-02 03:04:05</i>')
+
+    brief = render_spec_submission(SimpleNamespace(id=7, contact_name='<x>', project_type=None))
+    assert '<b>Contact:</b> &lt;x&gt;\n' in brief and '<b>Type:</b> —\n' in brief
+
+
+def test_answers_are_paired_with_cached_questions():
+    """One answer line per template question renders question/answer pairs"""
+    questions = question_table('en')
+    assert question_table('en') is questions
+    answers = '\n'.join(f'answer {i}' for i in range(len(questions[0])))
+    message = render_tech_spec({'answers': [{'question': 'Overview', 'answer': answers}], 'language': 'en'},
+                               submitted_at=AT)
+    assert '<b>1. Overview</b>' in message
+    assert message.count('<b>👉</b> answer') == len(questions[0])
+
+
+def test_long_spec_splits_into_parseable_parts():
+    """Parts of an oversized spec stay within the limit and keep their tags balanced"""
+    answers = [{'question': f'Q{i} <&>', 'answer': ('long & detailed answer ' * 40).strip()} for i in range(30)]
+    message = render_tech_spec({'answers': answers, 'language': 'en'}, {'name': 'N'}, submitted_at=AT,
+                               with_questions=False)
+    parts = split_message(message)
+    assert len(parts) > 1
+    assert all(len(p) <= 4096 and _balanced(p) for p in parts)
+    assert all(not re.search(r"&\w*$", p) for p in parts)  # no entity cut in half
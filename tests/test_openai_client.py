@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from app.services import openai_client
+from app.services.openai_client import CircuitBreaker, CircuitOpenError
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    """Consecutive provider failures open the breaker"""
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(TimeoutError())
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_allows_single_trial():
+    """After the reset timeout one trial call decides the state"""
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(None)
+    assert breaker.state == "closed"
+
+
+def test_client_errors_do_not_open_breaker():
+    """Errors that are not provider-side keep the breaker closed"""
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.record(ValueError("bad request"))
+    assert breaker.state == "closed"
+
+
+def test_unfinished_calls_do_not_reset_the_failure_streak():
+    """A stream abandoned by its client is neither a success nor a failure"""
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    breaker.record(TimeoutError())
+    breaker.record(GeneratorExit())
+    breaker.record(TimeoutError())
+    assert breaker.state == "open"
+
+
+def test_unfinished_trial_frees_the_half_open_slot():
+    """A neutral trial leaves the breaker half-open for the next call"""
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record(GeneratorExit())
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+
+def test_get_client_is_shared_per_key():
+    """One pooled client per API key"""
+    assert openai_client.get_client("sk-test") is openai_client.get_client("sk-test")
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+from app.models.project import Project, ProjectContextSnapshot, ProjectTask, ProjectUpdate
+from app.services import pm_snapshot
+
+CLIENT = 7
+
+
+@pytest.fixture
+def pm_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'pm.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for n in range(3):
+            project = Project(title=f"Project {n}", client_id=CLIENT, status='in_progress')
+            project.tasks = [ProjectTask(title=f"Task {n}.{i}", status=s)
+                             for i, s in enumerate(('completed', 'in_progress', 'blocked', 'pending'))]
+            project.updates = [ProjectUpdate(title=f"Update {n}.{i}") for i in range(7)]
+            db.session.add(project)
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def _row():
+    db.session.expire_all()
+    return ProjectContextSnapshot.query.filter_by(client_id=CLIENT).one()
+
+
+def test_build_uses_four_queries_for_any_number_of_projects(pm_app):
+    """Projects, task counts, open tasks and ranked updates: one query each"""
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    text = pm_snapshot.build_snapshot_text(CLIENT)
+
+    assert len(statements) == 4
+    assert text.count("── PROJECT") == 3
+    assert "Progress : 25%" in text and "⚠ Blocked:" in text
+    assert text.count("Update 0.") == pm_snapshot.UPDATES_PER_PROJECT
+
+
+def test_listeners_invalidate_and_the_next_read_rebuilds(pm_app):
+    """A task change in any project nulls the client's snapshot and bumps its version"""
+    first = pm_snapshot.get_snapshot_text(CLIENT)
+    version = _row().version
+    assert _row().content == first
+
+    db.session.add(ProjectTask(title="New work", status='in_progress', project_id=Project.query.first().id))
+    db.session.commit()
+    assert (_row().content, _row().version) == (None, version + 1)
+    assert "New work" in pm_snapshot.get_snapshot_text(CLIENT)
+
+
+def test_change_during_first_build_is_not_masked(pm_app):
+    """No row yet: it is created before building, so a concurrent change still bumps the version"""
+    build = pm_snapshot.build_snapshot_text
+
+    def build_while_a_task_changes(client_id):
+        text = build(client_id)
+        db.session.add(ProjectTask(title="Committed meanwhile", status='in_progress',
+                                   project_id=Project.query.first().id))
+        db.session.commit()
+        return text
+
+    with patch.object(pm_snapshot, 'build_snapshot_text', side_effect=build_while_a_task_changes):
+        stale = pm_snapshot.get_snapshot_text(CLIENT)
+    assert "Committed meanwhile" not in stale
+    assert _row().content is None  # the outdated text was not stored
+    assert "Committed meanwhile" in pm_snapshot.get_snapshot_text(CLIENT)
+
+
+def test_second_writer_for_a_new_client_reuses_the_row(pm_app):
+    """Creating the row twice is harmless; both writers go through the version guard"""
+    assert pm_snapshot._ensure_row(CLIENT) == pm_snapshot._ensure_row(CLIENT) == 0
+    assert ProjectContextSnapshot.query.filter_by(client_id=CLIENT).count() == 1
+    assert pm_snapshot._store(CLIENT, 0, "built") is True
+    assert pm_snapshot._store(CLIENT, 5, "outdated") is False
+    assert _row().content == "built"
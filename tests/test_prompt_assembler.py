@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.services import prompt_assembler
+from app.services.prompt_assembler import assemble, fit_to_budget, message_tokens
+
+
+STABLE = [
+    {"role": "system", "content": "You are the ROZOOM assistant."},
+    {"role": "system", "content": "Detected user language: English. Reply in English."},
+]
+
+
+def _turns(n, size=400):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "x" * size}
+        for i in range(n)
+    ]
+
+
+def test_fit_to_budget_keeps_newest():
+    """Newest messages are kept, older ones overflow"""
+    history = _turns(6)
+    per_message = message_tokens(history[0])
+    overflow, kept = fit_to_budget(history, per_message * 2 + 1)
+    assert kept == history[-2:]
+    assert overflow == history[:-2]
+
+
+def test_assemble_orders_stable_prefix_first():
+    """System prompt and language line lead, user message closes"""
+    result = assemble(agent="greeter", stable=list(STABLE), user_text="Hi")
+    assert result.messages[:2] == STABLE
+    assert result.messages[-1] == {"role": "user", "content": "Hi"}
+    assert not result.summarized
+
+
+@patch("app.services.prompt_assembler._save_summary")
+@patch("app.services.prompt_assembler._load_summary", return_value=None)
+def test_overflow_is_summarized_within_budget(mock_load, mock_save):
+    """Turns beyond the budget are folded into a summary message"""
+    calls = []
+
+    def summarizer(previous, turns):
+        calls.append(turns)
+        return "client wants a Telegram bot"
+
+    with patch.dict(prompt_assembler.AGENT_INPUT_BUDGETS, {"greeter": 600}):
+        result = assemble(
+            agent="greeter",
+            stable=list(STABLE),
+            user_text="And the price?",
+            prior_messages=_turns(20),
+            conversation_id="conv-1",
+            summarizer=summarizer,
+        )
+
+    assert result.summarized
+    assert calls and calls[0][0]["content"].startswith("turn 0")
+    assert result.messages[2]["content"].endswith("client wants a Telegram bot")
+    assert result.prompt_tokens <= 600
+    mock_save.assert_called_once()
+
+
+@patch("app.services.prompt_assembler._load_summary", return_value=None)
+def test_no_summary_for_anonymous_conversation(mock_load):
+    """Without a conversation id the history is only trimmed"""
+    with patch.dict(prompt_assembler.AGENT_INPUT_BUDGETS, {"greeter": 600}):
+        result = assemble(
+            agent="greeter",
+            stable=list(STABLE),
+            user_text="Hi",
+            prior_messages=_turns(20),
+            conversation_id="anon",
+            summarizer=lambda prev, turns: "unused",
+        )
+    assert not result.summarized
+    assert result.prompt_tokens <= 600
+    assert result.dropped > 0
+
+
+def test_summary_end_is_found_by_message_id():
+    """A repeated short reply after the folded one does not hide the turns in between"""
+    replies = ["Hi", "Hello!", "да", "Budget?", "5k", "Timeline?", "да", "Noted."]
+    history = [{"id": i, "role": "user" if i % 2 else "assistant", "content": text}
+               for i, text in enumerate(replies, 1)]
+    record = SimpleNamespace(summary="client said hi", covered_message_id=3,
+                             covered_hash=prompt_assembler._message_hash(history[2]))
+
+    with patch("app.services.prompt_assembler._load_summary", return_value=record):
+        result = assemble(agent="spec", stable=list(STABLE), user_text="Next?",
+                          prior_messages=history, conversation_id="conv-1")
+
+    turns = result.messages[3:-1]
+    assert [m["content"] for m in turns] == replies[3:]
+    assert all(set(m) == {"role", "content"} for m in turns)  # ids stay out of the prompt
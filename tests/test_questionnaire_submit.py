@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.auth import login_manager
+from app.models import Lead
+from app.models.tech_spec_submission import TechSpecSubmission
+from app.pages import QUESTIONNAIRE_FALLBACK_WINDOW, _stored_questionnaire, pages_bp
+
+FORM = {'project_type': 'Web app', 'contact_name': 'Ada', 'contact_email': 'ada@example.com'}
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'forms.db'}", SECRET_KEY='test')
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(pages_bp)
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+
+
+@patch('app.pages.queue_questionnaire_notifications')
+def test_repeated_key_stores_once_and_requeues_notifications(mock_queue, client):
+    """A retry finds the stored row and queues the (outbox-deduplicated) notifications again"""
+    mock_queue.side_effect = [RuntimeError("worker died before queueing"), None]
+    for _ in range(2):
+        assert client.post('/submit-questionnaire', data={**FORM, 'idempotency_key': 'k1'}).status_code == 302
+
+    stored = TechSpecSubmission.query.one()
+    assert stored.idempotency_key == 'k1' and Lead.query.count() == 1
+    assert [c.args[0].id for c in mock_queue.call_args_list] == [stored.id, stored.id]
+
+
+@patch('app.pages.queue_questionnaire_notifications')
+def test_concurrent_insert_is_treated_as_duplicate(mock_queue, client):
+    """Losing the unique-key race rolls back and answers from the winner's row"""
+    db.session.add(TechSpecSubmission(idempotency_key='k2', project_type='Web app'))
+    db.session.commit()
+
+    # The first lookup ran before the other request committed
+    with patch('app.pages._stored_questionnaire', side_effect=[None, _stored_questionnaire(['k2'])]):
+        client.post('/submit-questionnaire', data={**FORM, 'idempotency_key': 'k2'})
+
+    assert TechSpecSubmission.query.count() == 1 and Lead.query.count() == 0
+    assert mock_queue.call_args.args[0].idempotency_key == 'k2'
+
+
+@patch('app.pages.queue_questionnaire_notifications')
+def test_fallback_key_only_dedupes_within_the_window(mock_queue, client):
+    """Without a client key the same answers are one submission for a short window, then a new one"""
+    with patch('app.pages.time.time', return_value=1_000_000.0):
+        client.post('/submit-questionnaire', data=FORM)
+    with patch('app.pages.time.time', return_value=1_000_000.0 + QUESTIONNAIRE_FALLBACK_WINDOW * 0.9):
+        client.post('/submit-questionnaire', data=FORM)  # next bucket: still a retry
+    assert TechSpecSubmission.query.count() == 1
+
+    with patch('app.pages.time.time', return_value=1_000_000.0 + QUESTIONNAIRE_FALLBACK_WINDOW * 3):
+        client.post('/submit-questionnaire', data=FORM)
+    assert TechSpecSubmission.query.count() == 2
+    assert all(row.idempotency_key.startswith('form:') for row in TechSpecSubmission.query)
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from app.services import response_cache
+from app.services.response_cache import _LRUCache, make_key, normalize_text
+
+
+def test_normalize_text():
+    """Case, punctuation and spacing differences map to the same text"""
+    assert normalize_text("  What do YOU build?! ") == "what do you build"
+    assert normalize_text("Скільки коштує бот?") == "скільки коштує бот"
+
+
+def test_key_depends_on_prompt_fingerprint():
+    """A changed system prompt or context never hits old entries"""
+    a = make_key("greeter", "en", "How much?", "fp-1")
+    assert a == make_key("greeter", "en", "how much", "fp-1")
+    assert a != make_key("greeter", "en", "how much", "fp-2")
+    assert a != make_key("greeter", "de", "how much", "fp-1")
+    assert make_key("greeter", "en", "   ", "fp-1") is None
+
+
+def test_lru_eviction_and_ttl():
+    """Least recently used entries are evicted and expired entries are dropped"""
+    cache = _LRUCache(size=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+    with patch("app.services.response_cache.time.monotonic", return_value=10 ** 9):
+        assert cache.get("a") is None
+
+
+def test_put_and_get_roundtrip():
+    """Module-level helpers ignore empty keys and values"""
+    response_cache.clear()
+    response_cache.put(None, "x")
+    response_cache.put("k", "")
+    assert response_cache.get("k") is None
+    response_cache.put("k", "answer")
+    assert response_cache.get("k") == "answer"
+    response_cache.clear()
@@ -0,0 +1,132 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from app import db
+from app.models.chat_message import ChatMessage
+from app.models.tech_spec_submission import TechSpecSubmission
+from app.services import spec_service
+
+
+@patch("app.services.spec_service.get_client")
+@patch("app.services.spec_service.llm_executor.run")
+def test_turn_extraction_sends_draft_and_one_exchange(mock_run, mock_client):
+    """The delta prompt holds the draft plus the latest exchange only"""
+    mock_run.return_value = SimpleNamespace(output_text='```json\n{"budget_range": "5k", "foo": 1}\n```')
+    changes = spec_service.extract_exchange_fields(
+        {"project_type": "bot", "timeline": None}, "Client: Budget is 5k\nAssistant: Noted.", "en")
+    assert changes == {"budget_range": "5k"}
+    prompt = mock_run.call_args.kwargs["input"][1]["content"]
+    assert '"project_type": "bot"' in prompt and "timeline" not in prompt
+    assert prompt.endswith("Client: Budget is 5k\nAssistant: Noted.")
+
+
+def test_client_id_ignores_anonymous_widget_ids():
+    """Only integer user ids are stored as client_id"""
+    assert spec_service._client_id(5) == 5
+    assert spec_service._client_id("3f2a-uuid") is None
+
+
+# ── drafts across workers ─────────────────────────────────────────────────────
+
+@pytest.fixture
+def draft_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'spec.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _store(conversation_id, *texts):
+    """Store alternating client/assistant messages; returns their ids."""
+    rows = [ChatMessage(conversation_id=conversation_id, role="user" if i % 2 == 0 else "assistant",
+                        content=text) for i, text in enumerate(texts)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def _latest_id():
+    return db.session.query(db.func.max(ChatMessage.id)).scalar()
+
+
+def _extraction(output):
+    return SimpleNamespace(output_text=json.dumps(output))
+
+
+@patch("app.services.spec_service.notify_telegram")
+@patch("app.services.spec_service.get_client")
+@patch("app.services.spec_service.llm_executor.run")
+def test_finalize_catches_up_an_update_this_process_never_saw(mock_run, mock_client, mock_notify, draft_app):
+    """The row says the draft is behind; the confirm turn extracts only the missing exchange"""
+    first = _store("c1", "I need a shop", "What budget?")
+    draft = TechSpecSubmission(conversation_id="c1", status="draft", project_type="shop",
+                               extracted_message_id=first[-1])
+    db.session.add(draft)
+    db.session.commit()
+    # The next turn was stored by another worker whose draft update has not landed
+    _store("c1", "About 5k", "Summary: a shop for 5k. Confirm?")
+    mock_run.return_value = _extraction({"budget_range": "5k", "additional_info": "summary"})
+
+    submission = spec_service.finalize_submission("c1", [], user_id=None)
+
+    prompt = mock_run.call_args.kwargs["input"][1]["content"]
+    assert "I need a shop" not in prompt and prompt.endswith("Client: About 5k\nAssistant: Summary: a shop for 5k. Confirm?")
+    assert (submission.status, submission.budget_range, submission.project_type) == ("new", "5k", "shop")
+    assert submission.extracted_message_id == _latest_id()
+    mock_notify.assert_called_once()
+
+    # The other worker's update arrives late: it must not touch the finalized row
+    mock_run.reset_mock()
+    assert spec_service.update_draft("c1", _latest_id()) is None
+    mock_run.assert_not_called()
+
+
+@patch("app.services.spec_service.get_client")
+@patch("app.services.spec_service.llm_executor.run")
+def test_failed_update_leaves_draft_behind_and_next_turn_catches_up(mock_run, mock_client, draft_app):
+    """A failed extraction does not advance extracted_message_id; the next update covers both turns"""
+    ids = _store("c2", "A bot", "For whom?")
+    mock_run.side_effect = RuntimeError("provider down")
+    assert spec_service.update_draft("c2", ids[-1]) is None
+    assert TechSpecSubmission.query.count() == 0
+
+    ids = _store("c2", "For clinics", "Noted.")
+    mock_run.side_effect = None
+    mock_run.return_value = _extraction({"project_type": "bot", "target_users": "clinics"})
+    draft = spec_service.update_draft("c2", ids[-1])
+    prompt = mock_run.call_args.kwargs["input"][1]["content"]
+    assert "Client: A bot" in prompt and "Client: For clinics" in prompt
+    assert (draft.status, draft.target_users, draft.extracted_message_id) == ("draft", "clinics", ids[-1])
+
+
+@patch("app.services.spec_service.get_client")
+@patch("app.services.spec_service.llm_executor.run")
+def test_update_retries_when_another_worker_advanced_the_draft(mock_run, mock_client, draft_app):
+    """The guarded write fails if the draft moved during extraction; the retry starts from the new state"""
+    first = _store("c3", "A site", "Deadline?")
+    draft = TechSpecSubmission(conversation_id="c3", status="draft", extracted_message_id=first[-1])
+    db.session.add(draft)
+    db.session.commit()
+    second = _store("c3", "March", "Ok.")
+    third = _store("c3", "Budget 3k", "Ok.")
+
+    def other_worker_wins_once(*args, **kwargs):
+        if mock_run.call_count == 1:
+            db.session.execute(text("UPDATE tech_spec_submissions SET timeline = 'March', "
+                                    "extracted_message_id = :id"), {"id": second[-1]})
+            return _extraction({"timeline": "stale"})
+        return _extraction({"budget_range": "3k"})
+
+    mock_run.side_effect = other_worker_wins_once
+    draft = spec_service.update_draft("c3", third[-1])
+    assert mock_run.call_count == 2
+    assert "March" not in mock_run.call_args.kwargs["input"][1]["content"].split("\n\n", 1)[1]
+    assert (draft.timeline, draft.budget_range, draft.extracted_message_id) == ("March", "3k", third[-1])
@@ -0,0 +1,70 @@
+import threading
+from unittest.mock import patch
+
+from app.utils.telegram_dispatcher import TelegramDispatcher
+from app.utils.telegram_outbox import TelegramOutbox
+from app.utils.telegram_queue import TelegramQueue
+
+
+def _dispatcher(tmp_path, **kwargs):
+    queue = TelegramQueue(outbox=TelegramOutbox(str(tmp_path / 'q.sqlite3')))
+    return TelegramDispatcher(queue, **kwargs)
+
+
+def test_submit_returns_before_sending(tmp_path):
+    """The caller only stores the message; the dispatcher thread sends it"""
+    release = threading.Event()
+    callers = []
+
+    def slow_send(text):
+        callers.append(threading.current_thread().name)
+        release.wait(5)
+        return True
+
+    dispatcher = _dispatcher(tmp_path, poll_interval=60, coalesce_window=0)
+    with patch('app.utils.telegram_queue.send_telegram_message', side_effect=slow_send):
+        [message_id] = dispatcher.submit("hello")
+        assert dispatcher.queue.outbox.get(message_id)['state'] == 'leased'  # held by this process until sent
+        release.set()
+        assert dispatcher.stop(timeout=5)
+
+    assert callers == ['telegram-dispatcher']
+    assert dispatcher.queue.outbox.get(message_id)['state'] == 'sent'
+    assert dispatcher.stats()['delivered'] == 1
+
+
+def test_full_channel_leaves_message_in_outbox(tmp_path):
+    """Overflow is counted and the message stays durable for the next poll"""
+    dispatcher = _dispatcher(tmp_path, capacity=1, poll_interval=60)
+    with patch.object(dispatcher, 'start'):
+        dispatcher.submit("first")
+        dispatcher.submit("second")
+
+    stats = dispatcher.stats()
+    assert (stats['submitted'], stats['overflow'], stats['backlog']) == (1, 1, 2)
+
+
+def test_burst_is_coalesced_into_one_send(tmp_path):
+    """Messages arriving within the window go out as one Telegram message"""
+    sent = []
+    dispatcher = _dispatcher(tmp_path, poll_interval=60, coalesce_window=0.5)
+    with patch('app.utils.telegram_queue.send_telegram_message', side_effect=lambda t: sent.append(t) or True):
+        ids = dispatcher.submit("one") + dispatcher.submit("two") + dispatcher.submit("three")
+        assert dispatcher.stop(timeout=5)
+
+    assert len(sent) == 1
+    assert sent[0].startswith("one") and sent[0].endswith("three")
+    assert all(dispatcher.queue.outbox.get(i)['state'] == 'sent' for i in ids)
+
+
+def test_dedupe_key_queues_a_notification_once(tmp_path):
+    """Submitting the same key twice (e.g. a retried form POST) stores and sends one message"""
+    sent = []
+    dispatcher = _dispatcher(tmp_path, poll_interval=60, coalesce_window=0)
+    with patch('app.utils.telegram_queue.send_telegram_message', side_effect=lambda t: sent.append(t) or True):
+        first = dispatcher.submit("spec #7", dedupe_key="tech_spec:7")
+        second = dispatcher.submit("spec #7", dedupe_key="tech_spec:7")
+        assert dispatcher.stop(timeout=5)
+
+    assert first == second
+    assert sent == ["spec #7"]
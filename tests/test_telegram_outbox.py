@@ -0,0 +1,56 @@
+import json
+
+from app.utils.telegram_outbox import TelegramOutbox, import_legacy_files
+
+
+def test_due_orders_by_next_attempt(tmp_path):
+    """Due messages come back earliest first; future ones are skipped"""
+    outbox = TelegramOutbox(str(tmp_path / 'q.sqlite3'))
+    late = outbox.enqueue("late", next_attempt_at=200)
+    early = outbox.enqueue("early", next_attempt_at=100)
+    outbox.enqueue("future", next_attempt_at=1000)
+    assert [m.id for m in outbox.due(now=500)] == [early, late]
+
+
+def test_transitions_only_apply_to_pending(tmp_path):
+    """A message can be completed once; a second transition is refused"""
+    outbox = TelegramOutbox(str(tmp_path / 'q.sqlite3'))
+    message_id = outbox.enqueue("hello")
+    assert outbox.mark_sent(message_id) is True
+    assert outbox.mark_retry(message_id, 0, "late failure") is False
+    row = outbox.get(message_id)
+    assert (row['state'], row['attempts']) == ('sent', 1)
+
+
+def test_import_legacy_files_is_idempotent(tmp_path):
+    """Legacy JSON files are imported once with their attempts and timestamp"""
+    legacy = tmp_path / 'telegram_queue'
+    legacy.mkdir()
+    (legacy / 'telegram_msg_1_42.json').write_text(
+        json.dumps({'message': 'old', 'attempts': 2, 'timestamp': 123.0}), encoding='utf-8')
+    (legacy / 'broken.json').write_text('{', encoding='utf-8')
+    outbox = TelegramOutbox(str(tmp_path / 'q.sqlite3'))
+
+    assert import_legacy_files(outbox, str(legacy), remove=False) == 1
+    assert import_legacy_files(outbox, str(legacy), remove=True) == 1
+    assert [(m.text, m.attempts) for m in outbox.due(now=200)] == [('old', 2)]
+    assert sorted(p.name for p in legacy.iterdir()) == ['broken.json']
+
+
+def test_claims_are_exclusive_until_the_lease_expires(tmp_path):
+    """Concurrent claimants never get the same message; an expired lease cannot settle it"""
+    path = str(tmp_path / 'q.sqlite3')
+    first, second = TelegramOutbox(path), TelegramOutbox(path)  # separate connections, like two processes
+    ids = [first.enqueue(f"m{i}", next_attempt_at=100) for i in range(5)]
+
+    claimed_a = first.claim(3, now=200, lease_timeout=50)
+    claimed_b = second.claim(10, now=200, lease_timeout=50)
+    assert sorted(m.id for m in claimed_a + claimed_b) == ids
+    assert second.claim(10, now=249) == []
+
+    # The lease of claimed_a ran out: the message is claimed again and the
+    # old token can no longer settle it
+    stale = claimed_a[0]
+    [again] = [m for m in second.claim(10, now=251) if m.id == stale.id]
+    assert first.mark_sent(stale.id, lease=stale.lease) is False
+    assert second.mark_sent(again.id, lease=again.lease) is True
@@ -1,22 +1,35 @@
+import threading
+import time
 import pytest
 from unittest.mock import patch
-from app.utils.telegram_queue import TelegramQueue, queue_telegram_message, send_telegram_message_with_retry
+from app.services.telegram_ratelimit import ChatRateLimiter
+from app.utils.telegram_outbox import OutboxMessage, TelegramOutbox
+from app.utils.telegram_queue import TelegramQueue, coalesce, queue_telegram_message, send_telegram_message_with_retry
 
-def test_telegram_queue_initialization():
+@pytest.fixture
+def telegram_env(monkeypatch):
+    monkeypatch.setenv('TELEGRAM_BOT_TOKEN', 'test_token')
+    monkeypatch.setenv('TELEGRAM_CHAT_ID', 'test_chat_id')
+
+@pytest.fixture
+def outbox(tmp_path, telegram_env):
+    return TelegramOutbox(str(tmp_path / 'queue.sqlite3'))
+
+def test_telegram_queue_initialization(outbox):
     """Test that TelegramQueue initializes properly"""
-    queue = TelegramQueue()
+    queue = TelegramQueue(outbox=outbox)
     assert queue.queue == []
     assert queue.max_retries == 5
     assert queue.retry_interval == 60
     assert queue.last_attempt == 0
 
 @patch('app.utils.telegram_queue.send_telegram_message')
-def test_add_and_process_queue_success(mock_send):
+def test_add_and_process_queue_success(mock_send, outbox):
     """Test adding a message to the queue and processing it successfully"""
     # Configure the mock to return True (success)
     mock_send.return_value = True
     
-    queue = TelegramQueue()
+    queue = TelegramQueue(outbox=outbox)
     queue.add_message("Test message")
     
     # Verify the message was added and then processed successfully
@@ -26,12 +39,12 @@ def test_add_and_process_queue_success(mock_send):
     assert queue.queue == []  # Queue should be empty after successful processing
 
 @patch('app.utils.telegram_queue.send_telegram_message')
-def test_add_and_process_queue_failure(mock_send):
+def test_add_and_process_queue_failure(mock_send, outbox):
     """Test adding a message to the queue and handling failure"""
     # Configure the mock to return False (failure)
     mock_send.return_value = False
     
-    queue = TelegramQueue()
+    queue = TelegramQueue(outbox=outbox)
     queue.add_message("Test message")
     
     # Verify the message was added and attempted
@@ -44,63 +57,141 @@ def test_add_and_process_queue_failure(mock_send):
     assert queue.queue[0] == ("Test message", 1)
 
 @patch('app.utils.telegram_queue.send_telegram_message')
-def test_max_retries_exceeded(mock_send):
-    """Test that messages are dropped after max retries"""
+def test_max_retries_exceeded(mock_send, outbox):
+    """Test that messages become dead letters after max retries"""
     # Configure the mock to return False (failure)
     mock_send.return_value = False
     
-    queue = TelegramQueue(max_retries=3)
-    queue.queue = [("Test message", 3)]  # Already at max retries
+    queue = TelegramQueue(max_retries=3, outbox=outbox)
+    message_id = outbox.enqueue("Test message", attempts=3)  # Already at max retries
     queue.process_queue()
     
-    # Verify the queue is empty after processing (message dropped)
+    # Verify the queue is empty after processing (message moved to dead letters)
     assert queue.queue == []
+    assert not mock_send.called
+    assert outbox.get(message_id)['state'] == 'dead'
+    assert outbox.replay([message_id]) == 1
+    assert queue.queue == [("Test message", 0)]
+
+@patch('app.utils.telegram_queue.send_telegram_message')
+def test_failing_message_does_not_hold_back_others(mock_send, outbox):
+    """Test that each message keeps its id and its own retry schedule"""
+    mock_send.return_value = False
+
+    queue = TelegramQueue(outbox=outbox)
+    first = queue.add_message("First")
+    second = outbox.enqueue("Second")  # queued while "First" waits for its retry
+    mock_send.return_value = True
+    queue.process_queue()
 
-@patch('app.utils.telegram_queue.telegram_queue')
-def test_queue_telegram_message(mock_queue):
+    # "First" is not due yet; "Second" was sent right away under its own id
+    mock_send.assert_called_with("Second")
+    assert outbox.get(second)['state'] == 'sent'
+    assert outbox.get(first)['state'] == 'pending'
+    assert queue.queue == [("First", 1)]
+
+def test_backoff_grows_per_attempt_with_jitter():
+    """Test that the retry delay doubles per attempt and stays within its jitter band"""
+    queue = TelegramQueue(retry_interval=10, outbox=object())
+    for attempts, delay in ((1, 10), (2, 20), (3, 40), (20, 3600)):
+        assert delay / 2 <= queue.backoff(attempts) <= delay
+
+@patch('app.utils.telegram_dispatcher.dispatcher')
+def test_queue_telegram_message(mock_dispatcher):
     """Test the queue_telegram_message helper function"""
-    queue_telegram_message("Test message")
+    assert queue_telegram_message("Test message") is True
     
-    # Verify the message was added to the queue
-    mock_queue.add_message.assert_called_once_with("Test message")
+    # Verify the message was handed to the dispatcher
+    mock_dispatcher.submit.assert_called_once_with("Test message", dedupe_key=None)
 
 @patch('app.utils.telegram_queue.send_telegram_message')
-@patch('app.utils.telegram_queue.queue_telegram_message')
-def test_send_with_retry_success(mock_queue, mock_send):
-    """Test send_telegram_message_with_retry with immediate success"""
-    mock_send.return_value = True
-    
+@patch('app.utils.telegram_dispatcher.dispatcher')
+def test_send_with_retry_only_queues(mock_dispatcher, mock_send):
+    """Test send_telegram_message_with_retry never sends on the caller's thread"""
     result = send_telegram_message_with_retry("Test message")
     
-    # Verify the message was sent successfully and not queued
     assert result is True
-    mock_send.assert_called_once_with("Test message")
-    mock_queue.assert_not_called()
+    mock_send.assert_not_called()
+    mock_dispatcher.submit.assert_called_once_with("Test message", dedupe_key=None)
 
-@patch('app.utils.telegram_queue.send_telegram_message')
-@patch('app.utils.telegram_queue.queue_telegram_message')
-def test_send_with_retry_fallback(mock_queue, mock_send):
-    """Test send_telegram_message_with_retry with fallback to queue"""
-    mock_send.return_value = False
-    mock_queue.return_value = True
+@patch('app.utils.telegram_dispatcher.dispatcher')
+def test_send_with_retry_exception(mock_dispatcher, tmp_path):
+    """Test the emergency file save when the outbox cannot be written"""
+    mock_dispatcher.submit.side_effect = Exception("Test exception")
     
-    result = send_telegram_message_with_retry("Test message")
+    with patch('app.utils.telegram_queue.QUEUE_DIR', str(tmp_path)):
+        result = send_telegram_message_with_retry("Test message")
     
-    # Verify the message was queued after send failed
+    # Verify the exception was caught and the message saved for the migration tool
     assert result is True
-    mock_send.assert_called_once_with("Test message")
-    mock_queue.assert_called_once_with("Test message")
+    assert len(list(tmp_path.glob('telegram_msg_emergency_*.json'))) == 1
 
 @patch('app.utils.telegram_queue.send_telegram_message')
-@patch('app.utils.telegram_queue.queue_telegram_message')
-def test_send_with_retry_exception(mock_queue, mock_send):
-    """Test send_telegram_message_with_retry handling exceptions"""
-    mock_send.side_effect = Exception("Test exception")
-    mock_queue.return_value = True
-    
-    result = send_telegram_message_with_retry("Test message")
-    
-    # Verify the exception was caught and message was queued
-    assert result is True
-    mock_send.assert_called_once_with("Test message")
-    mock_queue.assert_called_once_with("Test message")
+def test_rate_limited_messages_wait_for_retry_after(mock_send, outbox):
+    from app.services.telegram_ratelimit import ChatRateLimiter
+    limiter = ChatRateLimiter()
+    mock_send.side_effect = lambda text: limiter.block('test_chat_id', 120) or False
+
+    queue = TelegramQueue(retry_interval=1, outbox=outbox)
+    message_id = outbox.enqueue("Test message")
+    before = time.time()
+    with patch('app.utils.telegram_queue.limiter', limiter):
+        queue.process_due()
+
+    assert outbox.get(message_id)['next_attempt_at'] >= before + 119
+
+def test_coalesce_respects_the_message_limit():
+    """Consecutive messages are merged only while the result fits"""
+    msgs = [OutboxMessage(i, text, 0) for i, text in enumerate(["a" * 10, "b" * 10, "c" * 30, "d" * 5])]
+    groups = coalesce(msgs, limit=30)
+    assert [[m.id for m in g] for g in groups] == [[0, 1], [2], [3]]
+
+@patch('app.utils.telegram_queue.send_telegram_message')
+def test_parallel_processors_send_each_message_once(mock_send, tmp_path, telegram_env):
+    """Several queues on one outbox file (like several processes) share the backlog without duplicates"""
+    sent = []
+    mock_send.side_effect = lambda text: sent.append(text) or True
+    path = str(tmp_path / 'q.sqlite3')
+    TelegramOutbox(path)  # create the schema before the threads race for it
+    seed = TelegramOutbox(path)
+    for i in range(200):
+        seed.enqueue(f"message {i}" + "x" * 3000)  # too long to merge: one send each
+
+    with patch('app.utils.telegram_queue.limiter', ChatRateLimiter(rate=1e9, burst=1e9)):
+        workers = [threading.Thread(target=TelegramQueue(outbox=TelegramOutbox(path)).process_due)
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+
+    assert len(sent) == 200 and len(set(sent)) == 200
+    assert seed.counts() == {'sent': 200}
+
+@patch('app.utils.telegram_queue.send_telegram_message')
+def test_messages_whose_lease_expired_mid_batch_are_not_sent_twice(mock_send, tmp_path, telegram_env):
+    """A slow send lets the rest of the batch expire; another process claims and sends those, this one skips them"""
+    path = str(tmp_path / 'q.sqlite3')
+    outbox, other = TelegramOutbox(path), TelegramOutbox(path)
+    for i in range(3):
+        outbox.enqueue(f"message {i}" + "x" * 3000)  # one send each
+    sent = []
+
+    def slow_send(text):
+        sent.append(text)
+        if len(sent) == 1:
+            # The first send outlasts the lease; another process claims the rest of the batch
+            outbox._conn().execute("UPDATE messages SET next_attempt_at = 0 WHERE state = 'leased' AND text != ?",
+                                   (text,))
+            for msg in other.claim(10):
+                sent.append(msg.text)
+                other.mark_sent(msg.id, lease=msg.lease)
+        return True
+
+    mock_send.side_effect = slow_send
+    with patch('app.utils.telegram_queue.limiter', ChatRateLimiter(rate=1e9, burst=1e9)):
+        delivered = TelegramQueue(outbox=outbox).process_due()
+
+    assert delivered == 1
+    assert len(sent) == 3 and len(set(sent)) == 3
+    assert outbox.counts() == {'sent': 3}
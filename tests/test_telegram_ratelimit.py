@@ -0,0 +1,24 @@
+from unittest.mock import MagicMock, patch
+
+from app.services.telegram_ratelimit import TokenBucket, retry_after_from
+
+
+def test_bucket_allows_burst_then_paces():
+    """A full bucket lets `burst` messages through, then one per 1/rate seconds"""
+    with patch('time.monotonic', return_value=0.0):
+        bucket = TokenBucket(rate=1, burst=2)
+    for _ in range(2):
+        assert bucket.delay(0.0) == 0
+        bucket.take(0.0)
+    assert bucket.delay(0.0) == 1.0
+    assert bucket.delay(1.0) == 0
+
+
+def test_retry_after_is_read_from_telegram_parameters():
+    """retry_after comes from the JSON body, then from the header"""
+    response = MagicMock()
+    response.json.return_value = {"ok": False, "parameters": {"retry_after": 17}}
+    assert retry_after_from(response) == 17
+    response.json.side_effect = ValueError
+    response.headers = {"Retry-After": "3"}
+    assert retry_after_from(response) == 3
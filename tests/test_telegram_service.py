@@ -5,7 +5,7 @@ import requests
 import socket
 
 @patch('app.services.telegram_service.get_telegram_config')
-@patch('app.services.telegram_service.requests.Session')
+@patch('app.services.telegram_service.get_session')
 def test_send_telegram_message_success(mock_session, mock_config):
     """Test successful message sending"""
     # Setup mocks
@@ -25,9 +25,11 @@ def test_send_telegram_message_success(mock_session, mock_config):
     assert "test_token" in url
     assert "sendMessage" in url
 
+@patch('app.services.telegram_ip_service.race_connect', return_value='149.154.167.220')
+@patch('app.services.telegram_ip_service.get_session')
 @patch('app.services.telegram_service.get_telegram_config')
-@patch('app.services.telegram_service.requests.Session')
-def test_send_telegram_message_api_error(mock_session, mock_config):
+@patch('app.services.telegram_service.get_session')
+def test_send_telegram_message_api_error(mock_session, mock_config, mock_ip_session, mock_race):
     """Test handling of API errors"""
     # Setup mocks
     mock_config.return_value = ('test_token', 'test_chat_id', True)
@@ -35,6 +37,7 @@ def test_send_telegram_message_api_error(mock_session, mock_config):
     mock_response.status_code = 400
     mock_response.text = '{"error":"Bad Request"}'
     mock_session.return_value.post.return_value = mock_response
+    mock_ip_session.return_value.post.return_value = mock_response
     
     # Call the function
     result = send_telegram_message("Test message")
@@ -42,13 +45,16 @@ def test_send_telegram_message_api_error(mock_session, mock_config):
     # Verify the result
     assert result is False
 
+@patch('app.services.telegram_ip_service.race_connect', return_value='149.154.167.220')
+@patch('app.services.telegram_ip_service.get_session')
 @patch('app.services.telegram_service.get_telegram_config')
-@patch('app.services.telegram_service.requests.Session')
-def test_send_telegram_message_connection_error(mock_session, mock_config):
+@patch('app.services.telegram_service.get_session')
+def test_send_telegram_message_connection_error(mock_session, mock_config, mock_ip_session, mock_race):
     """Test handling of connection errors"""
     # Setup mocks
     mock_config.return_value = ('test_token', 'test_chat_id', True)
     mock_session.return_value.post.side_effect = requests.exceptions.ConnectionError("Connection failed")
+    mock_ip_session.return_value.post.side_effect = requests.exceptions.ConnectionError("Connection failed")
     
     # Call the function
     result = send_telegram_message("Test message")
@@ -68,9 +74,11 @@ def test_send_telegram_message_invalid_config(mock_config):
     # Verify the result
     assert result is False
 
+@patch('app.services.telegram_ip_service.race_connect', return_value='149.154.167.220')
+@patch('app.services.telegram_ip_service.get_session')
 @patch('app.services.telegram_service.get_telegram_config')
-@patch('app.services.telegram_service.requests.Session')
-def test_send_telegram_message_dns_error_with_retry(mock_session, mock_config):
+@patch('app.services.telegram_service.get_session')
+def test_send_telegram_message_dns_error_with_retry(mock_session, mock_config, mock_ip_session, mock_race):
     """Test handling of DNS errors with retry"""
     # Setup mocks
     mock_config.return_value = ('test_token', 'test_chat_id', True)
@@ -82,6 +90,7 @@ def test_send_telegram_message_dns_error_with_retry(mock_session, mock_config):
         MagicMock(status_code=200)
     ]
     mock_session.return_value.post = mock_post
+    mock_ip_session.return_value.post = mock_post  # both paths share one pooled session
     
     # Call the function
     result = send_telegram_message("Test message")
@@ -148,3 +157,33 @@ def test_send_contact_form_notification(mock_send):
     assert 'Test User' in message
     assert 'test@example.com' in message
     assert 'This is a test message' in message
+
+def test_send_telegram_message_does_not_touch_global_socket_timeout():
+    """Per-request timeouts only; the process-wide socket default stays unset"""
+    with patch('app.services.telegram_service.get_telegram_config', return_value=('t', 'c', True)), \
+         patch('app.services.telegram_service.get_session') as mock_session:
+        mock_session.return_value.post.return_value = MagicMock(status_code=200)
+        send_telegram_message("Test message")
+    assert socket.getdefaulttimeout() is None
+    assert mock_session.return_value.post.call_args.kwargs['timeout'] == (5.0, 15.0)
+
+@patch('app.services.telegram_ip_service.get_session')
+@patch('app.services.telegram_ip_service.race_connect')
+def test_ip_fallback_starts_with_last_working_address(mock_race, mock_ip_session):
+    """The address that delivered last is tried first in the next race"""
+    from app.services import telegram_ip_service
+    mock_race.side_effect = lambda candidates: candidates[-1]
+    mock_ip_session.return_value.post.return_value = MagicMock(status_code=200)
+
+    assert telegram_ip_service.send_via_ip_addresses("Test message", bot_token='t', chat_id='c') is True
+    winner = telegram_ip_service.TELEGRAM_IPS[-1]
+    assert telegram_ip_service._candidates()[0] == winner
+    assert winner in mock_ip_session.return_value.post.call_args[0][0]
+
+def test_split_message_prefers_paragraph_boundaries():
+    """Long messages are split between paragraphs and every part fits the limit"""
+    from app.services.telegram_service import split_message
+    message = "\n\n".join(["intro", "a" * 30, "b" * 30])
+    parts = split_message(message, limit=40)
+    assert parts == ["intro\n\n" + "a" * 30, "b" * 30]
+    assert split_message("short") == ["short"]
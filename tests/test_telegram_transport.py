@@ -0,0 +1,54 @@
+import socket
+from unittest.mock import patch
+
+from app.services import telegram_transport
+from app.services.telegram_transport import DNSCache, TELEGRAM_HOST
+
+
+def _answer(*ips):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (ip, 443)) for ip in ips]
+
+
+def test_dns_cache_reuses_answer_until_ttl():
+    """One lookup per TTL; an expired entry is resolved again"""
+    cache = DNSCache(ttl=60)
+    with patch('socket.getaddrinfo', return_value=_answer('1.1.1.1', '1.1.1.1', '2.2.2.2')) as lookup, \
+         patch('time.monotonic', side_effect=[0, 10, 100, 100]):
+        assert cache.resolve(TELEGRAM_HOST) == ['1.1.1.1', '2.2.2.2']
+        cache.resolve(TELEGRAM_HOST)
+        cache.resolve(TELEGRAM_HOST)
+    assert lookup.call_count == 2
+
+
+def test_dns_cache_serves_stale_answer_when_resolver_fails():
+    """A failing resolver falls back to the last good answer"""
+    cache = DNSCache(ttl=0)
+    with patch('socket.getaddrinfo', return_value=_answer('1.1.1.1')):
+        cache.resolve(TELEGRAM_HOST)
+    with patch('socket.getaddrinfo', side_effect=socket.gaierror('getaddrinfo failed')):
+        assert cache.resolve(TELEGRAM_HOST) == ['1.1.1.1']
+
+
+def test_session_is_shared_and_verifies_telegram_host_on_ip_pools():
+    """Both paths get the same session; direct-IP pools check the Telegram certificate"""
+    session = telegram_transport.get_session()
+    assert telegram_transport.get_session() is session
+    pool = session.get_adapter('https://').poolmanager.connection_from_host('149.154.167.220', 443, 'https')
+    assert pool.conn_kw['server_hostname'] == TELEGRAM_HOST
+    assert pool.assert_hostname == TELEGRAM_HOST
+
+
+def test_race_connect_skips_refused_address_and_parks_winner():
+    """A refused address does not delay the race; the winner's socket is reused"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    port = server.getsockname()[1]
+    try:
+        # 127.0.0.2 reaches loopback but nothing listens there on this port
+        assert telegram_transport.race_connect(['127.0.0.2', '127.0.0.1'], port, timeout=2, stagger=1) == '127.0.0.1'
+        sock = telegram_transport._take_prepared('127.0.0.1', port)
+        assert sock is not None and sock.getpeername() == ('127.0.0.1', port)
+        sock.close()
+    finally:
+        server.close()